@@ -1,9 +1,18 @@
 import streamlit as st
 import pandas as pd
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import glob
 
+from model_registry import CROP_KEYS, history_range, predict_prices
+from crops import FINAL_PREDICT_DIR
+from history_store import prediction_accuracy, query_history, refresh_history, season_overview
+from prediction_store import (LOWER_COL, SUMMARY_DAYS, UPPER_COL, load_summaries, refresh_store, source_files,
+                              upcoming_predictions)
+
+# 各作物未來預測 CSV（src/predict.py 輸出）與彙整的 SQLite 預測庫所在資料夾：app/finalPredict，與執行目錄無關
+PREDICTION_DIR = FINAL_PREDICT_DIR
+
 # 設定頁面配置
 st.set_page_config(
     page_title="蔬菜價格預測系統",
@@ -12,41 +21,30 @@ st.set_page_config(
 )
 
 # 蔬菜資訊配置（可輕鬆添加新蔬菜）
+# 模型檔由 model_registry.model_file_name() 依 CROP_KEYS 決定，預測檔為 crops.py 的 forecast_file
 VEGETABLE_INFO = {
     "cabbage": {
         "name": "甘藍",
-        "model_file": "lgb_model_cabbage.txt",
-        "prediction_file": "finalPredict/甘藍_full_prediction.csv",
         "icon": "🥬"
     },
     "bok_choy": {
         "name": "小白菜",
-        "model_file": "lgb_model_bok_choy.txt",
-        "prediction_file": "finalPredict/小白菜_full_prediction.csv",
         "icon": "🥬"
     },
     "chinese_kale": {
         "name": "芥藍",
-        "model_file": "lgb_model_chinese_kale.txt",
-        "prediction_file": "finalPredict/芥藍_full_prediction.csv",
         "icon": "🥦"
     },
     "celery": {
         "name": "芹菜",
-        "model_file": "lgb_model_celery.txt",
-        "prediction_file": "finalPredict/芹菜_full_prediction.csv",
         "icon": "🌿"
     },
     "chrysanthemum": {
         "name": "茼蒿",
-        "model_file": "lgb_model_chrysanthemum.txt",
-        "prediction_file": "finalPredict/茼蒿_full_prediction.csv",
         "icon": "🌱"
     },
     "spinach": {
         "name": "菠菜",
-        "model_file": "lgb_model_spinach.txt",
-        "prediction_file": "finalPredict/菠菜_full_prediction.csv",
         "icon": "🥬"
     }
 }
@@ -265,77 +263,78 @@ RECIPES = {
 }
 
 
+def prediction_store():
+    """回傳 (預測庫路徑, 版本)；來源 CSV 比預測庫新時才重建，沒有任何預測 CSV 時為 (None, None)"""
+    if not source_files(PREDICTION_DIR):
+        return None, None
+    store = refresh_store(PREDICTION_DIR)
+    return str(store), os.stat(store).st_mtime_ns
+
+
 @st.cache_data
-def load_predictions(vegetable_key):
-    """載入預測資料"""
-    file_path = VEGETABLE_INFO[vegetable_key]["prediction_file"]
-    if os.path.exists(file_path):
-        df = pd.read_csv(file_path, encoding='utf-8')
-        return df
-    return None
-
-
-def get_latest_predictions(vegetable_key, days=5):
-    """獲取最新N天的預測價格"""
-    df = load_predictions(vegetable_key)
-    if df is not None and '預測價格' in df.columns:
-        # 取最後N筆資料
-        latest = df.tail(days)[['日期', '預測價格']].copy()
-        latest['蔬菜'] = VEGETABLE_INFO[vegetable_key]["name"]
-        return latest
-    return None
-
-
-def analyze_price_trend(predictions_df):
-    """分析價格趨勢"""
-    if predictions_df is None or len(predictions_df) == 0:
-        return "無法分析"
-    
-    prices = predictions_df['預測價格'].values
-    
-    # 計算價格變化
-    if len(prices) >= 2:
-        first_price = prices[0]
-        last_price = prices[-1]
-        change_rate = ((last_price - first_price) / first_price) * 100
-        
-        if change_rate > 5:
-            return "上漲"
-        elif change_rate < -5:
-            return "下跌"
-        else:
-            return "平穩"
-    return "平穩"
-
-
-def get_purchase_recommendation(all_predictions):
-    """根據價格預測給出購買建議"""
-    recommendations = []
-    
-    for veg_key, pred_df in all_predictions.items():
-        if pred_df is not None and len(pred_df) > 0:
-            veg_name = VEGETABLE_INFO[veg_key]["name"]
-            trend = analyze_price_trend(pred_df)
-            prices = pred_df['預測價格'].values
-            dates = pred_df['日期'].values
-            
-            # 找到最低價的日期
-            min_price_idx = prices.argmin()
-            min_price_date = dates[min_price_idx]
-            min_price = prices[min_price_idx]
-            
-            rec = {
-                "vegetable": veg_name,
-                "trend": trend,
-                "best_date": min_price_date,
-                "best_price": min_price,
-                "current_price": prices[0] if len(prices) > 0 else 0
-            }
-            recommendations.append(rec)
-    
+def load_predictions(store_path, store_version, days):
+    """所有蔬菜接下來N天的預測價格，回傳 {蔬菜代號: DataFrame 或 None}
+
+    所有 session 共用同一份結果，預測庫更新（store_version 改變）時才重新查詢。
+    """
+    if store_path is None:
+        return {veg_key: None for veg_key in VEGETABLE_INFO}
+    df = upcoming_predictions(store_path, days)
+    by_crop = {crop: group for crop, group in df.groupby("crop")}
+
+    all_predictions = {}
+    for veg_key, veg_info in VEGETABLE_INFO.items():
+        upcoming = by_crop.get(CROP_KEYS[veg_key])
+        if upcoming is None:
+            all_predictions[veg_key] = None
+            continue
+        upcoming = upcoming[["日期", "預測價格", LOWER_COL, UPPER_COL]].reset_index(drop=True)
+        upcoming["蔬菜"] = veg_info["name"]
+        all_predictions[veg_key] = upcoming
+    return all_predictions
+
+
+@st.cache_data
+def load_recommendations(store_path, store_version):
+    """預測庫建置時算好的價格趨勢與最佳購買日，回傳 {蔬菜代號: 購買建議}"""
+    if store_path is None:
+        return {}
+    summaries = load_summaries(store_path).set_index("crop")
+
+    recommendations = {}
+    for veg_key, veg_info in VEGETABLE_INFO.items():
+        crop_key = CROP_KEYS[veg_key]
+        if crop_key not in summaries.index:
+            continue
+        row = summaries.loc[crop_key]
+        recommendations[veg_key] = {
+            "vegetable": veg_info["name"],
+            "trend": row["trend"],
+            "best_date": row["best_date"],
+            "best_price": row["best_price"],
+            "current_price": row["current_price"]
+        }
     return recommendations
 
 
+def history_store():
+    """回傳 (歷史彙整庫路徑, 版本)；預處理行情或 test 預測有變動時才重建"""
+    store = refresh_history()
+    return str(store), os.stat(store).st_mtime_ns
+
+
+@st.cache_data
+def load_history_overview(store_path, store_version, crop_key):
+    """單一作物各產期的日期範圍與筆數"""
+    return season_overview(store_path, crop_key)
+
+
+@st.cache_data(max_entries=256)
+def load_history(store_path, store_version, crop_key, start, end):
+    """日期區間的實際與預測價格（SQLite 端查詢，長區間自動降採樣）與預測準確度"""
+    return query_history(store_path, crop_key, start, end), prediction_accuracy(store_path, crop_key, start, end)
+
+
 def display_recipe(recipe, vegetable_name):
     """顯示食譜"""
     with st.expander(f"📖 {recipe['name']}"):
@@ -352,29 +351,43 @@ def display_recipe(recipe, vegetable_name):
                 st.write(f"{i}. {step}")
 
 
-def main():
-    # 標題
-    st.title("🥬 蔬菜價格預測與購買建議系統")
-    st.markdown("---")
-    
-    # 側邊欄
-    st.sidebar.title("📊 系統資訊")
-    st.sidebar.info(f"目前追蹤 {len(VEGETABLE_INFO)} 種蔬菜")
-    st.sidebar.markdown("---")
-    st.sidebar.subheader("蔬菜列表")
-    for veg_key, veg_info in VEGETABLE_INFO.items():
-        st.sidebar.write(f"{veg_info['icon']} {veg_info['name']}")
-    
-    # 主要內容
-    st.header("📈 未來五天價格預測")
-    
-    # 載入所有蔬菜的預測
-    all_predictions = {}
-    for veg_key in VEGETABLE_INFO.keys():
-        pred = get_latest_predictions(veg_key, days=5)
-        all_predictions[veg_key] = pred
-    
-    # 顯示每種蔬菜的預測
+@st.fragment
+def display_what_if():
+    """自訂日期 / 天氣情境，直接用模型即時預測（調整輸入時只重新執行這一區）"""
+    veg_key = st.selectbox(
+        "選擇蔬菜",
+        list(VEGETABLE_INFO.keys()),
+        format_func=lambda k: f"{VEGETABLE_INFO[k]['icon']} {VEGETABLE_INFO[k]['name']}"
+    )
+    first_date, last_date = history_range(veg_key)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        target = st.date_input(
+            "預測日期",
+            value=last_date + timedelta(days=1),
+            min_value=first_date,
+            max_value=last_date + timedelta(days=30)
+        )
+    with col2:
+        rain = st.number_input("假設前一天降雨量 (mm)，留 0 表示依實際資料", min_value=0.0, value=0.0)
+
+    overrides = {}
+    if rain > 0:
+        overrides[target - timedelta(days=1)] = {"降水量(mm)": rain}
+
+    try:
+        result = predict_prices(veg_key, [target], overrides)
+    except (ValueError, KeyError) as e:
+        st.error(str(e))
+        return
+
+    price = result['預測價格'].iloc[0]
+    st.metric(f"{VEGETABLE_INFO[veg_key]['name']} {result['日期'].iloc[0]} 預測價格", f"{price:.2f} 元/公斤")
+
+
+def display_forecasts(all_predictions, recommendations):
+    """各蔬菜未來幾天的預測表、走勢圖與趨勢"""
     cols = st.columns(len(VEGETABLE_INFO))
     for idx, (veg_key, veg_info) in enumerate(VEGETABLE_INFO.items()):
         with cols[idx]:
@@ -385,14 +398,16 @@ def main():
                 # 顯示預測表格
                 display_df = pred_df[['日期', '預測價格']].copy()
                 display_df['預測價格'] = display_df['預測價格'].round(2)
+                if pred_df[LOWER_COL].notna().all():
+                    display_df['區間'] = [f"{lo:.1f} ~ {hi:.1f}" for lo, hi in zip(pred_df[LOWER_COL], pred_df[UPPER_COL])]
                 display_df = display_df.rename(columns={'預測價格': '價格 (元/公斤)'})
                 st.dataframe(display_df, hide_index=True, width='stretch')
                 
                 # 顯示圖表
                 st.line_chart(pred_df.set_index('日期')['預測價格'])
                 
-                # 顯示趨勢
-                trend = analyze_price_trend(pred_df)
+                # 顯示趨勢（預測庫建置時已算好）
+                trend = recommendations[veg_key]["trend"] if veg_key in recommendations else "無法分析"
                 if trend == "上漲":
                     st.warning(f"📈 趨勢：{trend}")
                 elif trend == "下跌":
@@ -401,52 +416,99 @@ def main():
                     st.info(f"➡️ 趨勢：{trend}")
             else:
                 st.error("無預測資料")
+
+
+def display_recommendations(recommendations):
+    """最佳購買時機與價格提醒"""
+    recommendations = list(recommendations.values())
+    if not recommendations:
+        st.error("無預測資料")
+        return
+
+    # 找出價格上漲和下跌的蔬菜
+    rising = [r for r in recommendations if r['trend'] == "上漲"]
+    falling = [r for r in recommendations if r['trend'] == "下跌"]
+    stable = [r for r in recommendations if r['trend'] == "平穩"]
     
-    st.markdown("---")
+    col1, col2 = st.columns(2)
     
-    # 購買建議
-    st.header("💡 購買建議")
-    recommendations = get_purchase_recommendation(all_predictions)
+    with col1:
+        st.subheader("🎯 最佳購買時機")
+        for rec in recommendations:
+            st.write(f"**{rec['vegetable']}**：建議在 **{rec['best_date']}** 購買")
+            st.write(f"預測最低價：**{rec['best_price']:.2f}** 元/公斤")
+            st.write("---")
     
-    if recommendations:
-        # 找出價格上漲和下跌的蔬菜
-        rising = [r for r in recommendations if r['trend'] == "上漲"]
-        falling = [r for r in recommendations if r['trend'] == "下跌"]
-        stable = [r for r in recommendations if r['trend'] == "平穩"]
+    with col2:
+        st.subheader("🔔 價格提醒")
         
-        col1, col2 = st.columns(2)
+        if rising:
+            st.warning("📈 **價格上漲的蔬菜**")
+            for rec in rising:
+                st.write(f"• {rec['vegetable']}：建議盡早購買或選擇其他蔬菜")
         
-        with col1:
-            st.subheader("🎯 最佳購買時機")
-            for rec in recommendations:
-                st.write(f"**{rec['vegetable']}**：建議在 **{rec['best_date']}** 購買")
-                st.write(f"預測最低價：**{rec['best_price']:.2f}** 元/公斤")
-                st.write("---")
+        if falling:
+            st.success("📉 **價格下跌的蔬菜**")
+            for rec in falling:
+                st.write(f"• {rec['vegetable']}：可等待更優惠的價格")
         
-        with col2:
-            st.subheader("🔔 價格提醒")
-            
-            if rising:
-                st.warning("📈 **價格上漲的蔬菜**")
-                for rec in rising:
-                    st.write(f"• {rec['vegetable']}：建議盡早購買或選擇其他蔬菜")
-            
-            if falling:
-                st.success("📉 **價格下跌的蔬菜**")
-                for rec in falling:
-                    st.write(f"• {rec['vegetable']}：可等待更優惠的價格")
-            
-            if stable:
-                st.info("➡️ **價格平穩的蔬菜**")
-                for rec in stable:
-                    st.write(f"• {rec['vegetable']}：價格穩定，可隨時購買")
-    
-    st.markdown("---")
-    
-    # 食譜區域
-    st.header("🍳 美味食譜推薦")
-    
-    # 為每種蔬菜顯示食譜
+        if stable:
+            st.info("➡️ **價格平穩的蔬菜**")
+            for rec in stable:
+                st.write(f"• {rec['vegetable']}：價格穩定，可隨時購買")
+
+
+@st.fragment
+def display_history():
+    """歷史實際價格 vs. 預測價格，以及各產期的預測準確度（調整條件時只重新執行這一區）"""
+    veg_key = st.selectbox(
+        "選擇蔬菜",
+        list(VEGETABLE_INFO.keys()),
+        format_func=lambda k: f"{VEGETABLE_INFO[k]['icon']} {VEGETABLE_INFO[k]['name']}",
+        key="history_vegetable"
+    )
+    store_path, store_version = history_store()
+    overview = load_history_overview(store_path, store_version, CROP_KEYS[veg_key])
+    if overview.empty:
+        st.error("無歷史資料")
+        return
+
+    first_date = pd.Timestamp(overview['start'].min()).date()
+    last_date = pd.Timestamp(overview['end'].max()).date()
+    latest_season = overview.iloc[-1]
+    selected = st.date_input(
+        "日期區間",
+        value=(pd.Timestamp(latest_season['start']).date(), last_date),
+        min_value=first_date,
+        max_value=last_date,
+        key="history_range"
+    )
+    if len(selected) != 2:
+        st.info("請選擇起訖日期")
+        return
+
+    history, accuracy = load_history(store_path, store_version, CROP_KEYS[veg_key], *selected)
+    if history.empty:
+        st.warning("此區間沒有行情資料")
+        return
+
+    chart = history.set_index('date')[['price', 'predicted']].rename(
+        columns={'price': '實際價格', 'predicted': '預測價格'})
+    st.line_chart(chart)
+    if history['days'].max() > 1:
+        st.caption(f"區間較長，每點為約 {history['days'].max()} 個交易日的平均")
+
+    st.subheader("🎯 預測準確度")
+    if accuracy.empty:
+        st.info("此區間沒有預測資料")
+        return
+    accuracy = accuracy.rename(columns={'season': '產期', 'days': '天數', 'mae': 'MAE', 'rmse': 'RMSE',
+                                        'mape': 'MAPE (%)'})
+    st.dataframe(accuracy.round(2), hide_index=True, width='stretch')
+
+
+def display_recipes():
+    """為每種蔬菜顯示食譜"""
     for veg_key, veg_info in VEGETABLE_INFO.items():
         veg_name = veg_info['name']
         if veg_name in RECIPES:
@@ -461,5 +523,43 @@ def main():
             st.markdown("---")
 
 
+# 頁面區塊：一次只執行、繪製選到的那一個
+SECTIONS = ["📈 未來五天價格預測", "💡 購買建議", "📜 歷史對比", "🔮 自訂日期預測", "🍳 美味食譜推薦"]
+
+
+def main():
+    # 標題
+    st.title("🥬 蔬菜價格預測與購買建議系統")
+    st.markdown("---")
+    
+    # 側邊欄
+    st.sidebar.title("📊 系統資訊")
+    section = st.sidebar.radio("功能", SECTIONS)
+    st.sidebar.markdown("---")
+    st.sidebar.info(f"目前追蹤 {len(VEGETABLE_INFO)} 種蔬菜")
+    st.sidebar.subheader("蔬菜列表")
+    for veg_key, veg_info in VEGETABLE_INFO.items():
+        st.sidebar.write(f"{veg_info['icon']} {veg_info['name']}")
+    
+    st.header(section)
+    if section == "📜 歷史對比":
+        display_history()
+        return
+    if section == "🔮 自訂日期預測":
+        display_what_if()
+        return
+    if section == "🍳 美味食譜推薦":
+        display_recipes()
+        return
+
+    # 預測與購買建議都讀預測庫；趨勢與最佳購買日在預測庫建置時已算好，所有 session 共用快取
+    store_path, store_version = prediction_store()
+    recommendations = load_recommendations(store_path, store_version)
+    if section == "💡 購買建議":
+        display_recommendations(recommendations)
+    else:
+        display_forecasts(load_predictions(store_path, store_version, SUMMARY_DAYS), recommendations)
+
+
 if __name__ == "__main__":
     main()
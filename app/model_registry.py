@@ -0,0 +1,102 @@
+import os
+import sys
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+# ===============================
+# 模型登錄與即時預測
+# 前端蔬菜代號 → 作物設定與 booster 檔；booster 與歷史資料每個行程只載入一次（st.cache_resource），
+# 任意日期的預測價格直接以 src/forecast.py 的遞迴預測計算，不必重新產生 CSV
+# ===============================
+APP_DIR = Path(__file__).resolve().parent
+ROOT_DIR = APP_DIR.parent
+
+# 從 app/ 執行時，src/ 的資料路徑指向專案根目錄的 dataset/
+os.environ.setdefault("DATASET_DIR", str(ROOT_DIR / "dataset"))
+sys.path.insert(0, str(ROOT_DIR / "src"))
+
+from crops import get_crop  # noqa: E402
+from export_model import load_model  # noqa: E402
+from forecast import PRED_COL, RecursiveForecaster, crop_history  # noqa: E402
+from tw_date import parse_tw_dates  # noqa: E402
+
+# 前端蔬菜代號 → crops.py 的作物 key（模型檔為 app/lgb_model_<作物 key>.txt）
+CROP_KEYS = {
+    "cabbage": "cabbage",
+    "bok_choy": "小白菜",
+    "chinese_kale": "Kai-lan",
+    "celery": "芹菜",
+    "chrysanthemum": "茼蒿",
+    "spinach": "菠菜",
+}
+
+def model_file_name(veg_key):
+    return f"lgb_model_{CROP_KEYS[veg_key]}.txt"
+
+def model_path(veg_key):
+    return APP_DIR / model_file_name(veg_key)
+
+# ===============================
+# 每個行程只載入一次
+# ===============================
+@st.cache_resource
+def load_booster(veg_key):
+    """有 export_model.py 匯出的 .npz 時直接載入樹陣列，不必載入 LightGBM、解析文字模型"""
+    return load_model(model_path(veg_key))
+
+@st.cache_resource
+def load_history(veg_key):
+    """最新產期的 (每日行情, 每日氣象)；多個 session 共用，不可修改"""
+    return crop_history(get_crop(CROP_KEYS[veg_key]))
+
+def history_range(veg_key):
+    """可預測的最早日期（行情資料第二天起）與最後一個有行情的日期"""
+    market, _ = load_history(veg_key)
+    dates = market["日期_dt"].sort_values()
+    return dates.iloc[1].date(), dates.iloc[-1].date()
+
+# ===============================
+# 即時預測
+# ===============================
+def _forecast_until(veg_key, target, weather_overrides):
+    """用 target 前一天為止的資料遞迴預測到 target，回傳每天的預測"""
+    market, weather = load_history(veg_key)
+    market = market[market["日期_dt"] < target]
+    weather = weather[weather["日期_dt"] < target].copy()
+    if market.empty:
+        raise ValueError(f"❌ {target.date()} 之前沒有行情資料")
+
+    # 假設情境落在歷史期間的日期 → 直接改掉當天的觀測值
+    for day, values in weather_overrides.items():
+        for col, value in values.items():
+            weather.loc[weather["日期_dt"] == day, col] = value
+
+    forecaster = RecursiveForecaster(load_booster(veg_key), market, weather)
+    # 一步一個交易日（休市的星期跳過），最後一步為 target 當天
+    result = forecaster.forecast(future_weather=weather_overrides, until=target)
+    result["日期_dt"] = parse_tw_dates(result["日期"])
+    return result
+
+def predict_prices(veg_key, dates, weather_overrides=None):
+    """任意日期的預測價格，回傳 [日期, 預測價格]
+
+    歷史期間內的日期以當天之前的實際資料預測；最後一個交易日之後的日期一次遞迴預測到最遠的日期。
+    weather_overrides 為 {日期: {氣象欄位: 值}}，用來試算「如果那天下大雨」之類的情境。
+    """
+    targets = sorted({pd.Timestamp(d).normalize() for d in dates})
+    overrides = {pd.Timestamp(d).normalize(): v for d, v in (weather_overrides or {}).items()}
+    market, _ = load_history(veg_key)
+    last_date = market["日期_dt"].max()
+
+    frames = [_forecast_until(veg_key, t, overrides).tail(1) for t in targets if t <= last_date]
+    future = [t for t in targets if t > last_date]
+    if future:
+        result = _forecast_until(veg_key, future[-1], overrides)
+        hit = result[result["日期_dt"].isin(future)]
+        frames.append(hit)
+        # 落在休市日的日期不在一次遞迴的結果中，各自預測到當天
+        frames += [_forecast_until(veg_key, t, overrides).tail(1) for t in future if t not in set(hit["日期_dt"])]
+
+    return pd.concat(frames, ignore_index=True).sort_values("日期_dt")[["日期", PRED_COL]]
@@ -0,0 +1,299 @@
+import argparse
+import asyncio
+import json
+import os
+from functools import lru_cache
+from urllib.parse import parse_qs
+
+import numpy as np
+import pandas as pd
+
+from crops import CROPS, get_crop
+from export_model import load_model
+from forecast import PRED_COL, RecursiveForecaster, crop_history
+from predict import feature_matrix, feature_table, load_booster, predictable_crops
+from tw_date import parse_tw_dates
+
+# ===============================
+# 本機 HTTP 預測服務（ASGI，不需外部服務）
+#   GET  /crops                               可預測的作物與日期範圍
+#   GET  /predict?crop=Kai-lan&date=2024-12-10 單一日期（西元或民國 113/12/10 皆可）
+#   GET  /predict/range?crop=...&start=...&end=...  {"results": [...], "missing": [沒有資料的日期, ...]}
+#   POST /predict/bulk  [{"crop": ..., "date": ...}, ...]
+# 模型啟動時載入一次；同一作物的並行請求在 BATCH_WINDOW 內合併成一次 Booster.predict
+# ===============================
+BATCH_WINDOW = float(os.environ.get("API_BATCH_WINDOW", "0.002"))  # 秒
+MAX_BATCH = int(os.environ.get("API_MAX_BATCH", "512"))
+MAX_RANGE_DAYS = int(os.environ.get("API_MAX_RANGE_DAYS", "366"))  # /predict/range 單次最多天數
+FORECAST_HORIZON = 30  # 最後一個交易日之後，事先遞迴預測的交易日數
+# 1：改載入 export_model.py 匯出的 .npz（啟動快、不需 LightGBM；大批次 predict 較慢）
+COMPILED_MODELS = os.environ.get("API_COMPILED_MODELS") == "1"
+
+class CropPredictor:
+    """單一作物：booster、依日期索引的特徵矩陣、最後一天之後的遞迴預測"""
+
+    def __init__(self, crop):
+        self.crop = crop
+        self.gbm = load_model(crop.model_file) if COMPILED_MODELS else load_booster(crop.model_file)
+        self.num_iteration = self.gbm.best_iteration if self.gbm.best_iteration > 0 else None
+
+        table = feature_table(crop)
+        self.matrix = feature_matrix(self.gbm, table).to_numpy(dtype="float64", na_value=np.nan)
+        self.row_of = {date: i for i, date in enumerate(table["日期_dt"])}
+        self.first_date, self.last_date = table["日期_dt"].iloc[0], table["日期_dt"].iloc[-1]
+
+        # 未來交易日的預測事先算好，請求時直接查表
+        self.forecast, self.forecast_error = {}, None
+        try:
+            market, weather = crop_history(crop)
+            result = RecursiveForecaster(self.gbm, market, weather).forecast(FORECAST_HORIZON)
+            self.forecast = dict(zip(pd.DatetimeIndex(parse_tw_dates(result["日期"])), result[PRED_COL]))
+        except (FileNotFoundError, KeyError) as e:
+            self.forecast_error = error_message(e)
+            print(f"⚠️ {crop.key} 無法遞迴預測未來日期：{self.forecast_error}")
+
+    def predict_rows(self, rows):
+        return self.gbm.predict(self.matrix[rows], num_iteration=self.num_iteration)
+
+    def info(self):
+        """forecast_until 為 null 時不支援未來日期，原因見 forecast_error"""
+        info = {"crop": self.crop.key, "name": self.crop.name,
+                "first_date": self.first_date.date().isoformat(),
+                "last_date": self.last_date.date().isoformat(),
+                "forecast_until": max(self.forecast).date().isoformat() if self.forecast else None}
+        if self.forecast_error:
+            info["forecast_error"] = self.forecast_error
+        return info
+
+class MicroBatcher:
+    """同一作物的並行請求先排隊，等 BATCH_WINDOW 或湊滿 MAX_BATCH 後一次 predict"""
+
+    def __init__(self, predictor):
+        self.predictor = predictor
+        self.queue = asyncio.Queue()
+        self.worker = None
+
+    async def submit(self, row):
+        if self.worker is None:
+            self.worker = asyncio.create_task(self.run())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((row, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + BATCH_WINDOW
+            while len(batch) < MAX_BATCH:
+                # 已經在排隊的直接取走，不必再等
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            rows = [row for row, _ in batch]
+            try:
+                # predict 放到執行緒，事件迴圈可以繼續收下一批請求
+                prices = await asyncio.to_thread(self.predictor.predict_rows, rows)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), price in zip(batch, prices):
+                if not future.done():
+                    future.set_result(float(price))
+
+# ===============================
+# 預測邏輯
+# ===============================
+class PredictionService:
+    def __init__(self, crop_keys=None):
+        self.crop_keys = crop_keys
+        self.predictors = {}
+        self.batchers = {}
+
+    def load(self):
+        for key in self.crop_keys or predictable_crops():
+            try:
+                self.predictors[key] = CropPredictor(get_crop(key))
+            except (FileNotFoundError, KeyError) as e:
+                print(f"⚠️ {key} 無法載入：{e.args[0]}")
+                continue
+            self.batchers[key] = MicroBatcher(self.predictors[key])
+            print(f"✅ 已載入 {key}")
+
+    def resolve(self, crop_key, date):
+        """回傳 (日期, 特徵列或 None, 事先算好的預測或 None)"""
+        if crop_key not in self.predictors:
+            raise LookupError(f"未知或未載入的作物：{crop_key}（可用：{', '.join(self.predictors)}）")
+        predictor = self.predictors[crop_key]
+        day = parse_date(date)
+        if day in predictor.row_of:
+            return day, predictor.row_of[day], None
+        if day in predictor.forecast:
+            return day, None, predictor.forecast[day]
+        raise LookupError(f"{crop_key} 沒有 {day.date()} 的特徵資料，也不是未來 {FORECAST_HORIZON} 個交易日之一")
+
+    async def predict_one(self, crop_key, date):
+        day, row, price = self.resolve(crop_key, date)
+        source = "forecast"
+        if row is not None:
+            price, source = await self.batchers[crop_key].submit(row), "model"
+        return result_item(crop_key, day, price, source)
+
+    def predict_many(self, requests):
+        """bulk：依作物分組，每個作物一次 predict"""
+        results = [None] * len(requests)
+        rows_by_crop = {}
+        for i, item in enumerate(requests):
+            try:
+                day, row, price = self.resolve(item["crop"], item["date"])
+            except (LookupError, ValueError, KeyError, TypeError) as e:
+                results[i] = {"error": error_message(e), "request": item}
+                continue
+            if row is None:
+                results[i] = result_item(item["crop"], day, price, "forecast")
+            else:
+                rows_by_crop.setdefault(item["crop"], []).append((i, day, row))
+
+        for crop_key, entries in rows_by_crop.items():
+            prices = self.predictors[crop_key].predict_rows([row for _, _, row in entries])
+            for (i, day, _), price in zip(entries, prices):
+                results[i] = result_item(crop_key, day, price, "model")
+        return results
+
+@lru_cache(maxsize=4096)
+def parse_date(text):
+    """'2024-12-10' 或民國 '113/12/10' → Timestamp（同一字串只解析一次）"""
+    text = str(text).strip()
+    try:
+        day = parse_tw_dates([text])[0] if "/" in text else pd.Timestamp(text)
+    except ValueError:
+        day = pd.NaT
+    if pd.isna(day):
+        raise ValueError(f"無法解析日期：{text}")
+    return pd.Timestamp(day).normalize()
+
+def result_item(crop_key, day, price, source):
+    return {"crop": crop_key, "date": day.date().isoformat(),
+            "roc_date": f"{day.year - 1911:03d}/{day:%m/%d}",
+            "price": round(float(price), 4), "source": source}
+
+def error_message(e):
+    return e.args[0] if e.args else str(e)
+
+# ===============================
+# ASGI
+# ===============================
+async def send_json(send, status, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json; charset=utf-8"),
+                            (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+async def predict_range(service, query):
+    """區間內每一天：有資料的放 results，沒有的（休市、超出範圍）列在 missing；整段都沒有時回 404"""
+    start, end = parse_date(query["start"]), parse_date(query["end"])
+    if start > end:
+        raise ValueError(f"start（{start.date()}）不可晚於 end（{end.date()}）")
+    days = pd.date_range(start, end, freq="D")
+    if len(days) > MAX_RANGE_DAYS:
+        raise ValueError(f"日期區間 {len(days)} 天超過上限 {MAX_RANGE_DAYS} 天")
+
+    items = [{"crop": query["crop"], "date": day.date().isoformat()} for day in days]
+    predicted = await asyncio.to_thread(service.predict_many, items)
+    results = [r for r in predicted if "error" not in r]
+    errors = [r for r in predicted if "error" in r]
+    if not results:
+        raise LookupError(errors[0]["error"] if errors else "沒有可預測的日期")
+    return {"crop": query["crop"], "start": start.date().isoformat(), "end": end.date().isoformat(),
+            "results": results, "missing": [r["request"]["date"] for r in errors]}
+
+def create_app(crop_keys=None):
+    service = PredictionService(crop_keys)
+
+    async def lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await asyncio.to_thread(service.load)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def app(scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+
+        path, method = scope["path"].rstrip("/") or "/", scope["method"]
+        query = {k: v[-1] for k, v in parse_qs(scope.get("query_string", b"").decode()).items()}
+        try:
+            if method == "GET" and path == "/health":
+                return await send_json(send, 200, {"status": "ok", "crops": len(service.predictors)})
+
+            if method == "GET" and path == "/crops":
+                return await send_json(send, 200, [p.info() for p in service.predictors.values()])
+
+            if method == "GET" and path == "/predict":
+                return await send_json(send, 200, await service.predict_one(query["crop"], query["date"]))
+
+            if method == "GET" and path == "/predict/range":
+                return await send_json(send, 200, await predict_range(service, query))
+
+            if method == "POST" and path == "/predict/bulk":
+                items = json.loads(await read_body(receive) or b"[]")
+                if not isinstance(items, list):
+                    raise ValueError("請以 JSON 陣列傳入 [{\"crop\": ..., \"date\": ...}, ...]")
+                # 整批 predict 放到執行緒，不卡住其他請求
+                return await send_json(send, 200, await asyncio.to_thread(service.predict_many, items))
+
+            return await send_json(send, 404, {"error": f"找不到路徑：{method} {path}"})
+        except KeyError as e:
+            return await send_json(send, 400, {"error": f"缺少參數：{error_message(e)}"})
+        except LookupError as e:
+            return await send_json(send, 404, {"error": error_message(e)})
+        except ValueError as e:
+            return await send_json(send, 400, {"error": error_message(e)})
+
+    app.service = service
+    return app
+
+app = create_app()
+
+def main():
+    parser = argparse.ArgumentParser(description="本機 HTTP 價格預測服務")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--crop", nargs="*", default=None,
+                        help=f"只載入指定作物，預設為所有有模型的作物（{', '.join(CROPS)}）")
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("❌ 需要 ASGI 伺服器：pip install uvicorn（或以 uvicorn api:app --app-dir src 啟動）")
+
+    uvicorn.run(create_app(args.crop), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
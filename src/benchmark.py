@@ -0,0 +1,201 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import lightgbm as lgb
+import pandas as pd
+
+import pipeline
+import predict
+import preprocessing_market
+import train_model
+from split_raw_market import split_market_seasons
+from split_raw_weather import split_weather_seasons
+from synthetic_data import add_scale_arguments, generate, synthetic_crops
+
+try:
+    import resource
+except ImportError:  # Windows 沒有 resource 模組
+    resource = None
+
+# ===============================
+# 管線效能測試
+# 以 synthetic_data.py 產生的合成原始檔，依序計時各階段（所有合成作物加總）：
+#   split → preprocess → engineer → merge → train → predict
+# preprocess 之後各階段呼叫的是 pipeline.run_* 等管線實際使用的函式；split 讀的是全國行情匯出檔而非
+# 各作物的 .xls，因此不走 pipeline.run_split_*，改以同樣的產品篩選與產期切割函式處理，資料全程在記憶體中
+# 每個階段記錄 wall time、處理列數與每秒列數、行程 RSS 高水位；結果寫成 JSON，可用 --baseline 比較前一次
+# 沒有 resource 模組（Windows）時改記 tracemalloc 的配置高水位（Python 物件與 NumPy 陣列，不含 LightGBM
+# 原生記憶體），且追蹤會拖慢執行，兩種結果不宜互相比較
+# ===============================
+STAGES = ("split", "preprocess", "engineer", "merge", "train", "predict")
+REGRESSION_RATIO = 1.2    # 比 baseline 慢 20% 以上
+REGRESSION_MIN_DELTA = 0.5  # 且多花 0.5 秒以上才標示為退步（次秒級階段的抖動不算）
+
+MEMORY_METRIC = "tracemalloc" if resource is None else "ru_maxrss"
+
+def peak_rss_mb():
+    """行程到目前為止的 RSS 高水位（Linux 為 KB、macOS 為 bytes）；沒有 resource 時為 tracemalloc 高水位"""
+    if resource is None:
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def n_rows(result):
+    """各階段結果（DataFrame、{產期: DataFrame}、巢狀 dict、tuple）的總列數"""
+    if isinstance(result, pd.DataFrame):
+        return len(result)
+    if isinstance(result, dict):
+        return sum(n_rows(v) for v in result.values())
+    if isinstance(result, (list, tuple)):
+        return sum(n_rows(v) for v in result)
+    return 0
+
+# ===============================
+# 各階段（單一作物）
+# ===============================
+def split_crop(crop, market, weather_frames):
+    """全國行情依產品篩選後切產期；各測站依產期切割"""
+    _, product_col, _ = preprocessing_market.resolve_columns(market.columns)
+    crop_market = preprocessing_market.filter_products(market, product_col, crop.market_products)
+    market_seasons = split_market_seasons(crop_market, crop)
+
+    weather_seasons = {}
+    for station_id, df in weather_frames.items():
+        for year, df_season in (split_weather_seasons(df, crop) or {}).items():
+            weather_seasons.setdefault(year, {})[station_id] = df_season
+    return market_seasons, weather_seasons
+
+def run_stages(crops, data):
+    """回傳 {階段: {seconds, rows, rows_per_s, peak_rss_mb, peak_rss_increase_mb}}（所有作物加總）"""
+    stats = {name: {"seconds": 0.0, "rows": 0, "peak_rss_increase_mb": 0.0} for name in STAGES}
+    state = {}
+
+    def timed(name, fn, *args):
+        # 高水位只增不減：increase 為這個階段把高水位推高了多少，看得出哪個階段最吃記憶體
+        rss_before, start = peak_rss_mb(), time.perf_counter()
+        result = fn(*args)
+        stats[name]["seconds"] += time.perf_counter() - start
+        stats[name]["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        stats[name]["peak_rss_increase_mb"] += peak_rss_mb() - rss_before
+        return result
+
+    # 原始檔讀取算在 split
+    start = time.perf_counter()
+    market = pd.read_csv(data["market_file"], encoding="utf-8-sig", dtype={"日　　期": str})
+    market.columns = [str(c).strip() for c in market.columns]
+    weather_frames = {Path(f).name.split("_")[1]: pd.read_csv(f, encoding="utf-8-sig")
+                      for f in data["weather_files"]}
+    stats["split"]["seconds"] += time.perf_counter() - start
+    stats["split"]["rows"] = len(market) + n_rows(weather_frames)
+
+    for crop in crops:
+        market_seasons, weather_seasons = timed("split", split_crop, crop, market, weather_frames)
+
+        stats["preprocess"]["rows"] += n_rows(market_seasons) + n_rows(weather_seasons)
+        daily_market = timed("preprocess", pipeline.run_preprocess_market, crop, market_seasons)
+        daily_weather = timed("preprocess", pipeline.run_preprocess_weather, crop, weather_seasons)
+
+        stats["engineer"]["rows"] += n_rows(daily_market) + n_rows(daily_weather)
+        market_features = timed("engineer", pipeline.run_engineer_market, crop, daily_market)
+        weather_features = timed("engineer", pipeline.run_engineer_weather, crop, daily_weather)
+
+        splits = timed("merge", pipeline.run_merge, crop, market_features, weather_features)
+        stats["merge"]["rows"] += n_rows(splits)
+
+        train_df, valid_df, test_df = splits
+        feature_cols = train_model.get_feature_cols(train_df.columns)
+        stats["train"]["rows"] += len(train_df) + len(valid_df)
+        gbm = timed("train", train_model.train_model, train_df, valid_df, feature_cols)
+
+        stats["predict"]["rows"] += len(test_df)
+        timed("predict", predict.predict_frame, gbm, test_df)
+        state.setdefault("features", len(feature_cols))
+
+    for stage in stats.values():
+        stage["seconds"] = round(stage["seconds"], 4)
+        stage["peak_rss_increase_mb"] = round(stage["peak_rss_increase_mb"], 1)
+        stage["rows_per_s"] = round(stage["rows"] / stage["seconds"]) if stage["seconds"] > 0 else None
+    return stats, state
+
+# ===============================
+# 報表
+# ===============================
+def compare(result, baseline):
+    """與 baseline 比較各階段秒數，回傳 {階段: 比值}"""
+    ratios = {}
+    for name, stage in result["stages"].items():
+        before = baseline.get("stages", {}).get(name, {}).get("seconds")
+        if before:
+            ratios[name] = round(stage["seconds"] / before, 3)
+    return ratios
+
+def regressions(result, baseline, ratios):
+    """比值與多花的秒數都超過門檻的階段"""
+    return [name for name, ratio in ratios.items()
+            if ratio >= REGRESSION_RATIO
+            and result["stages"][name]["seconds"] - baseline["stages"][name]["seconds"] >= REGRESSION_MIN_DELTA]
+
+def print_report(result, ratios=None, regressed=()):
+    print(f"\n{'階段':<12}{'秒數':>10}{'列數':>12}{'列/秒':>12}{'RSS 高水位 MB':>16}{'推高 MB':>10}{'vs baseline':>14}")
+    for name, stage in result["stages"].items():
+        ratio = (ratios or {}).get(name)
+        flag = "" if ratio is None else f"{ratio:.2f}x" + (" ⚠️" if name in regressed else "")
+        throughput = "-" if stage["rows_per_s"] is None else f"{stage['rows_per_s']:,}"
+        print(f"{name:<12}{stage['seconds']:>10.3f}{stage['rows']:>12,}{throughput:>12}"
+              f"{stage.get('peak_rss_mb', 0):>16.1f}{stage['peak_rss_increase_mb']:>10.1f}{flag:>14}")
+    print(f"總計 {result['total_seconds']:.2f}s，RSS 高水位 {result['peak_rss_mb']:.1f} MB"
+          + ("（tracemalloc）" if result["environment"].get("memory_metric") == "tracemalloc" else ""))
+
+def main():
+    parser = argparse.ArgumentParser(description="以合成資料計時管線各階段（split → predict）")
+    add_scale_arguments(parser)
+    parser.add_argument("--output", default=None, help="結果 JSON，預設為 <output-dir>/benchmark.json")
+    parser.add_argument("--baseline", default=None, help="前一次的結果 JSON，列出各階段秒數的比值")
+    args = parser.parse_args()
+    if args.years < 3:
+        raise SystemExit("❌ --years 至少要 3（train / valid / test 各需一個產期）")
+
+    if resource is None:
+        tracemalloc.start()
+    start = time.perf_counter()
+    data = generate(args.output_dir, args.crops, args.markets, args.stations, args.years, args.seed)
+    print(f"📦 合成資料：行情 {data['market_rows']:,} 列、氣象 {data['weather_rows']:,} 列"
+          f"（{data['bytes'] / 1e6:.1f} MB，{time.perf_counter() - start:.1f}s）")
+
+    crops = synthetic_crops(args.crops, args.stations, args.years)
+    start = time.perf_counter()
+    stats, state = run_stages(crops, data)
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "scale": data["scale"],
+        "data": {"market_rows": data["market_rows"], "weather_rows": data["weather_rows"],
+                 "bytes": data["bytes"], "features": state.get("features")},
+        "environment": {"python": platform.python_version(), "pandas": pd.__version__,
+                        "lightgbm": lgb.__version__, "platform": platform.platform(),
+                        "memory_metric": MEMORY_METRIC},
+        "stages": stats,
+        "total_seconds": round(time.perf_counter() - start, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+    ratios, regressed = None, []
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        ratios = compare(result, baseline)
+        regressed = regressions(result, baseline, ratios)
+        result["baseline"] = {"file": args.baseline, "ratios": ratios, "regressions": regressed}
+    print_report(result, ratios, regressed)
+
+    output = Path(args.output or Path(args.output_dir) / "benchmark.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"📝 結果已寫入 {output}")
+
+if __name__ == "__main__":
+    main()
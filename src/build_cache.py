@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+from crops import DATA_DIR
+
+# ===============================
+# 增量建置快取
+# 以「輸入檔內容 hash + 階段參數」判斷輸出是否需要重建，
+# manifest 記錄每個輸出是由哪些輸入、哪組參數產生
+# ===============================
+MANIFEST_FILE = DATA_DIR / ".build_manifest.json"
+
+_digest_memo = {}
+
+def file_digest(path):
+    """檔案內容 sha256（同一行程內以 size + mtime 記住結果，避免重複讀大檔）"""
+    path = Path(path)
+    stat = path.stat()
+    memo_key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _digest_memo:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        _digest_memo[memo_key] = h.hexdigest()
+    return _digest_memo[memo_key]
+
+def params_digest(params):
+    text = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class BuildCache:
+    def __init__(self, manifest_file=MANIFEST_FILE, force=None):
+        self.manifest_file = Path(manifest_file)
+        # FORCE_REBUILD=1 時一律重建（仍會更新 manifest）
+        self.force = os.environ.get("FORCE_REBUILD") == "1" if force is None else force
+        self.entries = self._load()
+
+    def _load(self):
+        if not self.manifest_file.exists():
+            return {}
+        try:
+            return json.loads(self.manifest_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            print(f"  ⚠️ manifest 無法讀取，視為空白：{self.manifest_file}")
+            return {}
+
+    def _save(self):
+        # 先合併磁碟上其他行程寫入的紀錄，再以暫存檔原子替換
+        merged = self._load()
+        merged.update(self.entries)
+        self.entries = merged
+
+        self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.manifest_file.with_name(f"{self.manifest_file.name}.{os.getpid()}.tmp")
+        tmp_file.write_text(json.dumps(merged, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp_file, self.manifest_file)
+
+    def is_fresh(self, task, inputs, params):
+        """輸入內容、參數與上次相同，且上次的輸出都還在且未被改動 → True"""
+        if self.force:
+            return False
+
+        entry = self.entries.get(task)
+        if entry is None or entry.get("params_digest") != params_digest(params):
+            return False
+
+        inputs = [Path(p) for p in inputs]
+        if sorted(entry.get("inputs", {})) != sorted(str(p) for p in inputs):
+            return False
+
+        try:
+            for path, digest in entry["inputs"].items():
+                if file_digest(path) != digest:
+                    return False
+            for path, digest in entry.get("outputs", {}).items():
+                if file_digest(path) != digest:
+                    return False
+        except OSError:
+            return False
+
+        return bool(entry.get("outputs"))
+
+    def record(self, task, inputs, params, outputs):
+        self.entries[task] = {
+            "inputs": {str(Path(p)): file_digest(p) for p in inputs},
+            "params": params,
+            "params_digest": params_digest(params),
+            "outputs": {str(Path(p)): file_digest(p) for p in outputs},
+            "built_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        self._save()
@@ -0,0 +1,185 @@
+import argparse
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# ===============================
+# 作物設定
+# 每個作物的資料夾、產地氣象檔前綴、測站與產期區間
+# ===============================
+# 預設相對於執行目錄；從其他目錄（例如 app/）使用時以 DATASET_DIR 指定
+DATA_DIR = Path(os.environ.get("DATASET_DIR", "dataset"))
+ROOT_DIR = Path(__file__).resolve().parent.parent
+# 前端讀取的未來預測（app/app.py 的 PREDICTION_DIR），與執行目錄無關
+FINAL_PREDICT_DIR = ROOT_DIR / "app" / "finalPredict"
+SEASON_YEARS = (2018, 2019, 2020, 2021, 2022, 2023, 2024)
+
+@dataclass(frozen=True)
+class CropConfig:
+    key: str                      # 資料夾與檔名使用的名稱，例如 Kai-lan
+    name: str = ""                # 中文名稱（finalPredict 檔名與前端顯示），例如 芥藍
+    weather_prefix: str = ""      # 預處理後氣象檔前綴（產地 + 作物），例如 雲林芥藍
+    market_workbooks: str = ""    # raw_data/market/<key>/ 底下的原始行情 .xls（可用萬用字元，例如 *_LA.xls），空字串表示沒有
+    market_products: tuple = ()   # 行情產品代號（例如 LK2 芥藍菜 → "LK2"），讀全國行情匯出檔時用來篩選
+    stations: tuple = ()          # 使用的測站編號，空 tuple 表示資料夾內全部
+    weather_start: str = "09-01"  # 氣象產期起日（提早抓生長期天氣）
+    market_start: str = "11-01"   # 行情產期起日
+    season_end: str = "01-31"     # 產期迄日（隔年）
+    season_years: tuple = SEASON_YEARS
+
+    # -------------------------------
+    # 各階段資料夾
+    # -------------------------------
+    @property
+    def raw_market_dir(self):
+        return DATA_DIR / "raw_data/market" / self.key
+
+    @property
+    def raw_market_files(self):
+        """符合 market_workbooks 的原始行情檔（依檔名排序），沒有時回傳空 list"""
+        if not self.market_workbooks or not self.raw_market_dir.exists():
+            return []
+        return sorted(self.raw_market_dir.glob(self.market_workbooks))
+
+    @property
+    def raw_weather_dir(self):
+        return DATA_DIR / "raw_data/weather" / self.key
+
+    @property
+    def split_market_dir(self):
+        return DATA_DIR / "raw_data/split_market" / self.key
+
+    @property
+    def split_weather_dir(self):
+        return DATA_DIR / "raw_data/split_weather" / self.key
+
+    @property
+    def preprocess_market_dir(self):
+        return DATA_DIR / "processed_data/preprocessing/market" / self.key
+
+    @property
+    def preprocess_weather_dir(self):
+        return DATA_DIR / "processed_data/preprocessing/weather" / self.key
+
+    @property
+    def feature_market_dir(self):
+        return DATA_DIR / "processed_data/feature_engineering/market" / self.key
+
+    @property
+    def feature_weather_dir(self):
+        return DATA_DIR / "processed_data/feature_engineering/weather" / self.key
+
+    @property
+    def merge_dir(self):
+        return DATA_DIR / "processed_data/merge_market_and_weather_after_engineering" / self.key
+
+    @property
+    def selected_features_file(self):
+        # select_features.py 篩選後的特徵清單，訓練（train / tune / global）只使用這些欄位
+        return self.merge_dir / f"selected_features_{self.key}.json"
+
+    def selected_split_file(self, split):
+        # 篩選後的 train / valid / test（日期、目標與保留的特徵），供檢視或外部分析使用
+        return self.merge_dir / f"{split}_{self.key}_selected_features.csv"
+
+    @property
+    def model_file(self):
+        return DATA_DIR / "model" / self.key / f"lgb_model_{self.key}.txt"
+
+    @property
+    def tuned_params_file(self):
+        # tune_model.py 找到的最佳參數，train_model.py 訓練時會套用
+        return DATA_DIR / "model" / self.key / f"best_params_{self.key}.json"
+
+    @property
+    def prediction_file(self):
+        return DATA_DIR / "predict" / self.key / "test_with_prediction.csv"
+
+    @property
+    def forecast_file(self):
+        return FINAL_PREDICT_DIR / f"{self.name or self.key}_full_prediction.csv"
+
+    @property
+    def manifest_file(self):
+        # 每個作物各自一份 manifest，平行執行時不會互相覆寫
+        return DATA_DIR / ".build_manifest" / f"{self.key}.json"
+
+    # -------------------------------
+    # 產期
+    # -------------------------------
+    def season_bounds(self, year, start):
+        """start 為 "MM-DD"，回傳 (起日, 隔年迄日)"""
+        return pd.Timestamp(f"{year}-{start}"), pd.Timestamp(f"{year + 1}-{self.season_end}")
+
+    def season_keys(self, dates, start):
+        """每一列所屬的產期開始年（整欄一次計算），不在任何產期內的列為 -1
+
+        產期跨年：start 當天起算到隔年 season_end，所以月日 >= start 屬於當年產期、
+        月日 <= season_end 屬於前一年產期。
+        """
+        dates = pd.DatetimeIndex(dates)
+        month_day = np.asarray(dates.month * 100 + dates.day, dtype="float64")
+        years = np.asarray(dates.year, dtype="float64")
+
+        start_md = int(start.replace("-", ""))
+        end_md = int(self.season_end.replace("-", ""))
+        keys = np.where(month_day >= start_md, years, np.where(month_day <= end_md, years - 1, -1))
+        return np.where(np.isin(keys, self.season_years), keys, -1).astype("int64")
+
+    def roc_period(self, year, start):
+        """民國年區間字串，例如 1071101-1080131"""
+        start_dt, end_dt = self.season_bounds(year, start)
+        return f"{start_dt.year - 1911:03d}{start_dt:%m%d}-{end_dt.year - 1911:03d}{end_dt:%m%d}"
+
+CROPS = {crop.key: crop for crop in [
+    CropConfig("Kai-lan", "芥藍", "雲林芥藍", market_workbooks="蔬菜產品日交易行情-芥藍.xls", market_products=("LK2",)),
+    CropConfig("cabbage", "甘藍", "宜蘭甘藍", market_workbooks="*_LA.xls", market_products=("LA1",),
+               weather_start="08-01"),
+    CropConfig("ponkan", "椪柑", "嘉義椪柑", market_workbooks="market_ponkan_*.xls", market_products=("C1",)),
+    CropConfig("strawberry", "草莓", "苗栗草莓", market_workbooks="水果產品日交易行情-草莓.xls", market_products=("45",)),
+    CropConfig("小白菜", "小白菜", "雲林小白菜", market_products=("LB1", "LB11", "LB12"), weather_start="08-01"),
+    CropConfig("芹菜", "芹菜", "雲林芹菜", market_products=("LG2",), weather_start="08-01"),
+    CropConfig("茼蒿", "茼蒿", "雲林茼蒿", market_workbooks="蔬菜產品日交易行情-茼蒿.xls", market_products=("LL1",),
+               weather_start="08-01"),
+    CropConfig("菠菜", "菠菜", "雲林菠菜", market_products=("LH1", "LH2"), weather_start="08-01"),
+    CropConfig("broccoli", "青花菜"),  # 目前只有合併後資料與模型
+]}
+
+DEFAULT_CROP = CROPS["Kai-lan"]
+
+def get_crop(key):
+    if key not in CROPS:
+        raise KeyError(f"❌ 未知的作物：{key}（可用：{', '.join(CROPS)}）")
+    return CROPS[key]
+
+# ===============================
+# 檔名 → 產期開始年
+# ===============================
+_ROC_PERIOD = re.compile(r"(\d{3})\d{4}-\d{7}")
+_ISO_PERIOD = re.compile(r"(\d{4})-\d{2}-\d{2}_\d{4}-\d{2}-\d{2}")
+
+def season_year(file_name):
+    """market_Kai-lan_1071101-1080131.csv / daily_C0K420_2018-09-01_2019-01-31.csv → 2018"""
+    match = _ROC_PERIOD.search(file_name)
+    if match:
+        return int(match.group(1)) + 1911
+    match = _ISO_PERIOD.search(file_name)
+    if match:
+        return int(match.group(1))
+    return None
+
+# ===============================
+# 單一腳本的 --crop 參數
+# ===============================
+def add_crop_argument(parser):
+    parser.add_argument("--crop", default=DEFAULT_CROP.key, choices=list(CROPS),
+                        help=f"要處理的作物，預設 {DEFAULT_CROP.key}")
+    return parser
+
+def crop_from_args(description=None):
+    parser = add_crop_argument(argparse.ArgumentParser(description=description))
+    return get_crop(parser.parse_args().crop)
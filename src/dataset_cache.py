@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+
+import lightgbm as lgb
+
+from build_cache import file_digest, params_digest
+from crops import DATA_DIR
+
+# ===============================
+# 分箱後的 LightGBM Dataset 快取
+# lgb.Dataset 建構（分箱）後以 save_binary 存檔；合併資料、特徵清單與分箱參數都沒變時直接載入，
+# 不必再讀 CSV、重新分箱。驗證集以 reference=訓練集 建構，沿用同一組分箱邊界
+# 快取 key = 來源檔 sha256 + 特徵清單 + 目標欄 + 分箱參數（+ 呼叫端自訂的部分，例如 CV 切折方式）
+# ===============================
+CACHE_DIR = DATA_DIR / ".cache" / "lgb_datasets"
+
+# 分箱參數固定，不同訓練參數（含 tune_model.py 的試驗）才能共用同一份 Dataset；
+# feature_pre_filter 關閉，min_data_in_leaf 才能和建構時不同
+DATASET_PARAMS = {"max_bin": 255, "feature_pre_filter": False, "verbose": -1}
+
+def dataset_key(sources, feature_cols, label, **extra):
+    return params_digest({
+        "sources": [file_digest(f) for f in sources],
+        "features": list(feature_cols),
+        "label": label,
+        "params": DATASET_PARAMS,
+        "lightgbm": lgb.__version__,
+        **extra,
+    })
+
+def build_pair(train_df, valid_df, feature_cols, label):
+    """DataFrame → 建構好的 (訓練, 驗證) Dataset"""
+    lgb_train = lgb.Dataset(train_df[feature_cols], train_df[label],
+                            params=DATASET_PARAMS, free_raw_data=False).construct()
+    lgb_valid = lgb.Dataset(valid_df[feature_cols], valid_df[label],
+                            reference=lgb_train, params=DATASET_PARAMS, free_raw_data=False).construct()
+    return lgb_train, lgb_valid
+
+def _categorical_info(lgb_train):
+    """.bin 不含的類別欄資訊：pandas 類別清單與類別欄位置"""
+    return {"pandas_categorical": lgb_train.pandas_categorical,
+            "categorical_feature": lgb_train.params.get("categorical_column", [])}
+
+def _load_pair(cache_dir, name, categorical):
+    categorical_feature = categorical["categorical_feature"] or "auto"
+    lgb_train = lgb.Dataset(str(cache_dir / f"{name}_train.bin"), params=DATASET_PARAMS,
+                            categorical_feature=categorical_feature).construct()
+    lgb_valid = lgb.Dataset(str(cache_dir / f"{name}_valid.bin"), reference=lgb_train,
+                            params=DATASET_PARAMS, categorical_feature=categorical_feature).construct()
+    # 補回 pandas 類別清單，存出的模型才會記錄 pandas_categorical（與沒有快取時相同）
+    lgb_train.pandas_categorical = lgb_valid.pandas_categorical = categorical["pandas_categorical"]
+    return lgb_train, lgb_valid
+
+def _read_index(cache_dir):
+    """{名稱: 類別欄資訊}（依建構順序）；舊格式（只有名稱清單）視為沒有快取"""
+    try:
+        index = json.loads((cache_dir / "index.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return index if isinstance(index, dict) else None
+
+def cached_pairs(key, make_frames, feature_cols, label):
+    """回傳 [(名稱, 訓練 Dataset, 驗證 Dataset), ...]
+
+    make_frames() 只在沒有快取時呼叫，回傳 [(名稱, 訓練 df, 驗證 df), ...]。
+    """
+    cache_dir = CACHE_DIR / key
+    index = _read_index(cache_dir)
+    if index is not None:
+        try:
+            return [(name, *_load_pair(cache_dir, name, categorical)) for name, categorical in index.items()]
+        except lgb.basic.LightGBMError:
+            print(f"  ⚠️ Dataset 快取無法讀取，重新建構：{cache_dir}")
+    # 已存在卻讀不到（舊格式或損毀）的快取，換上新的之前要先移開；記下 inode 才認得出是不是同一份
+    broken = cache_dir.stat().st_ino if cache_dir.exists() else None
+
+    pairs = [(name, *build_pair(train_df, valid_df, feature_cols, label))
+             for name, train_df, valid_df in make_frames()]
+
+    # 先寫到暫存資料夾再整個換上，平行執行的其他行程不會讀到寫一半的快取
+    tmp_dir = cache_dir.with_name(f"{key}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    for name, lgb_train, lgb_valid in pairs:
+        lgb_train.save_binary(str(tmp_dir / f"{name}_train.bin"))
+        lgb_valid.save_binary(str(tmp_dir / f"{name}_valid.bin"))
+    index = {name: _categorical_info(lgb_train) for name, lgb_train, _ in pairs}
+    (tmp_dir / "index.json").write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+
+    _publish(tmp_dir, cache_dir, broken)
+    return pairs
+
+def _publish(tmp_dir, cache_dir, broken):
+    """暫存資料夾換成正式快取；已發布的快取不刪除（其他行程可能正在讀），同 key 內容相同，保留先寫好的那份"""
+    if broken is not None:
+        # 只移開當初讀不到的那份（其他行程已換上新的就不動），先改名再刪，刪除期間不會有行程讀到殘缺的資料夾
+        stale_dir = cache_dir.with_name(f"{cache_dir.name}.{os.getpid()}.stale")
+        try:
+            if cache_dir.stat().st_ino == broken:
+                os.replace(cache_dir, stale_dir)
+                shutil.rmtree(stale_dir, ignore_errors=True)
+        except OSError:
+            pass
+    try:
+        os.replace(tmp_dir, cache_dir)
+    except OSError:
+        # 其他行程剛好先寫好同一份快取（目標資料夾非空時 os.replace 失敗），丟掉自己的暫存
+        shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -1,13 +1,16 @@
 import pandas as pd
-from pathlib import Path
+
+import feature_spec
+from build_cache import BuildCache, file_digest
+from crops import DEFAULT_CROP, crop_from_args
+from feature_spec import build_features, lag_spec, rolling_spec
+from storage import STORAGE_FORMAT, read_table, table_glob, table_path, write_table
+from tw_date import parse_tw_dates, format_tw_dates
 
 # ===============================
 # 設定
 # ===============================
-MARKET_DIR = Path("dataset/processed_data/preprocessing/market/Kai-lan")
-OUTPUT_DIR = Path("dataset/processed_data/feature_engineering/market/Kai-lan")
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
+# 輸入 crop.preprocess_market_dir → 輸出 crop.feature_market_dir（見 crops.py）
 LAG_DAYS = [1, 7, 14]
 MA_DAYS = [3, 7]
 
@@ -19,49 +22,44 @@ MARKET_STRUCT_COLS = [
     "上價", "中價", "下價", "價格區間", "交易量(公斤)"
 ]
 
+def cache_params(crop):
+    return {
+        "LAG_DAYS": LAG_DAYS,
+        "MA_DAYS": MA_DAYS,
+        "TARGET_COL": TARGET_COL,
+        "MARKET_STRUCT_COLS": MARKET_STRUCT_COLS,
+        "STORAGE_FORMAT": STORAGE_FORMAT,
+        "feature_engine": file_digest(feature_spec.__file__),
+    }
+
 # ===============================
-# 民國 → 西元
+# 特徵規格
 # ===============================
-def roc_to_ad(d):
-    try:
-        y, m, d = d.split("/")
-        return pd.Timestamp(int(y) + 1911, int(m), int(d))
-    except:
-        return pd.NaT
+def market_feature_specs(columns):
+    """市場結構欄位做 lag / ma，目標價格只做 lag（納入前幾天的價格特徵）"""
+    specs = []
+    for col in MARKET_STRUCT_COLS:
+        if col not in columns:
+            continue
+        specs += [lag_spec(f"{col}_lag{lag}", col, lag) for lag in LAG_DAYS]
+        specs += [rolling_spec(f"{col}_ma{window}", col, "mean", window) for window in MA_DAYS]
 
-def ad_to_roc(d):
-    return f"{d.year-1911:03d}/{d.month:02d}/{d.day:02d}"
+    specs += [lag_spec(f"{TARGET_COL}_lag{lag}", TARGET_COL, lag) for lag in LAG_DAYS]
+    return specs
 
 # ===============================
-# 逐檔處理
+# 特徵工程
 # ===============================
-market_files = sorted(MARKET_DIR.glob("daily_market_Kai-lan_*.csv"))
-
-for file_path in market_files:
-    df = pd.read_csv(file_path, encoding="utf-8-sig")
+def build_market_features(df):
+    """單一產期每日行情 → 市場特徵（lag / ma）"""
+    df = df.copy()
 
     # 日期排序
-    df["日期_dt"] = df["日期"].apply(roc_to_ad)
+    df["日期_dt"] = parse_tw_dates(df["日期"])
     df = df.sort_values("日期_dt").reset_index(drop=True)
 
-    # -------------------------------
-    # 對「市場結構欄位」做 lag / ma
-    # -------------------------------
-    for col in MARKET_STRUCT_COLS:
-        if col not in df.columns:
-            continue
-
-        for lag in LAG_DAYS:
-            df[f"{col}_lag{lag}"] = df[col].shift(lag)
-
-        for window in MA_DAYS:
-            df[f"{col}_ma{window}"] = df[col].shift(1).rolling(window).mean()
-
-    # -------------------------------
-    # 對目標價格做 lag（納入前幾天的價格特徵）
-    # -------------------------------
-    for lag in LAG_DAYS:
-        df[f"{TARGET_COL}_lag{lag}"] = df[TARGET_COL].shift(lag)
+    # 所有 lag / ma 一次算完
+    features = build_features(df, market_feature_specs(df.columns))
 
     # -------------------------------
     # ❌ 移除「當天市場結果特徵」
@@ -72,10 +70,33 @@ for file_path in market_files:
     # -------------------------------
     # 日期轉回民國（供 merge）
     # -------------------------------
-    df["日期"] = df["日期_dt"].apply(ad_to_roc)
-    df = df.drop(columns=["日期_dt"])
+    df["日期"] = format_tw_dates(df["日期_dt"])
+    return pd.concat([df.drop(columns=["日期_dt"]), features], axis=1)
+
+# ===============================
+# 逐檔處理
+# ===============================
+def main(crop=DEFAULT_CROP):
+    crop.feature_market_dir.mkdir(parents=True, exist_ok=True)
+    market_files = table_glob(crop.preprocess_market_dir, f"daily_market_{crop.key}_*")
+
+    cache = BuildCache(crop.manifest_file)
+    for file_path in market_files:
+        output_file = table_path(crop.feature_market_dir / f"features_{file_path.name}")
+
+        task = f"engineering_market:{file_path}"
+        cache_inputs = [file_path, __file__]
+        if cache.is_fresh(task, cache_inputs, cache_params(crop)):
+            print(f"⏭️ 未變更，跳過: {output_file.name}")
+            continue
+
+        df = read_table(file_path)
+        df = build_market_features(df)
+
+        write_table(df, output_file)
+        cache.record(task, cache_inputs, cache_params(crop), [output_file])
 
-    output_file = OUTPUT_DIR / f"features_{file_path.name}"
-    df.to_csv(output_file, index=False, encoding="utf-8-sig")
+        print(f"✅ 完成市場特徵工程: {output_file.name}")
 
-    print(f"✅ 完成市場特徵工程: {output_file.name}")
+if __name__ == "__main__":
+    main(crop_from_args("市場特徵工程"))
@@ -1,13 +1,17 @@
 import pandas as pd
-from pathlib import Path
 import numpy as np
 
+import feature_spec
+from build_cache import BuildCache, file_digest
+from crops import DEFAULT_CROP, crop_from_args
+from feature_spec import build_features, lag_spec, rolling_spec
+from storage import STORAGE_FORMAT, read_table, table_glob, table_path, write_table
+from tw_date import parse_tw_dates, format_tw_dates
+
 # ===============================
 # 設定路徑
 # ===============================
-INPUT_DIR = Path("dataset/processed_data/preprocessing/weather/Kai-lan")
-OUTPUT_DIR = Path("dataset/processed_data/feature_engineering/weather/Kai-lan")
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+# 輸入 crop.preprocess_weather_dir → 輸出 crop.feature_weather_dir（見 crops.py）
 
 # ===============================
 # 欄位設定
@@ -21,6 +25,10 @@ NUMERIC_COLS = [
 LAG_DAYS = [1]
 ROLL_DAYS = [3, 7, 15, 30]
 
+ROLLMEAN_COLS = ["氣溫(℃)", "最高氣溫(℃)", "最低氣溫(℃)",
+                 "日照時數(hour)", "相對溼度(%)", "最大陣風(m/s)"]
+ROLLSUM_COLS = ["降水量(mm)", "降水時數(hour)"]
+
 # 極端事件閾值
 EXTREME_TEMP_THRESH = 10   # 寒流
 STRONG_COLD_THRESH = 7     # 強寒流
@@ -28,32 +36,73 @@ FROST_THRESH = 5           # 結霜
 STRONG_WIND_THRESH = 15    # 強風
 HEAVY_RAIN_THRESH = 50     # 強降雨
 
+def cache_params(crop):
+    return {
+        "NUMERIC_COLS": NUMERIC_COLS,
+        "LAG_DAYS": LAG_DAYS,
+        "ROLL_DAYS": ROLL_DAYS,
+        "ROLLMEAN_COLS": ROLLMEAN_COLS,
+        "ROLLSUM_COLS": ROLLSUM_COLS,
+        "EXTREME_TEMP_THRESH": EXTREME_TEMP_THRESH,
+        "STRONG_COLD_THRESH": STRONG_COLD_THRESH,
+        "FROST_THRESH": FROST_THRESH,
+        "STRONG_WIND_THRESH": STRONG_WIND_THRESH,
+        "HEAVY_RAIN_THRESH": HEAVY_RAIN_THRESH,
+        "STORAGE_FORMAT": STORAGE_FORMAT,
+        "feature_engine": file_digest(feature_spec.__file__),
+    }
+
 # ===============================
-# 民國 ↔ 西元
+# 特徵規格：前一天 lag、前 N 天滾動平均 / 最大 / 最小 / 加總
 # ===============================
-def roc_to_ad(d):
-    if isinstance(d, str):
-        parts = d.split("/")
-        if len(parts) == 3:
-            y, m, day = int(parts[0])+1911, int(parts[1]), int(parts[2])
-            return pd.Timestamp(f"{y}-{m:02d}-{day:02d}")
-    return pd.NaT
+def weather_feature_specs():
+    specs = [lag_spec(f"{col}_lag{lag}d", col, lag) for lag in LAG_DAYS for col in NUMERIC_COLS]
+
+    for col in ROLLMEAN_COLS:
+        for r in ROLL_DAYS:
+            specs += [rolling_spec(f"{col}_roll{op}_{r}d_prev", col, op, r) for op in ("mean", "max", "min")]
+
+    for col in ROLLSUM_COLS:
+        for r in ROLL_DAYS:
+            specs.append(rolling_spec(f"{col}_rollsum_{r}d_prev", col, "sum", r))
+    return specs
 
-def ad_to_roc(d):
-    return f"{d.year-1911:03d}/{d.month:02d}/{d.day:02d}"
+WEATHER_SPECS = tuple(weather_feature_specs())
 
 # ===============================
-# 處理 CSV
+# 單日特徵（整欄 Series 或單一數值皆可，forecast.py 逐日預測時共用）
 # ===============================
-weather_files = sorted(INPUT_DIR.glob("雲林芥藍_avg_*.csv"))
+def event_features(prev):
+    """前一天氣象 {欄位: 值} → 極端事件 / 二元特徵"""
+    return {
+        "daily_temp_range_prev": prev["最高氣溫(℃)"] - prev["最低氣溫(℃)"],
+        "is_cold_wave_prev": (prev["最低氣溫(℃)"] <= EXTREME_TEMP_THRESH).astype(int),
+        "is_strong_cold_prev": (prev["最低氣溫(℃)"] <= STRONG_COLD_THRESH).astype(int),
+        "is_frost_risk_prev": ((prev["最低氣溫(℃)"] <= FROST_THRESH) &
+                               (prev["日照時數(hour)"] < 1)).astype(int),
+        "is_strong_wind_prev": (prev["最大陣風(m/s)"] >= STRONG_WIND_THRESH).astype(int),
+        "is_heavy_rain_prev": (prev["降水量(mm)"] >= HEAVY_RAIN_THRESH).astype(int),
+        "rainy_day_prev": (prev["降水量(mm)"] > 0).astype(int)
+    }
+
+def month_features(month):
+    return {
+        "month": month,
+        "month_sin": np.sin(2 * np.pi * month / 12),
+        "month_cos": np.cos(2 * np.pi * month / 12),
+        "is_winter": np.isin(month, [11, 12, 1, 2]).astype(int)
+    }
 
-for wf in weather_files:
-    print(f"🔄 處理檔案: {wf.name}")
-    df = pd.read_csv(wf, encoding="utf-8-sig")
+# ===============================
+# 特徵工程
+# ===============================
+def build_weather_features(df):
+    """單一產期每日氣象 → 氣象特徵（前一天 lag / 滾動 / 極端事件 / 季節）"""
     if "日期" not in df.columns:
-        raise KeyError(f"{wf.name} 找不到日期欄位")
+        raise KeyError("找不到日期欄位")
 
-    df["日期_dt"] = df["日期"].apply(roc_to_ad)
+    df = df.copy()
+    df["日期_dt"] = parse_tw_dates(df["日期"])
     df = df.sort_values("日期_dt").reset_index(drop=True)
 
     # 確保數值欄位存在
@@ -64,54 +113,16 @@ for wf in weather_files:
 
     df = df[["日期_dt"] + NUMERIC_COLS]
 
-    feat_list = []
-
     # ===============================
-    # 前 1/2/3 天氣象特徵
+    # 前 1 天氣象特徵、滾動平均 / 最大 / 最小 / 加總（一次算完）
     # ===============================
-    for lag in LAG_DAYS:
-        lag_df = df[NUMERIC_COLS].shift(lag)
-        lag_df.columns = [f"{col}_lag{lag}d" for col in NUMERIC_COLS]
-        feat_list.append(lag_df)
+    feat_list = [build_features(df, WEATHER_SPECS)]
 
     # ===============================
-    # 滾動平均 / 最大 / 最小特徵
+    # 極端事件 / 二元特徵、連續降雨天數
     # ===============================
-    ROLLMEAN_COLS = ["氣溫(℃)", "最高氣溫(℃)", "最低氣溫(℃)",
-                     "日照時數(hour)", "相對溼度(%)", "最大陣風(m/s)"]
-    ROLLSUM_COLS = ["降水量(mm)", "降水時數(hour)"]
+    feat_list.append(pd.DataFrame(event_features(df[NUMERIC_COLS].shift(1))))
 
-    for col in ROLLMEAN_COLS:
-        for r in ROLL_DAYS:
-            roll = df[col].shift(1).rolling(r)
-            feat_list.append(pd.DataFrame({
-                f"{col}_rollmean_{r}d_prev": roll.mean(),
-                f"{col}_rollmax_{r}d_prev": roll.max(),
-                f"{col}_rollmin_{r}d_prev": roll.min()
-            }))
-
-    for col in ROLLSUM_COLS:
-        for r in ROLL_DAYS:
-            roll = df[col].shift(1).rolling(r)
-            feat_list.append(pd.DataFrame({
-                f"{col}_rollsum_{r}d_prev": roll.sum()
-            }))
-
-    # ===============================
-    # 極端事件 / 二元特徵
-    # ===============================
-    feat_list.append(pd.DataFrame({
-        "daily_temp_range_prev": (df["最高氣溫(℃)"] - df["最低氣溫(℃)"]).shift(1),
-        "is_cold_wave_prev": (df["最低氣溫(℃)"].shift(1) <= EXTREME_TEMP_THRESH).astype(int),
-        "is_strong_cold_prev": (df["最低氣溫(℃)"].shift(1) <= STRONG_COLD_THRESH).astype(int),
-        "is_frost_risk_prev": ((df["最低氣溫(℃)"].shift(1) <= FROST_THRESH) &
-                               (df["日照時數(hour)"].shift(1) < 1)).astype(int),
-        "is_strong_wind_prev": (df["最大陣風(m/s)"].shift(1) >= STRONG_WIND_THRESH).astype(int),
-        "is_heavy_rain_prev": (df["降水量(mm)"].shift(1) >= HEAVY_RAIN_THRESH).astype(int),
-        "rainy_day_prev": (df["降水量(mm)"].shift(1) > 0).astype(int)
-    }))
-
-    # 連續降雨天數
     rainy_day_prev = (df["降水量(mm)"].shift(1) > 0).astype(int)
     consec_rainy = rainy_day_prev.groupby((rainy_day_prev != rainy_day_prev.shift()).cumsum()).cumsum().fillna(0)
     feat_list.append(pd.DataFrame({"consec_rainy_days_prev": consec_rainy}))
@@ -119,29 +130,50 @@ for wf in weather_files:
     # ===============================
     # 月份 / 週期 / 季節
     # ===============================
-    month = df["日期_dt"].dt.month
-    feat_list.append(pd.DataFrame({
-        "month": month,
-        "month_sin": np.sin(2 * np.pi * month / 12),
-        "month_cos": np.cos(2 * np.pi * month / 12),
-        "is_winter": month.isin([11,12,1,2]).astype(int)
-    }))
+    feat_list.append(pd.DataFrame(month_features(df["日期_dt"].dt.month), index=df.index))
 
     # ===============================
     # 合併所有欄位
     # ===============================
     feat_df = pd.concat([df["日期_dt"]] + feat_list, axis=1)
-    feat_df["日期"] = feat_df["日期_dt"].apply(ad_to_roc)
+    feat_df["日期"] = format_tw_dates(feat_df["日期_dt"])
     feat_df = feat_df.drop(columns=["日期_dt"])
 
     # 將日期放最前面
     cols = feat_df.columns.tolist()
     cols.remove("日期")
-    feat_df = feat_df[["日期"] + cols]
+    return feat_df[["日期"] + cols]
 
-    # ===============================
-    # 輸出 CSV
-    # ===============================
-    output_file = OUTPUT_DIR / f"weather_feat_{wf.stem}.csv"
-    feat_df.to_csv(output_file, index=False, encoding="utf-8-sig")
-    print(f"✅ 輸出完成: {output_file.name}")
+# ===============================
+# 處理 CSV
+# ===============================
+def main(crop=DEFAULT_CROP):
+    crop.feature_weather_dir.mkdir(parents=True, exist_ok=True)
+    weather_files = table_glob(crop.preprocess_weather_dir, f"{crop.weather_prefix}_avg_*")
+
+    cache = BuildCache(crop.manifest_file)
+    for wf in weather_files:
+        output_file = table_path(crop.feature_weather_dir / f"weather_feat_{wf.name}")
+
+        task = f"engineering_weather:{wf}"
+        cache_inputs = [wf, __file__]
+        if cache.is_fresh(task, cache_inputs, cache_params(crop)):
+            print(f"⏭️ 未變更，跳過: {output_file.name}")
+            continue
+
+        print(f"🔄 處理檔案: {wf.name}")
+        df = read_table(wf)
+        if "日期" not in df.columns:
+            raise KeyError(f"{wf.name} 找不到日期欄位")
+
+        feat_df = build_weather_features(df)
+
+        # ===============================
+        # 輸出 CSV
+        # ===============================
+        write_table(feat_df, output_file)
+        cache.record(task, cache_inputs, cache_params(crop), [output_file])
+        print(f"✅ 輸出完成: {output_file.name}")
+
+if __name__ == "__main__":
+    main(crop_from_args("氣象特徵工程"))
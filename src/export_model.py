@@ -0,0 +1,261 @@
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from build_cache import file_digest
+from crops import CROPS, get_crop
+from prediction_store import file_signature
+
+# ===============================
+# 模型匯出：LightGBM 文字檔 → 壓縮的 NumPy 樹陣列 (.npz)
+# 所有樹的節點攤平成同一組陣列（分裂特徵、門檻、左右子節點、葉值），
+# 載入只需 np.load，不必載入 LightGBM、解析數 MB 的文字；CompiledModel 以 NumPy 一次走完所有樹，
+# 介面與 lgb.Booster 相同（predict / feature_name / best_iteration），可直接替換
+# 適合冷啟動與小批次；大批次預測仍是 LightGBM 較快
+# ===============================
+FORMAT_VERSION = 1
+ZERO_THRESHOLD = 1e-35  # LightGBM kZeroThreshold
+MISSING_TYPES = {"None": 0, "Zero": 1, "NaN": 2}
+IDENTITY_OBJECTIVES = ("regression", "regression_l1", "huber", "fair", "quantile", "mape")
+
+def export_file(model_file):
+    return Path(model_file).with_suffix(".npz")
+
+# ===============================
+# 匯出
+# ===============================
+def _cat_bitset(threshold):
+    """LightGBM 類別分裂門檻 "1||3||7" → uint32 bitset"""
+    cats = [int(c) for c in str(threshold).split("||")]
+    words = np.zeros(max(cats) // 32 + 1, dtype="uint32")
+    for c in cats:
+        words[c // 32] |= np.uint32(1 << (c % 32))
+    return words
+
+def compile_booster(gbm):
+    """lgb.Booster → {陣列名稱: ndarray}（只保留到 best_iteration 的樹）"""
+    num_iteration = gbm.best_iteration if gbm.best_iteration > 0 else None
+    dump = gbm.dump_model(num_iteration=num_iteration)
+    objective = dump["objective"].split()[0]
+    if dump["num_class"] != 1 or objective not in IDENTITY_OBJECTIVES:
+        raise ValueError(f"❌ 不支援的模型（objective={objective}、num_class={dump['num_class']}），只能匯出單一輸出的迴歸模型")
+
+    feature, threshold, left, right, default_left, missing, is_cat, cat_index, value = ([] for _ in range(9))
+    bitsets = []
+    roots = []
+
+    def add(node):
+        """前序走訪，回傳節點在攤平陣列中的位置"""
+        pos = len(feature)
+        for column in (feature, threshold, left, right, default_left, missing, is_cat, cat_index, value):
+            column.append(0)
+        if "leaf_value" in node:
+            feature[pos], left[pos], right[pos], value[pos] = -1, pos, pos, node["leaf_value"]
+            return pos
+
+        feature[pos] = node["split_feature"]
+        default_left[pos] = node["default_left"]
+        missing[pos] = MISSING_TYPES[node["missing_type"]]
+        if node["decision_type"] == "==":
+            is_cat[pos], cat_index[pos] = True, len(bitsets)
+            bitsets.append(_cat_bitset(node["threshold"]))
+        else:
+            threshold[pos] = node["threshold"]
+        left[pos] = add(node["left_child"])
+        right[pos] = add(node["right_child"])
+        return pos
+
+    for tree in dump["tree_info"]:
+        roots.append(add(tree["tree_structure"]))
+
+    n_words = max((len(b) for b in bitsets), default=1)
+    cat_bits = np.zeros((max(len(bitsets), 1), n_words), dtype="uint32")
+    for i, words in enumerate(bitsets):
+        cat_bits[i, :len(words)] = words
+
+    return {
+        "format_version": np.int32(FORMAT_VERSION),
+        "feature_names": np.array(dump["feature_names"]),
+        "pandas_categorical": np.array(json.dumps(dump.get("pandas_categorical") or [], ensure_ascii=False)),
+        "roots": np.array(roots, dtype="int32"),
+        "split_feature": np.array(feature, dtype="int32"),
+        "threshold": np.array(threshold, dtype="float64"),
+        "left_child": np.array(left, dtype="int32"),
+        "right_child": np.array(right, dtype="int32"),
+        "default_left": np.array(default_left, dtype="bool"),
+        "missing_type": np.array(missing, dtype="int8"),
+        "is_categorical": np.array(is_cat, dtype="bool"),
+        "cat_index": np.array(cat_index, dtype="int32"),
+        "cat_bits": cat_bits,
+        "leaf_value": np.array(value, dtype="float64"),
+    }
+
+def export_model(model_file, output_file=None):
+    import lightgbm as lgb
+
+    output_file = Path(output_file or export_file(model_file))
+    arrays = compile_booster(lgb.Booster(model_file=str(model_file)))
+    arrays["source_digest"] = np.array(file_digest(model_file))
+    # 載入時先比對 mtime / 大小（不必讀文字檔），不同時才算 sha256
+    arrays["source_signature"] = np.array(file_signature(model_file), dtype="int64")
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(output_file, **arrays)
+    return output_file
+
+# ===============================
+# 推論
+# ===============================
+class CompiledModel:
+    """export_model 產生的 .npz 樹陣列；predict 與 lgb.Booster.predict 結果相同"""
+
+    best_iteration = 0  # 匯出時已截到最佳迭代
+
+    def __init__(self, path):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        if int(arrays["format_version"]) != FORMAT_VERSION:
+            raise ValueError(f"❌ {path} 的格式版本不符，請重新執行 export_model.py")
+
+        self.source_digest = str(arrays["source_digest"]) if "source_digest" in arrays else ""
+        self.source_signature = (tuple(int(v) for v in arrays["source_signature"])
+                                 if "source_signature" in arrays else None)
+        self.feature_names = arrays["feature_names"].tolist()
+        self.pandas_categorical = json.loads(str(arrays["pandas_categorical"]))
+        self.roots = arrays["roots"]
+        self.split_feature = arrays["split_feature"]
+        self.threshold = arrays["threshold"]
+        self.left_child = arrays["left_child"]
+        self.right_child = arrays["right_child"]
+        self.default_left = arrays["default_left"]
+        self.missing_type = arrays["missing_type"]
+        self.is_categorical = arrays["is_categorical"]
+        self.cat_index = arrays["cat_index"]
+        self.cat_bits = arrays["cat_bits"]
+        self.leaf_value = arrays["leaf_value"]
+        self.has_categorical = bool(self.is_categorical.any())
+
+    def feature_name(self):
+        return list(self.feature_names)
+
+    def num_trees(self):
+        return len(self.roots)
+
+    def to_matrix(self, data):
+        """DataFrame（依特徵名稱取欄，類別欄轉成訓練時的類別代碼）或陣列 → float64 矩陣"""
+        if not isinstance(data, pd.DataFrame):
+            return np.asarray(data, dtype="float64")
+
+        df = data[self.feature_names]
+        cat_pos = [i for i, dtype in enumerate(df.dtypes) if isinstance(dtype, pd.CategoricalDtype)]
+        if not cat_pos:
+            return df.to_numpy(dtype="float64", na_value=np.nan)
+
+        X = np.empty(df.shape)
+        other = [i for i in range(df.shape[1]) if i not in set(cat_pos)]
+        X[:, other] = df.iloc[:, other].to_numpy(dtype="float64", na_value=np.nan)
+        for n, i in enumerate(cat_pos):
+            col = df.iloc[:, i]
+            categories = self.pandas_categorical[n] if n < len(self.pandas_categorical) else col.cat.categories
+            codes = col.cat.set_categories(categories).cat.codes.to_numpy().astype("float64")
+            X[:, i] = np.where(codes >= 0, codes, np.nan)
+        return X
+
+    def predict(self, data, num_iteration=None):
+        X = self.to_matrix(data)
+        if X.ndim == 1:
+            X = X[None, :]
+        roots = self.roots if num_iteration is None or num_iteration <= 0 else self.roots[:num_iteration]
+        n_rows, n_trees = len(X), len(roots)
+
+        # 每個 (列, 樹) 一條路徑，只推進還沒走到葉子的路徑
+        flat_x = X.ravel()
+        row_offset = np.repeat(np.arange(n_rows) * X.shape[1], n_trees)
+        node = np.tile(roots, n_rows)
+        leaf = node.copy()
+        active = np.arange(node.size)
+        while active.size:
+            feature = self.split_feature[node]
+            at_leaf = feature < 0
+            if at_leaf.any():
+                leaf[active[at_leaf]] = node[at_leaf]
+                keep = ~at_leaf
+                active, node, feature = active[keep], node[keep], feature[keep]
+                if not active.size:
+                    break
+            go_left = self._decide(node, flat_x[row_offset[active] + feature])
+            node = np.where(go_left, self.left_child[node], self.right_child[node])
+
+        return self.leaf_value[leaf].reshape(n_rows, n_trees).sum(axis=1)
+
+    def _decide(self, node, fval):
+        """LightGBM 的數值 / 類別分裂規則（含缺值方向）"""
+        missing_type = self.missing_type[node]
+        is_nan = np.isnan(fval)
+
+        # 數值分裂：非 NaN 缺值模式時 NaN 視為 0
+        value = np.where(is_nan & (missing_type != 2), 0.0, fval)
+        is_missing = (((missing_type == 1) & (np.abs(value) <= ZERO_THRESHOLD))
+                      | ((missing_type == 2) & is_nan))
+        go_left = np.where(is_missing, self.default_left[node], value <= self.threshold[node])
+        if not self.has_categorical:
+            return go_left
+
+        # 類別分裂：代碼在 bitset 內走左邊，NaN 或負值走右邊
+        is_cat = self.is_categorical[node]
+        if is_cat.any():
+            cat_node, cat_val = node[is_cat], fval[is_cat]
+            code = np.nan_to_num(cat_val, nan=-1.0).astype("int64")
+            word = code // 32
+            in_range = (code >= 0) & (word < self.cat_bits.shape[1])
+            bits = self.cat_bits[self.cat_index[cat_node], np.clip(word, 0, self.cat_bits.shape[1] - 1)]
+            shift = np.clip(code % 32, 0, 31).astype("uint32")
+            go_left[is_cat] = in_range & ((bits >> shift) & 1).astype(bool)
+        return go_left
+
+def load_model(model_file):
+    """.npz 是由目前的文字模型匯出的就載入 CompiledModel，否則退回 lgb.Booster
+    文字檔 mtime、大小與匯出時相同即視為同一份；不同時（例如重新 checkout）才比對 sha256"""
+    model_file = Path(model_file)
+    compiled = export_file(model_file)
+    if compiled.exists():
+        model = CompiledModel(compiled)
+        if (not model_file.exists() or model.source_signature == file_signature(model_file)
+                or model.source_digest == file_digest(model_file)):
+            return model
+        print(f"⚠️ {compiled} 與 {model_file.name} 不一致，改用 LightGBM 載入（請重新執行 export_model.py）")
+
+    import lightgbm as lgb
+    return lgb.Booster(model_file=str(model_file))
+
+def main():
+    parser = argparse.ArgumentParser(description="把 LightGBM 模型匯出成 NumPy 樹陣列 (.npz)")
+    parser.add_argument("--crop", nargs="*", default=None,
+                        help=f"要匯出的作物模型，all 代表所有有模型的作物（{', '.join(CROPS)}）；"
+                             "未指定且沒有 --model 時為 all")
+    parser.add_argument("--model", nargs="*", default=[],
+                        help="另外匯出的模型檔，例如 app/lgb_model_*.txt、dataset/model/global/lgb_model_global.txt")
+    args = parser.parse_args()
+
+    model_files = [Path(f) for f in args.model]
+    crop_keys = args.crop if args.crop is not None else ([] if model_files else ["all"])
+    if crop_keys:
+        crops = ([c for c in CROPS.values() if c.model_file.exists()]
+                 if "all" in crop_keys else [get_crop(key) for key in crop_keys])
+        model_files = [c.model_file for c in crops] + model_files
+
+    for model_file in model_files:
+        start = time.perf_counter()
+        try:
+            output_file = export_model(model_file)
+        except Exception as e:
+            print(f"⚠️ {model_file} 略過 → {e}")
+            continue
+        print(f"✅ {model_file} ({model_file.stat().st_size / 1024:.0f} KB) → {output_file} "
+              f"({output_file.stat().st_size / 1024:.0f} KB, {time.perf_counter() - start:.2f}s)")
+
+if __name__ == "__main__":
+    main()
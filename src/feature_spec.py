@@ -0,0 +1,124 @@
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# ===============================
+# 宣告式特徵規格
+# 每個特徵 = (來源欄位, 運算, 視窗, 位移)，整組規格先編譯成執行計畫，
+# 再對 (天數 × 欄位) 的 NumPy 陣列一次算完並放進同一塊輸出陣列
+# ===============================
+OPS = ("lag", "mean", "max", "min", "sum")
+
+@dataclass(frozen=True)
+class FeatureSpec:
+    name: str         # 輸出欄名
+    column: str       # 來源欄位
+    op: str = "lag"   # lag：位移後的原值；mean / max / min / sum：位移後的滾動統計
+    window: int = 1   # 滾動視窗天數（lag 固定為 1）
+    lag: int = 1      # 先往前位移幾天，1 表示只用到前一天以前的資料
+
+    def __post_init__(self):
+        if self.op not in OPS:
+            raise ValueError(f"❌ 未知的特徵運算：{self.op}（可用：{', '.join(OPS)}）")
+        if self.op == "lag" and self.window != 1:
+            raise ValueError(f"❌ {self.name}：lag 特徵的 window 必須為 1")
+        if self.window < 1 or self.lag < 0:
+            raise ValueError(f"❌ {self.name}：window 需 >= 1、lag 需 >= 0")
+
+def lag_spec(name, column, days):
+    return FeatureSpec(name, column, "lag", 1, days)
+
+def rolling_spec(name, column, op, window, lag=1):
+    return FeatureSpec(name, column, op, window, lag)
+
+# ===============================
+# 編譯
+# ===============================
+@dataclass(frozen=True)
+class FeaturePlan:
+    names: tuple      # 輸出欄名（依規格順序）
+    columns: tuple    # 需要讀取的來源欄位
+    lags: tuple       # 需要的位移天數，每種只位移一次
+    groups: tuple     # ((lag, window, 來源欄位索引, ((op, 輸出位置, 群組內欄位位置), ...)), ...)
+
+@lru_cache(maxsize=None)
+def compile_specs(specs):
+    """specs（tuple）→ FeaturePlan；同一組規格只編譯一次"""
+    names = [s.name for s in specs]
+    if len(set(names)) != len(names):
+        raise ValueError("❌ 特徵名稱重複")
+
+    columns = tuple(dict.fromkeys(s.column for s in specs))
+    col_index = {c: i for i, c in enumerate(columns)}
+
+    # 相同 (lag, window) 的特徵共用同一份滾動視窗，各統計量只算一次
+    by_window = {}
+    for out_pos, s in enumerate(specs):
+        by_window.setdefault((s.lag, s.window), []).append((out_pos, s))
+
+    groups = []
+    for (lag, window), members in by_window.items():
+        src = tuple(dict.fromkeys(col_index[s.column] for _, s in members))
+        local = {c: i for i, c in enumerate(src)}
+        outputs = tuple((s.op, out_pos, local[col_index[s.column]]) for out_pos, s in members)
+        groups.append((lag, window, src, outputs))
+
+    lags = tuple(sorted({s.lag for s in specs}))
+    return FeaturePlan(tuple(names), columns, lags, tuple(groups))
+
+# ===============================
+# 執行
+# ===============================
+def shift_rows(values, lag):
+    """等同 DataFrame.shift(lag)：往下位移 lag 列，前面補 NaN"""
+    if lag == 0:
+        return values
+    shifted = np.full_like(values, np.nan)
+    if lag < len(values):
+        shifted[lag:] = values[:-lag]
+    return shifted
+
+def _window_stats(windows, ops, window):
+    """windows: (列數, 欄位數, 視窗)；只計算用得到的統計量，mean 由 sum 推得"""
+    stats = {}
+    if "sum" in ops or "mean" in ops:
+        stats["sum"] = windows.sum(axis=-1)
+        stats["mean"] = stats["sum"] / window
+    if "max" in ops:
+        stats["max"] = windows.max(axis=-1)
+    if "min" in ops:
+        stats["min"] = windows.min(axis=-1)
+    return stats
+
+def build_features(df, specs):
+    """依規格產生特徵，回傳與 df 同 index 的 DataFrame（欄位順序同 specs）
+
+    與 pandas 的 shift(lag).rolling(window) 相同：視窗內只要有 NaN 或天數不足，結果即為 NaN。
+    """
+    plan = compile_specs(tuple(specs))
+    values = df[list(plan.columns)].to_numpy(dtype="float64", na_value=np.nan)
+    n_rows = len(values)
+
+    shifted = {lag: shift_rows(values, lag) for lag in plan.lags}
+    out = np.full((n_rows, len(plan.names)), np.nan)
+
+    for lag, window, src, outputs in plan.groups:
+        base = shifted[lag][:, list(src)]
+
+        if window == 1:
+            for _, out_pos, local in outputs:
+                out[:, out_pos] = base[:, local]
+            continue
+
+        if n_rows < window:
+            continue
+
+        windows = sliding_window_view(base, window, axis=0)
+        stats = _window_stats(windows, {op for op, _, _ in outputs}, window)
+        for op, out_pos, local in outputs:
+            out[window - 1:, out_pos] = stats[op][:, local]
+
+    return pd.DataFrame(out, columns=list(plan.names), index=df.index)
@@ -0,0 +1,235 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from crops import CROPS, get_crop, season_year
+from engineering_market import MARKET_STRUCT_COLS, TARGET_COL, market_feature_specs
+from engineering_weather import NUMERIC_COLS, WEATHER_SPECS, event_features, month_features
+from export_model import load_model
+from merge_weather_and_market import calendar_features
+from storage import read_table, table_glob
+from tw_date import format_tw_dates, parse_tw_dates
+
+# ===============================
+# 遞迴多步預測
+# 每個作物保留最近幾個交易日的行情與最近幾天的氣象（環狀緩衝區），每往前預測一個交易日：
+# 只從緩衝區重算 lag / ma / 滾動特徵 → predict 一筆 → 把預測價格推回緩衝區
+# 行情的 lag / ma 是以交易日（列）計算的，因此一步是一個交易日：歷史上幾乎不開市的星期（例如草莓的週一）會跳過，
+# 氣象仍逐日推進；horizon 為交易日數。國定假日等不規則休市無法預知，仍當作交易日
+# 未來的市場結構欄位（上/中/下價、交易量）與氣象沿用最後一天觀測值，可另外提供氣象預報
+# 模型必須只用前幾天的行情（train_model.get_feature_cols 已排除當天的上/中/下價等欄位）
+# ===============================
+HORIZON = 5
+PRED_COL = "預測價格"
+MARKET_COLS = [TARGET_COL] + MARKET_STRUCT_COLS
+TRADING_WEEKDAY_SHARE = 0.5  # 開市次數不到最常開市星期的一半，視為休市的星期
+
+class RingBuffer:
+    """固定天數 × 欄位的環狀緩衝區，append 不搬移舊資料"""
+
+    def __init__(self, columns, size):
+        self.columns = list(columns)
+        self.size = size
+        self.values = np.full((size, len(self.columns)), np.nan)
+        self.pos = 0
+
+    def append(self, row):
+        self.values[self.pos] = row
+        self.pos = (self.pos + 1) % self.size
+
+    def extend(self, rows):
+        for row in np.asarray(rows, dtype="float64")[-self.size:]:
+            self.append(row)
+
+    def recent(self):
+        """最近 size 天，第 0 列為最新一天（= 前 1 天）"""
+        return self.values[(self.pos - 1 - np.arange(self.size)) % self.size]
+
+    def last(self):
+        return self.values[(self.pos - 1) % self.size]
+
+class SpecTable:
+    """把一組 FeatureSpec 預先編成 (輸出位置, 欄位, 起訖偏移, 運算)，每步只對緩衝區做切片統計"""
+
+    def __init__(self, specs, columns, positions):
+        col_index = {c: i for i, c in enumerate(columns)}
+        self.entries = [
+            (positions[s.name], col_index[s.column], s.lag - 1, s.lag - 1 + s.window, s.op)
+            for s in specs if s.name in positions
+        ]
+        self.depth = max([end for *_, end, _ in self.entries], default=1)
+
+    def fill(self, x, recent):
+        for out_pos, col, start, end, op in self.entries:
+            window = recent[start:end, col]
+            x[out_pos] = window[0] if op == "lag" else getattr(window, op)()
+
+class RecursiveForecaster:
+    def __init__(self, gbm, market_history, weather_history):
+        """market_history：[日期, 價格, 市場結構欄位]（交易日）；weather_history：[日期] + NUMERIC_COLS（每日）"""
+        self.gbm = gbm
+        self.feature_names = gbm.feature_name()
+        positions = {name: i for i, name in enumerate(self.feature_names)}
+
+        self.market_specs = SpecTable(market_feature_specs(MARKET_COLS), MARKET_COLS, positions)
+        self.weather_specs = SpecTable(WEATHER_SPECS, NUMERIC_COLS, positions)
+
+        # 其餘特徵：前一天極端事件、連續降雨天數、月份、星期
+        covered = {entry[0] for entry in self.market_specs.entries + self.weather_specs.entries}
+        self.derived = [(i, name) for i, name in enumerate(self.feature_names) if i not in covered]
+
+        market_history = market_history.sort_values("日期_dt")
+        weather_history = weather_history.sort_values("日期_dt")
+
+        self.market = RingBuffer(MARKET_COLS, max(self.market_specs.depth, 1))
+        self.market.extend(market_history.reindex(columns=MARKET_COLS).to_numpy(dtype="float64", na_value=np.nan))
+        self.last_date = market_history["日期_dt"].iloc[-1]
+        self.trading_weekdays = trading_weekdays(market_history["日期_dt"])
+
+        # 氣象緩衝區逐日對齊到最後一個交易日：中間缺測維持 NaN（與特徵工程相同），
+        # 最後觀測日之後才沿用最後一天
+        days = pd.date_range(weather_history["日期_dt"].iloc[0], self.last_date, freq="D")
+        weather = weather_history.set_index("日期_dt")[NUMERIC_COLS].reindex(days)
+        after_last = weather.index > weather_history["日期_dt"].iloc[-1]
+        weather[after_last] = weather.ffill()[after_last]
+        weather = weather.to_numpy(dtype="float64", na_value=np.nan)
+        self.weather = RingBuffer(NUMERIC_COLS, max(self.weather_specs.depth, 1))
+        self.weather.extend(weather)
+
+        # 連續降雨天數（到最後一天為止）
+        self.consec_rainy = 0
+        for rain in weather[:, NUMERIC_COLS.index("降水量(mm)")]:
+            self.consec_rainy = self.consec_rainy + 1 if rain > 0 else 0
+
+        unknown = [name for _, name in self.derived if name not in self.derived_features(self.last_date)]
+        if unknown:
+            raise KeyError(f"❌ 遞迴預測無法計算的特徵：{', '.join(unknown[:3])}")
+
+    def derived_features(self, date):
+        """前一天極端事件、連續降雨天數、月份、星期"""
+        prev = dict(zip(NUMERIC_COLS, self.weather.last()))
+        return {
+            **event_features(prev),
+            "consec_rainy_days_prev": self.consec_rainy,
+            **month_features(np.int64(date.month)),
+            **calendar_features(np.int64(date.weekday())),
+        }
+
+    def next_trading_day(self, date):
+        date = date + pd.Timedelta(days=1)
+        while date.weekday() not in self.trading_weekdays:
+            date += pd.Timedelta(days=1)
+        return date
+
+    def advance_weather(self, date, future_weather):
+        """氣象緩衝區推進一天（沿用前一天，future_weather 有給的欄位改用預報值）"""
+        weather_row = self.weather.last().copy()
+        for col, value in future_weather.get(date, {}).items():
+            weather_row[NUMERIC_COLS.index(col)] = value
+        self.weather.append(weather_row)
+        rain = weather_row[NUMERIC_COLS.index("降水量(mm)")]
+        self.consec_rainy = self.consec_rainy + 1 if rain > 0 else 0
+
+    def step_features(self, date):
+        """預測 date 當天所需的特徵（只用 date 之前的緩衝區資料）"""
+        x = np.full(len(self.feature_names), np.nan)
+        self.market_specs.fill(x, self.market.recent())
+        self.weather_specs.fill(x, self.weather.recent())
+
+        derived = self.derived_features(date)
+        for pos, name in self.derived:
+            x[pos] = derived[name]
+        return x
+
+    def forecast(self, horizon=HORIZON, future_weather=None, until=None):
+        """往後預測 horizon 個交易日；until 指定時改為預測到 until 當天為止（until 是休市日也照樣預測）
+
+        future_weather 為 {日期: {氣象欄位: 值}} 的氣象預報或假設情境，只需給要改的欄位，
+        沒給的日期與欄位沿用前一天。
+        """
+        future_weather = future_weather or {}
+        num_iteration = self.gbm.best_iteration if self.gbm.best_iteration > 0 else None
+
+        rows = []
+        while (len(rows) < horizon) if until is None else (self.last_date < until):
+            date = self.next_trading_day(self.last_date)
+            if until is not None:
+                date = min(date, until)
+            # 休市日的氣象也要推進，預測當天只用到前一天為止的氣象
+            for day in pd.date_range(self.last_date + pd.Timedelta(days=1), date - pd.Timedelta(days=1)):
+                self.advance_weather(day, future_weather)
+
+            x = self.step_features(date)
+            price = float(self.gbm.predict(x[None, :], num_iteration=num_iteration)[0])
+            rows.append((date, price))
+
+            # 預測價格推回行情緩衝區，市場結構欄位沿用前一個交易日
+            market_row = self.market.last().copy()
+            market_row[0] = price
+            self.market.append(market_row)
+            self.advance_weather(date, future_weather)
+            self.last_date = date
+
+        dates, prices = zip(*rows)
+        return pd.DataFrame({"日期": format_tw_dates(pd.DatetimeIndex(dates)), PRED_COL: prices})
+
+def trading_weekdays(dates):
+    """歷史上有開市的星期（0 = 週一）；開市次數不到最常開市星期 TRADING_WEEKDAY_SHARE 的視為固定休市"""
+    counts = np.bincount(pd.DatetimeIndex(dates).weekday, minlength=7)
+    return {day for day in range(7) if counts[day] >= TRADING_WEEKDAY_SHARE * counts.max()}
+
+# ===============================
+# 作物歷史資料
+# ===============================
+def latest_file(files):
+    return max(files, key=lambda f: season_year(f.name), default=None)
+
+def crop_history(crop):
+    """最新產期的每日行情與對應氣象（已預處理），各加上 日期_dt"""
+    weather_start = crop.weather_start.replace("-", "")
+    market_file = latest_file(table_glob(crop.preprocess_market_dir, f"daily_market_{crop.key}_*"))
+    weather_file = latest_file(table_glob(crop.preprocess_weather_dir,
+                                          f"{crop.weather_prefix}_avg_???{weather_start}-*"))
+    if market_file is None or weather_file is None:
+        raise FileNotFoundError(f"❌ {crop.key} 缺少預處理後的行情或氣象資料")
+
+    market = read_table(market_file)
+    weather = read_table(weather_file)
+    market["日期_dt"] = parse_tw_dates(market["日期"])
+    weather["日期_dt"] = parse_tw_dates(weather["日期"])
+    return market.dropna(subset=["日期_dt"]), weather.dropna(subset=["日期_dt"])
+
+def forecast_crop(crop, horizon=HORIZON):
+    gbm = load_model(crop.model_file)
+    market, weather = crop_history(crop)
+    return RecursiveForecaster(gbm, market, weather).forecast(horizon)
+
+def forecast_file(crop, horizon):
+    return crop.prediction_file.parent / f"forecast_{horizon}d.csv"
+
+def main():
+    parser = argparse.ArgumentParser(description="遞迴預測未來 N 個交易日的價格")
+    parser.add_argument("--crop", nargs="*", default=["all"],
+                        help=f"要預測的作物，all 代表所有有模型的作物（{', '.join(CROPS)}）")
+    parser.add_argument("--horizon", type=int, default=HORIZON, help=f"預測的交易日數，預設 {HORIZON}")
+    args = parser.parse_args()
+
+    crops = ([c for c in CROPS.values() if c.model_file.exists() and c.weather_prefix]
+             if "all" in args.crop else [get_crop(key) for key in args.crop])
+
+    for crop in crops:
+        try:
+            result = forecast_crop(crop, args.horizon)
+        except (FileNotFoundError, KeyError) as e:
+            print(f"⚠️ {crop.key} 略過 → {e.args[0]}")
+            continue
+
+        output_file = forecast_file(crop, args.horizon)
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        result.to_csv(output_file, index=False, encoding="utf-8-sig")
+        prices = ", ".join(f"{p:.1f}" for p in result[PRED_COL])
+        print(f"✅ {crop.key} 未來 {args.horizon} 個交易日：{prices} → {output_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import json
+import time
+from pathlib import Path
+
+import lightgbm as lgb
+import pandas as pd
+
+from build_cache import BuildCache
+from crops import CROPS, DATA_DIR, get_crop
+from dataset_cache import DATASET_PARAMS, cached_pairs, dataset_key
+from storage import read_columns
+import train_model
+from train_model import TARGET_COL, crop_feature_cols, evaluate, load_splits, split_files
+
+# ===============================
+# 多作物共用的全域模型
+# 各作物合併後的 train / valid / test 疊成一張特徵表，加上作物類別欄 crop（pandas category），
+# 只建一次 Dataset、訓練一個 LightGBM；各作物特徵不同時取聯集，沒有的欄位為 NaN
+# 可選擇再以各作物自己的資料接續訓練幾輪（fine-tune），輸出 lgb_model_global_<作物>.txt，
+# predict.py --global 對有這個檔的作物改用它；沒有 --fine-tune 重新訓練時會刪除舊的 fine-tune 模型
+# ===============================
+GLOBAL_DIR = DATA_DIR / "model" / "global"
+GLOBAL_MODEL_FILE = GLOBAL_DIR / "lgb_model_global.txt"
+MANIFEST_FILE = DATA_DIR / ".build_manifest" / "global.json"
+CROP_COL = "crop"
+FINE_TUNE_ROUNDS = 200
+
+# 類別固定為 CROPS 的順序，訓練與預測時的類別代碼一致
+CROP_CATEGORIES = list(CROPS)
+
+def finetune_model_file(crop):
+    return GLOBAL_DIR / f"lgb_model_global_{crop.key}.txt"
+
+def trainable_crops():
+    return [key for key, crop in CROPS.items() if all(f.exists() for f in split_files(crop))]
+
+def with_crop_column(df, crop_key):
+    crop_col = pd.Series(pd.Categorical([crop_key] * len(df), categories=CROP_CATEGORIES),
+                         index=df.index, name=CROP_COL)
+    return pd.concat([crop_col, df], axis=1)
+
+def global_feature_cols(crop_keys):
+    """crop 欄 + 各作物特徵欄（有篩選清單時為篩選後）的聯集（依作物順序、保留原欄位順序）"""
+    columns = dict.fromkeys([CROP_COL])
+    for key in crop_keys:
+        crop = get_crop(key)
+        columns.update(dict.fromkeys(crop_feature_cols(crop, read_columns(split_files(crop)[0]))))
+    return list(columns)
+
+def stack_frames(frames):
+    """{作物: DataFrame} → 加上 crop 欄後疊成一張表（欄位取聯集）"""
+    return pd.concat([with_crop_column(df, key) for key, df in frames.items()], ignore_index=True)
+
+def stacked_splits(crop_keys):
+    """回傳疊好的 (train, valid, test)"""
+    splits = {key: load_splits(get_crop(key)) for key in crop_keys}
+    return tuple(stack_frames({key: s[i] for key, s in splits.items()}) for i in range(3))
+
+def global_matrix(gbm, df, crop_key):
+    """單一作物的資料 → 全域模型的特徵矩陣（補 crop 欄，缺的特徵為 NaN）"""
+    return with_crop_column(df, crop_key).reindex(columns=gbm.feature_name())
+
+# ===============================
+# 訓練
+# ===============================
+def train_global(crop_keys, model_params):
+    feature_cols = global_feature_cols(crop_keys)
+    sources = [f for key in crop_keys for f in split_files(get_crop(key))[:2]]
+    key = dataset_key(sources, feature_cols, TARGET_COL, crops=list(crop_keys), categories=CROP_CATEGORIES)
+    load_frames = lambda: [("global", *stacked_splits(crop_keys)[:2])]
+    _, lgb_train, lgb_valid = cached_pairs(key, load_frames, feature_cols, TARGET_COL)[0]
+
+    gbm = train_model.train_booster(lgb_train, lgb_valid, model_params)
+    # 只保留到最佳迭代，fine-tune 才會從最佳的樹接續
+    return lgb.Booster(model_str=gbm.model_to_string(num_iteration=gbm.best_iteration))
+
+def fine_tune(gbm, crop_key, model_params):
+    """以作物自己的 train / valid 從全域模型接續訓練（起始分數為全域模型的預測）"""
+    crop = get_crop(crop_key)
+    train_df, valid_df, _ = load_splits(crop)
+    crop_train = lgb.Dataset(global_matrix(gbm, train_df, crop_key), train_df[TARGET_COL],
+                             params=DATASET_PARAMS, free_raw_data=False)
+    crop_valid = lgb.Dataset(global_matrix(gbm, valid_df, crop_key), valid_df[TARGET_COL], reference=crop_train,
+                             params=DATASET_PARAMS, free_raw_data=False)
+
+    return lgb.train(
+        {**model_params, **DATASET_PARAMS},
+        crop_train,
+        num_boost_round=FINE_TUNE_ROUNDS,
+        init_model=gbm,
+        valid_sets=[crop_valid],
+        valid_names=["valid"],
+        callbacks=[lgb.early_stopping(stopping_rounds=train_model.EARLY_STOPPING_ROUNDS, verbose=False)]
+    )
+
+def crop_metrics(gbm, crop_key):
+    """單一作物 test 的評估指標"""
+    _, _, test_df = load_splits(get_crop(crop_key))
+    feature_cols = gbm.feature_name()
+    test = pd.concat([global_matrix(gbm, test_df, crop_key), test_df[TARGET_COL]], axis=1)
+    metrics, _ = evaluate(gbm, test, feature_cols)
+    return metrics
+
+def local_metrics(crop_key):
+    """同一作物單獨模型的 test 指標，作為比較基準（沒有模型檔時為 None）"""
+    crop = get_crop(crop_key)
+    if not crop.model_file.exists():
+        return None
+    gbm = lgb.Booster(model_file=str(crop.model_file))
+    _, _, test_df = load_splits(crop)
+    metrics, _ = evaluate(gbm, test_df, gbm.feature_name())
+    return metrics
+
+def save_booster(gbm, model_file):
+    Path(model_file).parent.mkdir(parents=True, exist_ok=True)
+    gbm.save_model(str(model_file), num_iteration=gbm.best_iteration if gbm.best_iteration > 0 else None)
+    return model_file
+
+def load_saved_models(crop_keys):
+    """已儲存的 (全域模型, {作物: fine-tune 模型})"""
+    tuned = {key: lgb.Booster(model_file=str(finetune_model_file(get_crop(key))))
+             for key in crop_keys if finetune_model_file(get_crop(key)).exists()}
+    return lgb.Booster(model_file=str(GLOBAL_MODEL_FILE)), tuned
+
+def crop_report(crop_keys, gbm, tuned):
+    """各作物單獨模型、全域模型與 fine-tune 模型的 test 指標，並列出 R² 對照表"""
+    report = {}
+    print(f"\n{'作物':<12}{'單獨模型 R²':>12}{'全域 R²':>10}{'fine-tune R²':>14}")
+    for key in crop_keys:
+        report[key] = {"local": local_metrics(key), "global": crop_metrics(gbm, key)}
+        if key in tuned:
+            report[key]["fine_tune"] = crop_metrics(tuned[key], key)
+
+        r2 = [report[key].get(name) for name in ("local", "global", "fine_tune")]
+        cells = [f"{m['r2']:.4f}" if m else "-" for m in r2]
+        print(f"{key:<12}{cells[0]:>12}{cells[1]:>10}{cells[2]:>14}")
+    return report
+
+def write_report(report, path):
+    Path(path).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"📝 評估報表已寫入 {path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="訓練多作物共用的全域 LightGBM 模型")
+    parser.add_argument("--crop", nargs="*", default=["all"],
+                        help=f"要納入的作物，all 代表所有有合併資料的作物（{', '.join(CROPS)}）")
+    parser.add_argument("--fine-tune", action="store_true",
+                        help=f"再以各作物自己的資料接續訓練（最多 {FINE_TUNE_ROUNDS} 輪），另存一份模型")
+    parser.add_argument("--report", default=None, metavar="FILE", help="各作物評估指標寫成 JSON")
+    args = parser.parse_args()
+
+    crop_keys = trainable_crops() if "all" in args.crop else args.crop
+    for key in crop_keys:
+        get_crop(key)
+
+    # 各作物合併資料與參數都沒變 → 沿用已儲存的全域模型（有 --report 時以存好的模型重新評估）
+    model_params = train_model.params
+    cache = BuildCache(MANIFEST_FILE)
+    task = f"global_model:{GLOBAL_MODEL_FILE}"
+    cache_inputs = [f for key in crop_keys for f in split_files(get_crop(key))] + [__file__, train_model.__file__]
+    cache_params = {"params": model_params, "crops": crop_keys, "fine_tune": args.fine_tune,
+                    "features": global_feature_cols(crop_keys)}
+    if cache.is_fresh(task, cache_inputs, cache_params):
+        print(f"⏭️ 訓練資料與參數未變更，沿用 {GLOBAL_MODEL_FILE}")
+        if args.report:
+            write_report(crop_report(crop_keys, *load_saved_models(crop_keys)), args.report)
+        return
+
+    start = time.perf_counter()
+    gbm = train_global(crop_keys, model_params)
+    written = [save_booster(gbm, GLOBAL_MODEL_FILE)]
+    print(f"✅ 全域模型（{len(crop_keys)} 個作物、{gbm.num_trees()} 棵樹）已儲存至 {GLOBAL_MODEL_FILE}"
+          f" ({time.perf_counter() - start:.1f}s)")
+
+    tuned = {}
+    for key in crop_keys:
+        if args.fine_tune:
+            tuned[key] = fine_tune(gbm, key, model_params)
+            written.append(save_booster(tuned[key], finetune_model_file(get_crop(key))))
+        else:
+            # 舊的 fine-tune 模型是從前一版全域模型接續訓練的，留著會被 predict.py --global 拿去用
+            finetune_model_file(get_crop(key)).unlink(missing_ok=True)
+
+    report = crop_report(crop_keys, gbm, tuned)
+    if args.report:
+        write_report(report, args.report)
+    cache.record(task, cache_inputs, cache_params, written)
+
+if __name__ == "__main__":
+    main()
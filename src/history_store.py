@@ -0,0 +1,228 @@
+import argparse
+import math
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from crops import CROPS, DATA_DIR, get_crop
+from prediction_store import connect_readonly, file_signature
+from storage import read_table, table_glob
+from tw_date import parse_tw_dates
+
+# ===============================
+# 歷史行情彙整庫（SQLite）
+# 所有作物、所有產期預處理後的每日行情（價格、上中下價、交易量），加上 dataset/predict/<作物>/test_with_prediction.csv
+# 的預測價格，彙整到 dataset/.cache/history.sqlite；主鍵 (crop, date) 供日期區間查詢，(crop, season) 索引供產期查詢
+# 查詢在 SQLite 端完成：區間內超過 max_points 筆時依交易日分組取平均，回傳的點數有上限，
+# 前端不必載入整段每日資料。來源檔 mtime / 大小有變動才重建（同 prediction_store.py）
+# ===============================
+HISTORY_FILE = DATA_DIR / ".cache" / "history.sqlite"
+HISTORY_VERSION = 1  # 表格結構改變時遞增，舊版彙整庫會自動重建
+MAX_POINTS = 400     # 單次查詢最多回傳的點數
+
+ACTUAL_COL = "價格(元/公斤)"
+PRED_COL = "預測價格"
+MARKET_COLUMNS = {ACTUAL_COL: "price", "上價": "high", "中價": "mid", "下價": "low", "交易量(公斤)": "volume"}
+VALUE_COLUMNS = ["price", "high", "mid", "low", "volume", "predicted"]
+
+SCHEMA = f"""
+PRAGMA user_version = {HISTORY_VERSION};
+CREATE TABLE prices (
+    crop TEXT NOT NULL,
+    date TEXT NOT NULL,       -- 西元 YYYY-MM-DD
+    season INTEGER NOT NULL,  -- 產期開始年，不在產期內為 -1
+    price REAL,
+    high REAL,
+    mid REAL,
+    low REAL,
+    volume REAL,
+    predicted REAL,           -- 沒有預測時為 NULL
+    PRIMARY KEY (crop, date)
+) WITHOUT ROWID;
+CREATE INDEX prices_season ON prices (crop, season, date);
+CREATE TABLE sources (
+    file TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+# 依交易日順序每 step 筆一組（同一產期內分組，不跨產期平均）
+DOWNSAMPLE_SQL = """
+SELECT MIN(date) AS date, season, AVG(price) AS price, MAX(high) AS high, AVG(mid) AS mid, MIN(low) AS low,
+       SUM(volume) AS volume, AVG(predicted) AS predicted, COUNT(*) AS days
+FROM (
+    SELECT *, (ROW_NUMBER() OVER (PARTITION BY season ORDER BY date) - 1) / :step AS bucket
+    FROM prices WHERE crop = :crop AND date BETWEEN :start AND :end
+)
+GROUP BY season, bucket
+ORDER BY date
+"""
+
+def source_files(crop):
+    """單一作物的來源檔：各產期預處理後的每日行情，以及存在時的 test 預測結果"""
+    files = table_glob(crop.preprocess_market_dir, f"daily_market_{crop.key}_*")
+    if crop.prediction_file.exists():
+        files.append(crop.prediction_file)
+    return files
+
+def all_source_files():
+    return [f for crop in CROPS.values() for f in source_files(crop)]
+
+# ===============================
+# 建置
+# ===============================
+def crop_rows(crop):
+    """單一作物所有產期的每日行情，合併 test 預測價格，回傳 DataFrame（欄位同 prices 表）"""
+    market_files = table_glob(crop.preprocess_market_dir, f"daily_market_{crop.key}_*")
+    if not market_files:
+        return None
+    market = pd.concat([read_table(f, columns=["日期", *MARKET_COLUMNS]) for f in market_files], ignore_index=True)
+    market = market.rename(columns=MARKET_COLUMNS)
+    market["date"] = parse_tw_dates(market["日期"])
+
+    if crop.prediction_file.exists():
+        predicted = pd.read_csv(crop.prediction_file, encoding="utf-8-sig", usecols=["日期", PRED_COL])
+        predicted = pd.DataFrame({"date": parse_tw_dates(predicted["日期"]), "predicted": predicted[PRED_COL]})
+        market = market.merge(predicted.dropna(subset=["date"]), on="date", how="outer")
+    else:
+        market["predicted"] = np.nan
+
+    market = market.dropna(subset=["date"]).drop_duplicates("date", keep="last").sort_values("date")
+    dates = pd.DatetimeIndex(market["date"])
+    return pd.DataFrame({
+        "crop": crop.key,
+        "date": dates.strftime("%Y-%m-%d"),
+        "season": crop.season_keys(dates, crop.market_start),
+        **{col: market[col].to_numpy(dtype="float64") for col in VALUE_COLUMNS},
+    })
+
+def build_history(path=HISTORY_FILE):
+    """重建整個歷史彙整庫，回傳筆數"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    os.close(fd)
+    n_rows = 0
+    try:
+        with closing(sqlite3.connect(tmp)) as conn:
+            conn.executescript(SCHEMA)
+            # 先記錄檔案狀態再讀：讀取期間來源檔又被改寫時，下次檢查仍會判定過期
+            conn.executemany("INSERT INTO sources VALUES (?, ?, ?)",
+                             [(str(f), *file_signature(f)) for f in all_source_files()])
+            for crop in CROPS.values():
+                rows = crop_rows(crop)
+                if rows is None:
+                    continue
+                # NaN 存成 NULL
+                values = rows.astype(object).where(rows.notna(), None).itertuples(index=False, name=None)
+                conn.executemany(f"INSERT INTO prices VALUES ({', '.join('?' * rows.shape[1])})", values)
+                n_rows += len(rows)
+            conn.commit()
+        os.chmod(tmp, 0o644)  # mkstemp 預設只有擁有者可讀
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return n_rows
+
+def is_fresh(path=HISTORY_FILE):
+    """彙整庫存在、結構版本相同，且記錄的來源檔與目前的檔案（mtime、大小、有哪些檔）完全一致"""
+    if not path.exists():
+        return False
+    current = {str(f): file_signature(f) for f in all_source_files()}
+    try:
+        with connect_readonly(path) as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != HISTORY_VERSION:
+                return False
+            recorded = {row[0]: tuple(row[1:]) for row in conn.execute("SELECT file, mtime_ns, size FROM sources")}
+    except sqlite3.DatabaseError:
+        return False
+    return recorded == current
+
+def refresh_history(path=HISTORY_FILE):
+    """來源檔有變動時才重建，回傳彙整庫路徑"""
+    if not is_fresh(path):
+        build_history(path)
+    return path
+
+# ===============================
+# 查詢
+# ===============================
+def _day(value):
+    return pd.Timestamp(value).strftime("%Y-%m-%d")
+
+def season_overview(path=HISTORY_FILE, crop_key=None):
+    """各作物、各產期的日期範圍與筆數（含有預測的筆數）"""
+    sql = ("SELECT crop, season, MIN(date) AS start, MAX(date) AS end, COUNT(*) AS days, "
+           "COUNT(predicted) AS predicted_days FROM prices {where} GROUP BY crop, season ORDER BY crop, season")
+    with connect_readonly(path) as conn:
+        if crop_key is None:
+            return pd.read_sql_query(sql.format(where=""), conn)
+        return pd.read_sql_query(sql.format(where="WHERE crop = ?"), conn, params=(crop_key,))
+
+def query_history(path, crop_key, start, end, max_points=MAX_POINTS):
+    """[start, end] 的每日行情與預測；超過 max_points 筆時依交易日分組取平均（days 為每點包含的天數）"""
+    start, end = _day(start), _day(end)
+    with connect_readonly(path) as conn:
+        n_rows, n_seasons = conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT season) FROM prices WHERE crop = ? AND date BETWEEN ? AND ?",
+            (crop_key, start, end)).fetchone()
+        # 每個產期最後一組可能不滿 step 筆，扣掉產期數才不會超過 max_points
+        step = max(1, math.ceil(n_rows / max(max_points - n_seasons, 1)))
+        df = pd.read_sql_query(DOWNSAMPLE_SQL, conn,
+                               params={"crop": crop_key, "start": start, "end": end, "step": step})
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+def prediction_accuracy(path, crop_key, start=None, end=None):
+    """有預測的日期，各產期的 MAE、RMSE、MAPE"""
+    sql = """
+    SELECT season, COUNT(*) AS days, AVG(ABS(predicted - price)) AS mae,
+           AVG((predicted - price) * (predicted - price)) AS mse,
+           AVG(ABS(predicted - price) / price) * 100 AS mape
+    FROM prices
+    WHERE crop = ? AND date BETWEEN ? AND ? AND predicted IS NOT NULL AND price > 0
+    GROUP BY season ORDER BY season
+    """
+    params = (crop_key, _day(start or "1900-01-01"), _day(end or "2100-12-31"))
+    with connect_readonly(path) as conn:
+        df = pd.read_sql_query(sql, conn, params=params)
+    df.insert(3, "rmse", np.sqrt(df.pop("mse")))
+    return df
+
+def main():
+    parser = argparse.ArgumentParser(description="把所有作物的歷史行情與預測彙整成 SQLite，並查詢日期區間")
+    parser.add_argument("--crop", default=None, help=f"查詢的作物（{', '.join(CROPS)}），未指定時只顯示各產期概況")
+    parser.add_argument("--start", default=None, help="起日，例如 2018-11-01，預設為該作物第一天")
+    parser.add_argument("--end", default=None, help="迄日，預設為該作物最後一天")
+    parser.add_argument("--max-points", type=int, default=MAX_POINTS, help=f"最多回傳幾點，預設 {MAX_POINTS}")
+    parser.add_argument("--force", action="store_true", help="來源檔沒有變動也重建")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.force or not is_fresh():
+        n_rows = build_history()
+        print(f"✅ {HISTORY_FILE}：{n_rows} 筆 ({time.perf_counter() - start:.2f}s)")
+    else:
+        print(f"⏭️ 來源檔未變更，沿用 {HISTORY_FILE}")
+
+    if args.crop is None:
+        print(season_overview().to_string(index=False))
+        return
+
+    crop = get_crop(args.crop)
+    overview = season_overview(crop_key=crop.key)
+    if overview.empty:
+        raise SystemExit(f"❌ {crop.key} 沒有歷史行情")
+    history = query_history(HISTORY_FILE, crop.key, args.start or overview["start"].min(),
+                            args.end or overview["end"].max(), args.max_points)
+    print(history.to_string(index=False))
+    print(prediction_accuracy(HISTORY_FILE, crop.key, args.start, args.end).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
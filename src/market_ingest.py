@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from build_cache import file_digest
+from crops import DATA_DIR
+
+# ===============================
+# 原始行情 .xls 讀取層
+# 每本活頁簿只用 xlrd 解碼一次，存成欄式快取（有 pyarrow 用 Parquet，否則 pickle）；
+# 來源檔 size / mtime 沒變就直接讀快取，變了再用 sha256 確認內容是否真的不同
+# ===============================
+CACHE_DIR = DATA_DIR / ".cache" / "market_workbooks"
+HEADER_ROW = 4  # 上方 4 列為標題（交易日期、市場、產品）
+
+# xlrd 為純 Python 解析，多本活頁簿以多行程同時解碼
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+
+try:
+    import pyarrow  # noqa: F401
+    CACHE_SUFFIX = ".parquet"
+except ImportError:
+    CACHE_SUFFIX = ".pkl"
+
+def decode_workbook(path):
+    """讀取 Excel (header=4 避開上方標題列) 並清理欄名"""
+    df = pd.read_excel(path, header=HEADER_ROW, engine="xlrd")
+    df.columns = [str(c).strip() for c in df.columns]
+
+    # 混合型別的文字欄（例如「增減%」同時有數字與 "-  3"）統一成字串，才能存成欄式格式
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].astype("string")
+    return df
+
+# ===============================
+# 快取
+# ===============================
+def cache_paths(path):
+    """以來源絕對路徑的 hash 區分快取（不同資料夾下的同名活頁簿不會互相覆蓋），檔名前綴只供辨識"""
+    path = Path(path)
+    stem = f"{path.stem}__{hashlib.sha256(str(path.resolve()).encode('utf-8')).hexdigest()[:16]}"
+    return CACHE_DIR / f"{stem}{CACHE_SUFFIX}", CACHE_DIR / f"{stem}.json"
+
+def _source_stat(path):
+    stat = Path(path).stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def _read_cache(cache_file):
+    if cache_file.suffix == ".parquet":
+        return pd.read_parquet(cache_file)
+    return pd.read_pickle(cache_file)
+
+def _write_cache(df, path):
+    cache_file, meta_file = cache_paths(path)
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+
+    # 先寫暫存檔再替換，平行執行的其他作物不會讀到寫一半的快取
+    tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+    if cache_file.suffix == ".parquet":
+        df.to_parquet(tmp_file, index=False)
+    else:
+        df.to_pickle(tmp_file)
+    os.replace(tmp_file, cache_file)
+
+    meta = {"source": str(path), "sha256": file_digest(path), **_source_stat(path)}
+    meta_file.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+
+def cached_workbook(path):
+    """快取仍有效時回傳 DataFrame，否則回傳 None"""
+    cache_file, meta_file = cache_paths(path)
+    if not cache_file.exists() or not meta_file.exists():
+        return None
+
+    try:
+        meta = json.loads(meta_file.read_text(encoding="utf-8"))
+    except ValueError:
+        return None
+
+    stat = _source_stat(path)
+    if {k: meta.get(k) for k in stat} != stat:
+        # mtime 變了但內容相同（例如重新複製檔案）→ 更新紀錄後沿用
+        if meta.get("sha256") != file_digest(path):
+            return None
+        meta.update(stat)
+        meta_file.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    return _read_cache(cache_file)
+
+def _decode_and_cache(path):
+    df = decode_workbook(path)
+    _write_cache(df, path)
+    return df
+
+# ===============================
+# 對外介面
+# ===============================
+def read_workbook(path):
+    df = cached_workbook(path)
+    return df if df is not None else _decode_and_cache(path)
+
+def read_workbooks(paths, max_workers=MAX_WORKERS):
+    """讀取多本活頁簿並依序合併；只有快取失效的才重新解碼，且以多行程平行處理"""
+    paths = [Path(p) for p in paths]
+    frames = {p: cached_workbook(p) for p in paths}
+    stale = [p for p in paths if frames[p] is None]
+
+    if stale:
+        print(f"  📖 解碼 {len(stale)} 本活頁簿（其餘 {len(paths) - len(stale)} 本使用快取）")
+        if len(stale) == 1 or max_workers <= 1:
+            decoded = [_decode_and_cache(p) for p in stale]
+        else:
+            with ProcessPoolExecutor(max_workers=min(max_workers, len(stale))) as pool:
+                decoded = list(pool.map(_decode_and_cache, stale))
+        frames.update(zip(stale, decoded))
+
+    return pd.concat([frames[p] for p in paths], ignore_index=True)
@@ -1,59 +1,127 @@
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
-weather_dir = Path("dataset/processed_data/feature_engineering/weather/Kai-lan")
-market_dir = Path("dataset/processed_data/feature_engineering/market/Kai-lan")
-output_dir = Path("dataset/processed_data/merge_market_and_weather_after_engineering/Kai-lan")
-output_dir.mkdir(parents=True, exist_ok=True)
+from build_cache import BuildCache
+from crops import DEFAULT_CROP, crop_from_args, season_year
+from storage import STORAGE_FORMAT, read_table, table_glob, write_table
+from tw_date import parse_tw_dates
 
-csv_name = "_Kai-lan_after_engineering"
-
-weather_files = sorted(weather_dir.glob("weather_feat_*.csv"))
-market_files = sorted(market_dir.glob("features_daily_market_*.csv"))
-
-merged_list = []
+# 輸入 crop.feature_market_dir + crop.feature_weather_dir → 輸出 crop.merge_dir（見 crops.py）
+def split_file_name(crop, split):
+    return f"{split}_{crop.key}_after_engineering.csv"
 
 # ===============================
-# 民國 → 西元（只用於算星期）
+# 合併：所有產期一次以日期對齊
+# 市場與氣象特徵各自疊成一張依日期排序的表，以 merge_asof 對齊：
+# 當天沒有氣象資料時沿用 WEATHER_TOLERANCE 天內最近一天的氣象，更久以前的不補（維持 NaN）
+# 是否有對應的氣象以日期範圍判斷，不依檔名或年度順序配對
 # ===============================
-def roc_to_ad(d):
-    try:
-        y, m, day = d.split("/")
-        return pd.Timestamp(int(y) + 1911, int(m), int(day))
-    except:
-        return pd.NaT
+WEATHER_TOLERANCE = pd.Timedelta(days=3)
+DATE_COL = "日期_dt"
+SEASON_COL = "_season"
+MATCHED_COL = "_weather_dt"
+
+def calendar_features(weekday):
+    """星期 (0=Mon，整欄或單一數值) → 星期特徵"""
+    return {
+        "weekday": weekday,
+        "is_weekend": np.isin(weekday, [5, 6]).astype(int),
+        "is_mon": (weekday == 0).astype(int),
+        "is_fri": (weekday == 4).astype(int)
+    }
 
-for wf, mf in zip(weather_files, market_files):
-    weather_df = pd.read_csv(wf, encoding="utf-8-sig")
-    market_df = pd.read_csv(mf, encoding="utf-8-sig")
+def stack_by_date(frames, season_col=None):
+    """{產期開始年: DataFrame} → 一張依日期排序的表，加上 日期_dt（需要時再加上產期欄）"""
+    df = pd.concat(frames.values(), keys=list(frames), names=[season_col or SEASON_COL, None])
+    df = df.reset_index(level=0, drop=season_col is None).reset_index(drop=True)
+    df = pd.concat([df, pd.Series(parse_tw_dates(df["日期"]), index=df.index, name=DATE_COL)], axis=1)
 
-    merged_df = pd.merge(market_df, weather_df, on="日期", how="left")
+    invalid = df[DATE_COL].isna()
+    if invalid.any():
+        print(f"⚠️ {invalid.sum()} 列日期無法解析，略過")
+    return df[~invalid].sort_values(DATE_COL, kind="stable", ignore_index=True)
 
-    # ===============================
-    # 新增「星期特徵」
-    # ===============================
-    merged_df["日期_dt"] = merged_df["日期"].apply(roc_to_ad)
+def merge_seasons(market_features, weather_features):
+    """{產期開始年: DataFrame} → 各產期合併後的 DataFrame（依年度排序），完全沒有對應氣象的產期跳過"""
+    if not market_features or not weather_features:
+        return []
+    market = stack_by_date(market_features, SEASON_COL)
+    weather = stack_by_date(weather_features).drop(columns="日期")
+    weather = weather.drop_duplicates(DATE_COL, keep="last")
+    weather = pd.concat([weather, weather[DATE_COL].rename(MATCHED_COL)], axis=1)
 
-    merged_df["weekday"] = merged_df["日期_dt"].dt.weekday  # 0=Mon
-    merged_df["is_weekend"] = merged_df["weekday"].isin([5, 6]).astype(int)
-    merged_df["is_mon"] = (merged_df["weekday"] == 0).astype(int)
-    merged_df["is_fri"] = (merged_df["weekday"] == 4).astype(int)
+    merged = pd.merge_asof(market, weather, on=DATE_COL, direction="backward", tolerance=WEATHER_TOLERANCE)
 
-    merged_df = merged_df.drop(columns=["日期_dt"])
+    # 星期特徵直接由日期欄計算
+    calendar = pd.DataFrame(calendar_features(merged[DATE_COL].dt.weekday), index=merged.index)
+    merged = pd.concat([merged, calendar], axis=1)
 
-    merged_list.append(merged_df)
+    merged_list = []
+    for year, season_df in merged.groupby(SEASON_COL, sort=True):
+        matched = season_df[MATCHED_COL].notna()
+        if not matched.any():
+            print(f"⚠️ {year} 產期（{season_df[DATE_COL].min():%Y-%m-%d} ~ {season_df[DATE_COL].max():%Y-%m-%d}）"
+                  "缺少氣象特徵，跳過")
+            continue
+        if not matched.all():
+            print(f"⚠️ {year} 產期有 {(~matched).sum()} 個交易日前 {WEATHER_TOLERANCE.days} 天內都沒有氣象資料，氣象特徵為空值")
+        merged_list.append(season_df.drop(columns=[SEASON_COL, DATE_COL, MATCHED_COL]).reset_index(drop=True))
+    return merged_list
 
 # ===============================
 # 切分資料
 # ===============================
-train_df = pd.concat(merged_list[:5], ignore_index=True)
-valid_df = merged_list[-2]
-test_df  = merged_list[-1]
+def split_train_valid_test(merged_list):
+    train_df = pd.concat(merged_list[:5], ignore_index=True)
+    valid_df = merged_list[-2]
+    test_df  = merged_list[-1]
+    return train_df, valid_df, test_df
+
+def write_splits(crop, train_df, valid_df, test_df):
+    return [
+        write_table(df, crop.merge_dir / split_file_name(crop, split))
+        for split, df in [("train", train_df), ("valid", valid_df), ("test", test_df)]
+    ]
+
+def cache_params(crop):
+    return {"weather_start": crop.weather_start, "STORAGE_FORMAT": STORAGE_FORMAT,
+            "weather_tolerance_days": WEATHER_TOLERANCE.days}
+
+def feature_files(crop):
+    """回傳 ({年度: 市場特徵檔}, {年度: 氣象特徵檔})；氣象只取符合作物產期起日的檔案"""
+    weather_start = crop.weather_start.replace("-", "")
+    weather_files = table_glob(crop.feature_weather_dir,
+                               f"weather_feat_{crop.weather_prefix}_avg_???{weather_start}-*")
+    market_files = table_glob(crop.feature_market_dir, f"features_daily_market_{crop.key}_*")
+    return (
+        {season_year(f.name): f for f in market_files},
+        {season_year(f.name): f for f in weather_files},
+    )
+
+def main(crop=DEFAULT_CROP):
+    market_files, weather_files = feature_files(crop)
+
+    # 所有特徵檔都沒變 → 沿用上次的 train/valid/test
+    cache = BuildCache(crop.manifest_file)
+    task = f"merge_weather_and_market:{crop.merge_dir}"
+    cache_inputs = sorted(weather_files.values()) + sorted(market_files.values()) + [Path(__file__)]
+    if cache.is_fresh(task, cache_inputs, cache_params(crop)):
+        print("⏭️ 特徵檔未變更，跳過合併")
+        return
+
+    merged_list = merge_seasons(
+        {year: read_table(f) for year, f in market_files.items()},
+        {year: read_table(f) for year, f in weather_files.items()},
+    )
+
+    train_df, valid_df, test_df = split_train_valid_test(merged_list)
+    written = write_splits(crop, train_df, valid_df, test_df)
+    cache.record(task, cache_inputs, cache_params(crop), written)
 
-train_df.to_csv(output_dir / f"train{csv_name}.csv", index=False, encoding="utf-8-sig")
-valid_df.to_csv(output_dir / f"valid{csv_name}.csv", index=False, encoding="utf-8-sig")
-test_df.to_csv(output_dir / f"test{csv_name}.csv", index=False, encoding="utf-8-sig")
+    print("✅ 合併完成（依日期對齊，含星期特徵）")
+    print(f"Train features count: {len(train_df.columns) - 1}")
+    print(train_df.columns.tolist())
 
-print("✅ 合併完成（含星期特徵）")
-print(f"Train features count: {len(train_df.columns) - 1}")
-print(train_df.columns.tolist())
+if __name__ == "__main__":
+    main(crop_from_args("合併市場與氣象特徵並切分資料"))
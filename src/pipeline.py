@@ -0,0 +1,400 @@
+import argparse
+import ast
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Callable, Optional
+
+import pandas as pd
+
+from build_cache import BuildCache, file_digest, params_digest
+from crops import CROPS, DEFAULT_CROP, get_crop, season_year
+import split_raw_market
+import split_raw_weather
+import preprocessing_market
+import preprocessing_weather
+import engineering_market
+import engineering_weather
+import merge_weather_and_market
+import train_model
+from storage import read_table, table_glob, write_table
+
+# ===============================
+# 單一行程、記憶體內的完整管線
+# 原始 .xls / 測站 CSV → 模型，中間結果預設不落地
+# 每個階段都以作物設定 (crops.CropConfig) 為第一個參數
+# ===============================
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable
+    deps: tuple = ()
+    write: Optional[Callable] = None    # 指定 --materialize 時才把結果寫到磁碟，回傳寫出的檔案
+    module: object = None               # 階段程式碼與 cache_params() 參與快取 key
+    sources: Optional[Callable] = None  # 來源階段讀取的原始檔；回傳空 list 表示該作物沒有原始檔
+    outputs: Optional[Callable] = None  # 已落地的結果檔；上游無法重算時改讀這些檔案
+    read: Optional[Callable] = None     # outputs → 與 run 相同形式的結果
+    persist: bool = False               # 最終產物，一律寫出
+
+# ===============================
+# 各階段（結果皆以「產期開始年」為 key）
+# ===============================
+def market_workbooks(crop):
+    return crop.raw_market_files
+
+def run_split_market(crop):
+    df = split_raw_market.read_market_workbooks(crop)
+    return split_raw_market.split_market_seasons(df, crop)
+
+def weather_station_files(crop):
+    return split_raw_weather.station_files(crop) if crop.raw_weather_dir.exists() else []
+
+def run_split_weather(crop):
+    """{產期開始年: {測站編號: DataFrame}}"""
+    seasons = {}
+    for file_path in weather_station_files(crop):
+        station_id = split_raw_weather.get_station_id_from_filename(file_path.name)
+        df = pd.read_csv(file_path, encoding="utf-8-sig")
+        station_seasons = split_raw_weather.split_weather_seasons(df, crop)
+
+        if station_seasons is None:
+            print(f"  ❌ {file_path.name} 時間轉換有誤，跳過該檔")
+            continue
+
+        for year, df_season in station_seasons.items():
+            seasons.setdefault(year, {})[station_id] = df_season
+    return seasons
+
+def run_preprocess_market(crop, market_seasons):
+    return {
+        year: preprocessing_market.preprocess_market(df, crop.market_products)
+        for year, df in market_seasons.items()
+    }
+
+def run_preprocess_weather(crop, weather_seasons):
+    daily = {}
+    for year, stations in weather_seasons.items():
+        dfs = [preprocessing_weather.clean_station_frame(df) for df in stations.values()]
+        dfs = [df for df in dfs if df is not None]
+        if dfs:
+            daily[year] = preprocessing_weather.aggregate_stations(dfs)
+    return daily
+
+def run_engineer_market(crop, daily_market):
+    return {
+        year: engineering_market.build_market_features(df)
+        for year, df in daily_market.items()
+    }
+
+def run_engineer_weather(crop, daily_weather):
+    return {
+        year: engineering_weather.build_weather_features(df)
+        for year, df in daily_weather.items()
+    }
+
+def run_merge(crop, market_features, weather_features):
+    merged_list = merge_weather_and_market.merge_seasons(market_features, weather_features)
+    return merge_weather_and_market.split_train_valid_test(merged_list)
+
+def run_train(crop, splits):
+    train_df, valid_df, test_df = splits
+    feature_cols = train_model.crop_feature_cols(crop, train_df.columns)
+
+    gbm = train_model.train_model(train_df, valid_df, feature_cols, train_model.model_params(crop))
+    metrics, _ = train_model.evaluate(gbm, test_df, feature_cols)
+    train_model.print_report(metrics)
+    return gbm
+
+# ===============================
+# 落地（僅在要求時）
+# ===============================
+def write_frames(frames, output_dir, name_fn):
+    """processed_data 底下的中間結果，依 STORAGE_FORMAT 寫出"""
+    return [write_table(df, Path(output_dir) / name_fn(year)) for year, df in frames.items()]
+
+def write_split_weather(crop, weather_seasons):
+    output_dir = crop.split_weather_dir
+    output_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for year, stations in weather_seasons.items():
+        for station_id, df in stations.items():
+            file_name = split_raw_weather.season_file_name(crop, station_id, year)
+            df.to_csv(output_dir / file_name, index=False, encoding="utf-8-sig")
+            written.append(output_dir / file_name)
+    return written
+
+def market_file_name(crop, prefix):
+    return lambda year: f"{prefix}{split_raw_market.season_file_name(crop, year)}"
+
+def weather_file_name(crop, prefix=""):
+    return lambda year: f"{prefix}{preprocessing_weather.season_file_name(crop, year)}"
+
+# ===============================
+# 讀回已落地的結果（作物缺原始檔時由此接續）
+# ===============================
+def weather_pattern(crop, prefix=""):
+    """只取符合作物氣象產期起日的檔案，例如 雲林芥藍_avg_???0901-*"""
+    return f"{prefix}{crop.weather_prefix}_avg_???{crop.weather_start.replace('-', '')}-*"
+
+def read_frames(files):
+    return {season_year(f.name): read_table(f) for f in files}
+
+def read_split_market(files):
+    return {season_year(f.name): pd.read_csv(f, encoding="utf-8-sig") for f in files}
+
+def read_split_weather(files):
+    seasons = {}
+    for f in files:
+        station_id = split_raw_weather.get_station_id_from_filename(f.name)
+        seasons.setdefault(season_year(f.name), {})[station_id] = pd.read_csv(f, encoding="utf-8-sig")
+    return seasons
+
+def merged_files(crop):
+    files = train_model.split_files(crop)
+    return files if all(f.exists() for f in files) else []
+
+STAGES = [
+    Stage("split_market", run_split_market,
+          write=split_raw_market.write_market_seasons,
+          module=split_raw_market, sources=market_workbooks,
+          outputs=lambda c: sorted(c.split_market_dir.glob(f"market_{c.key}_*.csv")),
+          read=read_split_market),
+    Stage("preprocess_market", run_preprocess_market, ("split_market",),
+          write=lambda c, r: write_frames(r, c.preprocess_market_dir, market_file_name(c, "daily_")),
+          module=preprocessing_market,
+          outputs=lambda c: table_glob(c.preprocess_market_dir, f"daily_market_{c.key}_*"),
+          read=read_frames),
+    Stage("engineer_market", run_engineer_market, ("preprocess_market",),
+          write=lambda c, r: write_frames(r, c.feature_market_dir, market_file_name(c, "features_daily_")),
+          module=engineering_market,
+          outputs=lambda c: table_glob(c.feature_market_dir, f"features_daily_market_{c.key}_*"),
+          read=read_frames),
+    Stage("split_weather", run_split_weather,
+          write=write_split_weather,
+          module=split_raw_weather, sources=weather_station_files,
+          outputs=lambda c: sorted(c.split_weather_dir.glob("daily_*.csv")),
+          read=read_split_weather),
+    Stage("preprocess_weather", run_preprocess_weather, ("split_weather",),
+          write=lambda c, r: write_frames(r, c.preprocess_weather_dir, weather_file_name(c)),
+          module=preprocessing_weather,
+          outputs=lambda c: table_glob(c.preprocess_weather_dir, weather_pattern(c)),
+          read=read_frames),
+    Stage("engineer_weather", run_engineer_weather, ("preprocess_weather",),
+          write=lambda c, r: write_frames(r, c.feature_weather_dir, weather_file_name(c, "weather_feat_")),
+          module=engineering_weather,
+          outputs=lambda c: table_glob(c.feature_weather_dir, weather_pattern(c, "weather_feat_")),
+          read=read_frames),
+    Stage("merge", run_merge, ("engineer_market", "engineer_weather"),
+          write=lambda c, r: merge_weather_and_market.write_splits(c, *r),
+          module=merge_weather_and_market,
+          outputs=merged_files,
+          read=lambda files: tuple(read_table(f) for f in files)),
+    Stage("train", run_train, ("merge",),
+          write=lambda c, gbm: [train_model.save_model(gbm, c.model_file)],
+          module=train_model, persist=True),
+]
+
+# ===============================
+# 階段程式碼的快取 key
+# ===============================
+SRC_DIR = Path(__file__).resolve().parent
+
+def local_imports(path):
+    """檔案中 import 的 src/ 內模組（flat import，例如 from feature_spec import ...）"""
+    names = set()
+    for node in ast.walk(ast.parse(Path(path).read_text(encoding="utf-8"))):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            names.add(node.module.split(".")[0])
+    return {SRC_DIR / f"{name}.py" for name in names if (SRC_DIR / f"{name}.py").exists()}
+
+def code_files(module):
+    """階段模組 + 它直接或間接 import 的 src/ 模組 + pipeline.py 本身（各階段的 run_* 包裝在這裡）
+
+    pipeline.py 只算自己，不展開它的 import，否則每個階段都會依賴所有模組
+    """
+    pending = [Path(module.__file__).resolve()]
+    seen = {Path(__file__).resolve()}
+    while pending:
+        path = pending.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        pending.extend(local_imports(path) - seen)
+    return sorted(seen)
+
+def code_digest(module):
+    """任一相關 src/ 模組改動（例如 feature_spec.py、tw_date.py）都會讓階段重算"""
+    return {p.name: file_digest(p) for p in code_files(module)}
+
+# ===============================
+# DAG 執行
+# ===============================
+def resolve_order(stages, targets=None):
+    """回傳執行 targets（預設全部）所需的階段，依相依關係排序"""
+    by_name = {s.name: s for s in stages}
+    order, visiting = [], set()
+
+    def visit(name):
+        if name in visiting:
+            raise ValueError(f"❌ 階段相依出現循環：{name}")
+        if name in order:
+            return
+        if name not in by_name:
+            raise KeyError(f"❌ 未知的階段：{name}")
+        visiting.add(name)
+        for dep in by_name[name].deps:
+            visit(dep)
+        visiting.discard(name)
+        order.append(name)
+
+    for name in targets or by_name:
+        visit(name)
+    return [by_name[name] for name in order]
+
+def plan_stages(order, crop):
+    """決定每個階段要重算還是讀回已落地結果，並計算快取 key
+
+    快取 key = 作物設定 + 原始檔內容 + 階段程式碼 + 參數 + 上游 key；
+    讀回的階段以那些檔案的內容為 key。上游與落地檔都沒有的階段不列入。
+    回傳 (可執行的階段, {階段: key}, {讀回的階段: 檔案})
+    """
+    planned, keys, loaded = [], {}, {}
+    for stage in order:
+        parts = {"crop": asdict(crop)}
+        sources = stage.sources(crop) if stage.sources is not None else None
+        runnable = all(d in keys for d in stage.deps) and sources != []
+
+        if runnable:
+            parts["deps"] = [keys[d] for d in stage.deps]
+            if stage.module is not None:
+                parts["code"] = code_digest(stage.module)
+                parts["params"] = stage.module.cache_params(crop)
+            if sources:
+                parts["sources"] = {str(p): file_digest(p) for p in sources}
+            planned.append(stage)
+        else:
+            files = stage.outputs(crop) if stage.outputs is not None else []
+            if not files:
+                continue
+            parts["loaded"] = {str(p): file_digest(p) for p in files}
+            loaded[stage.name] = files
+            planned.append(replace(stage, deps=()))
+
+        keys[stage.name] = params_digest(parts)
+    return planned, keys, loaded
+
+def run_pipeline(crop=DEFAULT_CROP, targets=None, materialize=(), stages=STAGES, cache=None):
+    """依 DAG 順序執行單一作物的各階段，DataFrame 全程留在記憶體，回傳 {階段名稱: 結果}
+
+    需要落地的階段若輸入與設定都未變、上次的輸出也還在，就整段跳過（連同只為它而跑的上游）。
+    作物缺原始檔時，從最近一個已落地的階段接續。
+    """
+    cache = cache or BuildCache(crop.manifest_file)
+    order = resolve_order(stages, targets)
+    planned, keys, loaded = plan_stages(order, crop)
+    by_name = {s.name: s for s in planned}
+
+    missing = [s.name for s in order if s.name not in by_name]
+    if missing:
+        print(f"⚠️ {crop.key} 缺少資料，略過：{', '.join(missing)}")
+
+    def wants_write(stage):
+        return (stage.write and stage.name not in loaded
+                and (stage.persist or "all" in materialize or stage.name in materialize))
+
+    # 1. 找出真正要產出的階段，已是最新的直接略過
+    goals = [s.name for s in planned if wants_write(s) or s.name in (targets or [])]
+    stale_goals = []
+    for name in goals:
+        # 只在記憶體中的階段沒有可沿用的產出，一律要跑
+        if wants_write(by_name[name]) and cache.is_fresh(f"pipeline:{name}", [], {"key": keys[name]}):
+            print(f"⏭️ {crop.key} {name} 的輸入與設定未變更，跳過")
+        else:
+            stale_goals.append(name)
+
+    results = {}
+    if not stale_goals and goals:
+        return results
+
+    # 2. 只執行未更新產出所需的階段
+    for stage in resolve_order(planned, stale_goals or None):
+        start = time.perf_counter()
+        if stage.name in loaded:
+            results[stage.name] = stage.read(loaded[stage.name])
+            print(f"📂 {crop.key} {stage.name} 讀取已落地結果 ({len(loaded[stage.name])} 檔)")
+            continue
+
+        results[stage.name] = stage.run(crop, *(results[d] for d in stage.deps))
+
+        if wants_write(stage):
+            written = stage.write(crop, results[stage.name])
+            cache.record(f"pipeline:{stage.name}", [], {"key": keys[stage.name]}, written)
+            print(f"  💾 已寫出 {crop.key} {stage.name} 結果")
+
+        print(f"✅ {crop.key} {stage.name} 完成 ({time.perf_counter() - start:.2f}s)")
+    return results
+
+# ===============================
+# 多作物：每個作物一個行程
+# ===============================
+def run_crop(crop_key, targets=None, materialize=(), force=None):
+    crop = get_crop(crop_key)
+    run_pipeline(crop, targets, materialize, cache=BuildCache(crop.manifest_file, force=force))
+    return crop_key
+
+def run_crops(crop_keys, workers=None, **kwargs):
+    """以最多 workers 個行程平行處理各作物，回傳失敗的作物"""
+    workers = max(1, min(workers or os.cpu_count() or 1, len(crop_keys)))
+    failed = []
+
+    def report(key, result):
+        try:
+            result()
+            print(f"🌱 {key} 完成")
+        except Exception as e:
+            print(f"❌ {key} 失敗：{e}")
+            failed.append(key)
+
+    if workers == 1:
+        for key in crop_keys:
+            report(key, lambda: run_crop(key, **kwargs))
+        return failed
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_crop, key, **kwargs): key for key in crop_keys}
+        for future in as_completed(futures):
+            report(futures[future], future.result)
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="從原始資料一路跑到模型的記憶體內管線")
+    parser.add_argument("--crop", nargs="*", default=[DEFAULT_CROP.key],
+                        help=f"要處理的作物，all 代表全部（{', '.join(CROPS)}）")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="同時處理的作物數，預設為 CPU 核心數")
+    parser.add_argument("--until", nargs="*", default=None,
+                        help="只執行到指定階段（含其上游），預設跑完整條管線")
+    parser.add_argument("--materialize", default="",
+                        help="要寫到磁碟的階段，以逗號分隔；all 代表全部")
+    parser.add_argument("--force", action="store_true",
+                        help="忽略建置快取，全部重跑")
+    args = parser.parse_args()
+
+    crop_keys = list(CROPS) if "all" in args.crop else args.crop
+    for key in crop_keys:
+        get_crop(key)
+
+    materialize = {s.strip() for s in args.materialize.split(",") if s.strip()}
+    failed = run_crops(crop_keys, args.workers, targets=args.until,
+                       materialize=materialize, force=args.force or None)
+    if failed:
+        raise SystemExit(f"❌ 失敗的作物：{', '.join(failed)}")
+    print("\n🎉 管線執行完成！")
+
+if __name__ == "__main__":
+    main()
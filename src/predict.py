@@ -0,0 +1,206 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from crops import CROPS, DATA_DIR, FINAL_PREDICT_DIR, get_crop
+from engineering_market import TARGET_COL
+from forecast import RecursiveForecaster, crop_history
+from merge_weather_and_market import split_file_name
+from prediction_store import LOWER_COL, UPPER_COL, interval_width, refresh_store
+from storage import read_table, table_path
+from tw_date import parse_tw_dates
+
+# ===============================
+# 批次預測
+# 每個作物載入一次 booster：
+#   1. 回測：最新產期（合併後的 test split）整塊 predict 一次 → dataset/predict/<作物>/test_with_prediction.csv
+#   2. 未來預測：最後一個交易日之後 horizon 個交易日的遞迴預測（forecast.py），預測區間寬度取回測 |殘差| 的分位數
+#      → app/finalPredict/<中文名>_full_prediction.csv（前端讀取的資料夾，與執行目錄無關）
+# 最後更新該資料夾的 predictions.sqlite（前端讀取的彙整預測庫，見 prediction_store.py）
+# --global 只做回測，寫到 dataset/predict/global/<作物>/，不覆蓋單獨模型的結果
+# ===============================
+PRED_COL = "預測價格"
+BACKTEST_SPLIT = "test"
+PREDICT_HORIZON = 14  # 未來預測的交易日數
+GLOBAL_PREDICT_DIR = DATA_DIR / "predict" / "global"
+
+def backtest_source(crop):
+    return table_path(crop.merge_dir / split_file_name(crop, BACKTEST_SPLIT))
+
+def feature_table(crop):
+    """train / valid / test 合併成一張依日期排序的特徵表（每個日期一列）"""
+    files = [table_path(crop.merge_dir / split_file_name(crop, split)) for split in ("train", "valid", "test")]
+    frames = [read_table(f) for f in files if f.exists()]
+    if not frames:
+        raise FileNotFoundError(f"❌ {crop.key} 沒有合併後的特徵資料")
+    df = pd.concat(frames, ignore_index=True)
+    df = pd.concat([df, pd.Series(parse_tw_dates(df["日期"]), index=df.index, name="日期_dt")], axis=1)
+    return df.dropna(subset=["日期_dt"]).drop_duplicates("日期_dt", keep="last").sort_values("日期_dt")
+
+def predictable_crops():
+    """有模型檔也有回測資料的作物"""
+    return [key for key, crop in CROPS.items()
+            if crop.model_file.exists() and backtest_source(crop).exists()]
+
+def load_booster(model_file):
+    import lightgbm as lgb
+    return lgb.Booster(model_file=str(model_file))
+
+def feature_matrix(gbm, df):
+    """依模型記錄的特徵名稱與順序取出特徵欄位"""
+    feature_cols = gbm.feature_name()
+    missing = [c for c in feature_cols if c not in df.columns]
+    if missing:
+        raise KeyError(f"❌ 預測資料缺少 {len(missing)} 個模型特徵，例如：{', '.join(missing[:3])}")
+    return df[feature_cols]
+
+def predict_frame(gbm, df):
+    """整個回測區間一次 predict，回傳加上 預測價格 欄位的 DataFrame"""
+    num_iteration = gbm.best_iteration if gbm.best_iteration > 0 else None
+    y_pred = gbm.predict(feature_matrix(gbm, df), num_iteration=num_iteration)
+    return pd.concat([df, pd.Series(y_pred, index=df.index, name=PRED_COL)], axis=1)
+
+def forecast_frame(gbm, crop, backtest, horizon=PREDICT_HORIZON):
+    """最後一個交易日之後 horizon 個交易日的預測與預測區間（日期、預測價格、預測下限、預測上限）"""
+    market, weather = crop_history(crop)
+    future = RecursiveForecaster(gbm, market, weather).forecast(horizon)
+    width = interval_width(backtest[TARGET_COL], backtest[PRED_COL])
+    future[LOWER_COL] = (future[PRED_COL] - width).clip(lower=0)
+    future[UPPER_COL] = future[PRED_COL] + width
+    return future
+
+def write_backtest(crop, predicted, output_dir=None):
+    """預設寫到 crop.prediction_file；指定 output_dir 時寫到 output_dir/<作物>/ 底下的同名檔"""
+    path = Path(output_dir) / crop.key / crop.prediction_file.name if output_dir else crop.prediction_file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    predicted.to_csv(path, index=False, encoding="utf-8-sig")
+    return path
+
+def write_forecast(crop, future, output_dir=None):
+    path = Path(output_dir or FINAL_PREDICT_DIR) / crop.forecast_file.name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    future.to_csv(path, index=False, encoding="utf-8-sig")
+    return path
+
+def predict_crop(crop_key, output_dir=None, horizon=PREDICT_HORIZON):
+    """單一作物：載入模型 → 回測 → 未來預測 → 寫檔，回傳 (作物, 未來預測筆數, 秒數)"""
+    start = time.perf_counter()
+    crop = get_crop(crop_key)
+
+    gbm = load_booster(crop.model_file)
+    backtest = predict_frame(gbm, read_table(backtest_source(crop)))
+    write_backtest(crop, backtest)
+    future = forecast_frame(gbm, crop, backtest, horizon)
+    write_forecast(crop, future, output_dir)
+    return crop_key, len(future), time.perf_counter() - start
+
+# ===============================
+# 全域模型：一次載入、所有作物一次 predict
+# ===============================
+def global_model_files(crop_keys, model_file=None):
+    """{模型檔: [作物, ...]}：有 fine-tune 模型（lgb_model_global_<作物>.txt）的作物用自己的，
+    其餘共用全域模型；指定 model_file 時所有作物都用它"""
+    from global_model import GLOBAL_MODEL_FILE, finetune_model_file
+
+    groups = {}
+    for key in crop_keys:
+        tuned = finetune_model_file(get_crop(key))
+        chosen = model_file or (tuned if tuned.exists() else GLOBAL_MODEL_FILE)
+        groups.setdefault(Path(chosen), []).append(key)
+    return groups
+
+def predict_global(crop_keys, model_file=None, output_dir=GLOBAL_PREDICT_DIR):
+    """以 global_model.py 的全域模型（或各作物的 fine-tune 模型）回測，寫到 output_dir/<作物>/，
+    回傳 {作物: (模型檔名, 筆數)}"""
+    from global_model import global_matrix
+
+    counts = {}
+    for path, keys in global_model_files(crop_keys, model_file).items():
+        # 共用同一個模型的作物一次 predict
+        gbm = load_booster(path)
+        frames = {key: read_table(backtest_source(get_crop(key))) for key in keys}
+        matrix = pd.concat([global_matrix(gbm, df, key) for key, df in frames.items()], ignore_index=True)
+        y_pred = gbm.predict(matrix, num_iteration=gbm.best_iteration if gbm.best_iteration > 0 else None)
+
+        offset = 0
+        for key, df in frames.items():
+            pred = pd.Series(y_pred[offset:offset + len(df)], index=df.index, name=PRED_COL)
+            write_backtest(get_crop(key), pd.concat([df, pred], axis=1), output_dir)
+            counts[key], offset = (path.name, len(df)), offset + len(df)
+    return counts
+
+# ===============================
+# 多作物：每個作物一個行程
+# ===============================
+def predict_crops(crop_keys, workers=None, output_dir=None, horizon=PREDICT_HORIZON):
+    """以最多 workers 個行程平行預測各作物，回傳失敗的作物"""
+    workers = max(1, min(workers or os.cpu_count() or 1, len(crop_keys)))
+    failed = []
+
+    def report(key, result):
+        try:
+            _, n_rows, seconds = result()
+            print(f"✅ {key} 預測完成：未來 {n_rows} 個交易日 ({seconds:.2f}s)")
+        except Exception as e:
+            print(f"❌ {key} 預測失敗：{e}")
+            failed.append(key)
+
+    if workers == 1:
+        for key in crop_keys:
+            report(key, lambda: predict_crop(key, output_dir, horizon))
+        return failed
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(predict_crop, key, output_dir, horizon): key for key in crop_keys}
+        for future in as_completed(futures):
+            report(futures[future], future.result)
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="載入各作物模型，回測最新產期並預測未來幾個交易日")
+    parser.add_argument("--crop", nargs="*", default=["all"],
+                        help=f"要預測的作物，all 代表所有有模型的作物（{', '.join(CROPS)}）")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="同時預測的作物數，預設為 CPU 核心數")
+    parser.add_argument("--horizon", type=int, default=PREDICT_HORIZON,
+                        help=f"未來預測的交易日數，預設 {PREDICT_HORIZON}")
+    parser.add_argument("--output-dir", default=None,
+                        help=f"未來預測 _full_prediction.csv 的輸出資料夾，預設 {FINAL_PREDICT_DIR}"
+                             f"（--global 時為回測結果的資料夾，預設 {GLOBAL_PREDICT_DIR}）")
+    parser.add_argument("--global", dest="use_global", action="store_true",
+                        help="改用 global_model.py 訓練的全域模型回測（一次載入、所有作物一次 predict；"
+                             "有 fine-tune 模型的作物改用自己的）")
+    args = parser.parse_args()
+
+    if args.use_global:
+        crop_keys = ([key for key in CROPS if backtest_source(CROPS[key]).exists()]
+                     if "all" in args.crop else args.crop)
+        start = time.perf_counter()
+        output_dir = Path(args.output_dir or GLOBAL_PREDICT_DIR)
+        for key, (model_name, n_rows) in predict_global(crop_keys, output_dir=output_dir).items():
+            print(f"✅ {key} 回測完成：{n_rows} 筆（{model_name}）")
+        print(f"\n🎉 全域模型 {len(crop_keys)} 個作物回測完成，結果在 {output_dir} ({time.perf_counter() - start:.2f}s)")
+        return
+
+    crop_keys = predictable_crops() if "all" in args.crop else args.crop
+    for key in crop_keys:
+        get_crop(key)
+
+    if not crop_keys:
+        print("⚠ 沒有同時具備模型與回測資料的作物")
+        return
+
+    start = time.perf_counter()
+    output_dir = Path(args.output_dir or FINAL_PREDICT_DIR)
+    failed = predict_crops(crop_keys, args.workers, output_dir, args.horizon)
+    print(f"📦 預測庫已更新：{refresh_store(output_dir)}")
+    if failed:
+        raise SystemExit(f"❌ 失敗的作物：{', '.join(failed)}")
+    print(f"\n🎉 {len(crop_keys)} 個作物預測完成 ({time.perf_counter() - start:.2f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from crops import CROPS, FINAL_PREDICT_DIR
+from tw_date import parse_tw_dates
+
+# ===============================
+# 預測結果彙整庫（SQLite）
+# 各作物 finalPredict/<中文名>_full_prediction.csv 有六十多欄，前端只需要 日期 與 預測價格；
+# 這裡把所有作物的 日期、預測價格、預測區間 彙整到同一個小檔 app/finalPredict/predictions.sqlite，
+# 主鍵 (crop, date) 即「各作物接下來 N 天」查詢的索引
+# 來源 CSV 的 mtime / 大小記錄在 sources 表，CSV 有更新才重建（整檔重寫後 os.replace，讀取端不會讀到寫一半的檔）
+# 各作物接下來 SUMMARY_DAYS 天的趨勢與最佳購買日也在建置時算好（summaries 表），前端直接讀取
+# 預測 CSV 是最後一個交易日之後的未來預測（predict.py），「接下來 N 天」即各作物最早的 N 天
+# ===============================
+STORE_NAME = "predictions.sqlite"
+STORE_VERSION = 3  # 表格結構或內容定義改變時遞增，舊版預測庫會自動重建
+PRED_COL = "預測價格"
+ACTUAL_COL = "價格(元/公斤)"
+LOWER_COL, UPPER_COL = "預測下限", "預測上限"
+INTERVAL_LEVEL = 0.8  # 預測區間：預測價格 ± 回測 |殘差| 的 80% 分位數
+SUMMARY_DAYS = 5         # 前端「未來五天」摘要的天數
+TREND_THRESHOLD = 5.0    # 首尾價格變動超過 ±5% 視為上漲 / 下跌
+
+SCHEMA = f"""
+PRAGMA user_version = {STORE_VERSION};
+CREATE TABLE predictions (
+    crop TEXT NOT NULL,
+    name TEXT NOT NULL,
+    date TEXT NOT NULL,       -- 西元 YYYY-MM-DD，排序用
+    roc_date TEXT NOT NULL,   -- 民國日期（與 CSV 的 日期 欄相同）
+    price REAL NOT NULL,
+    lower REAL,
+    upper REAL,
+    PRIMARY KEY (crop, date)
+) WITHOUT ROWID;
+CREATE TABLE sources (
+    file TEXT PRIMARY KEY,
+    crop TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE summaries (
+    crop TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    days INTEGER NOT NULL,
+    trend TEXT NOT NULL,      -- 上漲 / 下跌 / 平穩
+    change_rate REAL NOT NULL,
+    current_price REAL NOT NULL,
+    best_date TEXT NOT NULL,  -- 最低預測價格的民國日期
+    best_price REAL NOT NULL
+);
+"""
+
+UPCOMING_SQL = """
+SELECT crop, name, roc_date, price, lower, upper FROM (
+    SELECT *, ROW_NUMBER() OVER (PARTITION BY crop ORDER BY date) AS n FROM predictions
+)
+WHERE n <= ?
+ORDER BY crop, date
+"""
+
+def store_file(directory=FINAL_PREDICT_DIR):
+    return Path(directory) / STORE_NAME
+
+def source_files(directory=FINAL_PREDICT_DIR):
+    """{作物 key: 該資料夾中的 _full_prediction.csv}（只列出存在的檔案）"""
+    directory = Path(directory)
+    files = {key: directory / crop.forecast_file.name for key, crop in CROPS.items()}
+    return {key: f for key, f in files.items() if f.exists()}
+
+def file_signature(path):
+    stat = Path(path).stat()
+    return stat.st_mtime_ns, stat.st_size
+
+# ===============================
+# 建置
+# ===============================
+def interval_width(actual, predicted, level=INTERVAL_LEVEL):
+    """|實際 − 預測| 的 level 分位數；沒有實際價格時為 NaN"""
+    residual = np.abs(np.asarray(actual, dtype="float64") - np.asarray(predicted, dtype="float64"))
+    residual = residual[~np.isnan(residual)]
+    return float(np.quantile(residual, level)) if residual.size else np.nan
+
+def prediction_rows(crop_key, csv_file):
+    """單一作物的預測 CSV → 預測庫的列（只讀需要的欄位）
+
+    predict.py 的未來預測已附 預測下限 / 預測上限；舊格式（含實際價格）的 CSV 以自身殘差計算區間。
+    """
+    wanted = {"日期", PRED_COL, ACTUAL_COL, LOWER_COL, UPPER_COL}
+    df = pd.read_csv(csv_file, encoding="utf-8-sig", usecols=lambda c: c in wanted)
+    df = df.dropna(subset=[PRED_COL])
+    dates = pd.DatetimeIndex(parse_tw_dates(df["日期"]))
+    df, dates = df[~dates.isna()], dates[~dates.isna()]
+
+    price = df[PRED_COL].to_numpy(dtype="float64")
+    if LOWER_COL in df.columns and UPPER_COL in df.columns:
+        lower, upper = df[LOWER_COL].to_numpy(dtype="float64"), df[UPPER_COL].to_numpy(dtype="float64")
+    else:
+        width = interval_width(df[ACTUAL_COL], price) if ACTUAL_COL in df.columns else np.nan
+        lower, upper = np.maximum(price - width, 0.0), price + width
+
+    crop = CROPS[crop_key]
+    return [(crop_key, crop.name or crop_key, d, roc, p, None if np.isnan(lo) else lo, None if np.isnan(hi) else hi)
+            for d, roc, p, lo, hi in zip(dates.strftime("%Y-%m-%d"), df["日期"], price, lower, upper)]
+
+def price_trend(prices):
+    """(趨勢, 首尾變動 %)"""
+    if len(prices) < 2 or prices[0] == 0:
+        return "平穩", 0.0
+    change_rate = (prices[-1] - prices[0]) / prices[0] * 100
+    if change_rate > TREND_THRESHOLD:
+        return "上漲", change_rate
+    if change_rate < -TREND_THRESHOLD:
+        return "下跌", change_rate
+    return "平穩", change_rate
+
+def summary_row(rows, days=SUMMARY_DAYS):
+    """單一作物預測庫的列 → summaries 表的一列（接下來 days 天的趨勢與最低價日期）"""
+    latest = sorted(rows, key=lambda row: row[2])[:days]
+    prices = [row[4] for row in latest]
+    trend, change_rate = price_trend(prices)
+    best = prices.index(min(prices))
+    crop_key, name = latest[0][:2]
+    return crop_key, name, len(latest), trend, change_rate, prices[0], latest[best][3], prices[best]
+
+def build_store(directory=FINAL_PREDICT_DIR):
+    """重建整個預測庫，回傳 (預測庫路徑, 筆數)"""
+    directory = Path(directory)
+    sources = source_files(directory)
+    target = store_file(directory)
+
+    # 同資料夾的暫存檔寫好後再換上，其他行程 / 執行緒不會讀到寫一半的檔
+    fd, tmp = tempfile.mkstemp(prefix=f".{STORE_NAME}.", dir=directory)
+    os.close(fd)
+    n_rows = 0
+    try:
+        with closing(sqlite3.connect(tmp)) as conn:
+            conn.executescript(SCHEMA)
+            for key, csv_file in sources.items():
+                # 先記錄檔案狀態再讀：讀取期間 CSV 又被改寫時，下次檢查仍會判定過期
+                conn.execute("INSERT INTO sources VALUES (?, ?, ?, ?)", (csv_file.name, key, *file_signature(csv_file)))
+                rows = prediction_rows(key, csv_file)
+                conn.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                if rows:
+                    conn.execute("INSERT INTO summaries VALUES (?, ?, ?, ?, ?, ?, ?, ?)", summary_row(rows))
+                n_rows += len(rows)
+            conn.commit()
+        os.chmod(tmp, 0o644)  # mkstemp 預設只有擁有者可讀
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return target, n_rows
+
+def is_fresh(directory=FINAL_PREDICT_DIR):
+    """預測庫存在，且記錄的來源 CSV 與目前的檔案（mtime、大小、有哪些檔）完全一致"""
+    target = store_file(directory)
+    if not target.exists():
+        return False
+    current = {f.name: (key, *file_signature(f)) for key, f in source_files(directory).items()}
+    try:
+        with connect_readonly(target) as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != STORE_VERSION:
+                return False
+            recorded = {row[0]: tuple(row[1:]) for row in conn.execute("SELECT file, crop, mtime_ns, size FROM sources")}
+    except sqlite3.DatabaseError:
+        return False
+    return recorded == current
+
+def refresh_store(directory=FINAL_PREDICT_DIR):
+    """來源 CSV 有變動時才重建，回傳預測庫路徑"""
+    if not is_fresh(directory):
+        build_store(directory)
+    return store_file(directory)
+
+# ===============================
+# 查詢
+# ===============================
+def connect_readonly(path):
+    return closing(sqlite3.connect(f"file:{Path(path).resolve()}?mode=ro", uri=True))
+
+def upcoming_predictions(path, days=5):
+    """所有作物各自接下來 days 天的預測，欄位：crop、蔬菜、日期、預測價格、預測下限、預測上限"""
+    with connect_readonly(path) as conn:
+        df = pd.read_sql_query(UPCOMING_SQL, conn, params=(days,))
+    return df.rename(columns={"name": "蔬菜", "roc_date": "日期", "price": PRED_COL,
+                              "lower": LOWER_COL, "upper": UPPER_COL})
+
+def load_summaries(path):
+    """建置時算好的各作物摘要：crop、name、days、trend、change_rate、current_price、best_date、best_price"""
+    with connect_readonly(path) as conn:
+        return pd.read_sql_query("SELECT * FROM summaries ORDER BY crop", conn)
+
+def main():
+    parser = argparse.ArgumentParser(description="把各作物的預測 CSV 彙整成一個 SQLite 預測庫")
+    parser.add_argument("--dir", nargs="*", default=[str(FINAL_PREDICT_DIR)],
+                        help=f"放 _full_prediction.csv 的資料夾，預設 {FINAL_PREDICT_DIR}")
+    parser.add_argument("--days", type=int, default=5, help="顯示各作物接下來幾天的預測，預設 5")
+    parser.add_argument("--force", action="store_true", help="來源 CSV 沒有變動也重建")
+    args = parser.parse_args()
+
+    for directory in args.dir:
+        if not source_files(directory):
+            print(f"⚠️ {directory} 沒有任何 _full_prediction.csv，略過")
+            continue
+        start = time.perf_counter()
+        if args.force or not is_fresh(directory):
+            target, n_rows = build_store(directory)
+            print(f"✅ {target}：{n_rows} 筆 ({time.perf_counter() - start:.2f}s)")
+        else:
+            target = store_file(directory)
+            print(f"⏭️ 來源 CSV 未變更，沿用 {target}")
+        print(upcoming_predictions(target, args.days).to_string(index=False))
+        print(load_summaries(target).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
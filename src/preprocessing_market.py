@@ -1,67 +1,138 @@
+import argparse
 import pandas as pd
 from pathlib import Path
 
+from build_cache import BuildCache
+from crops import DEFAULT_CROP, add_crop_argument, get_crop
+from split_raw_market import season_file_name
+from storage import STORAGE_FORMAT, table_path, write_table
+from tw_date import parse_tw_dates
+
 # -------------------------------
 # 設定輸入與輸出
 # -------------------------------
-INPUT_DIR = Path("dataset/raw_data/split_market/Kai-lan")
-OUTPUT_DIR = Path("dataset/processed_data/preprocessing/market/Kai-lan")
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+# 輸入 crop.split_market_dir → 輸出 crop.preprocess_market_dir（見 crops.py）
+# 或以 --export 直接讀取全國行情匯出檔（所有市場、所有產品、多年度），分塊串流彙總
+
+# 串流模式每次讀取的列數，記憶體用量只和這個數字與天數有關，與檔案大小無關
+CHUNK_SIZE = 200_000
+
+# 彙總後的統一欄位名稱
+RENAME = {
+    "avg": "價格(元/公斤)",
+    "high": "上價",
+    "mid": "中價",
+    "low": "下價",
+    "vol": "交易量(公斤)",
+}
+
+def cache_params(crop):
+    return {"market_products": crop.market_products, "STORAGE_FORMAT": STORAGE_FORMAT}
+
+# -------------------------------
+# 欄位對應與清理（一次性 / 串流共用）
+# -------------------------------
+def resolve_columns(columns):
+    """模糊匹配必要欄位，回傳 (日期欄, 產品欄, {avg/high/mid/low/vol: 原始欄名})"""
+    date_col = next(c for c in columns if '日' in c and '期' in c)
+    product_col = next((c for c in columns if '產' in c and '品' in c), None)
+    value_cols = {
+        "avg": next(c for c in columns if '平均價' in c),
+        "high": next((c for c in columns if '上價' in c), None),
+        "mid": next((c for c in columns if '中價' in c), None),
+        "low": next((c for c in columns if '下價' in c), None),
+        "vol": next((c for c in columns if '交易量' in c), None),
+    }
+    return date_col, product_col, {k: c for k, c in value_cols.items() if c is not None}
+
+def filter_products(df, product_col, products):
+    """只保留產品代號（例如 "LK2 芥藍菜" 的 LK2）在 products 內的列；沒有產品欄或未指定時不篩選"""
+    if not products or product_col is None:
+        return df
+    # 以 extract 取第一段：串流時某一塊的產品欄可能全是空值（例如檔尾的小計列），split 後會變成 float 欄
+    codes = df[product_col].astype(str).str.extract(r"^\s*(\S+)", expand=False)
+    return df[codes.isin([p.split()[0] for p in products])]
+
+def clean_market_rows(df, date_col, value_cols):
+    """轉數值 (處理可能出現的 '-' 或 非數字字元)，並移除無效與非日期列"""
+    df = df[[date_col, *value_cols.values()]].copy()
+    for c in value_cols.values():
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+
+    df = df.dropna(subset=[date_col, value_cols["avg"]])
+    # 只保留包含斜線的日期格式
+    return df[df[date_col].astype(str).str.contains("/")]
+
+def finalize_daily(daily, date_col, value_cols):
+    """統一欄位名稱並計算價格區間"""
+    daily = daily.reset_index().rename(columns={date_col: "日期", **{c: RENAME[k] for k, c in value_cols.items()}})
+    if "上價" in daily.columns and "下價" in daily.columns:
+        daily["價格區間"] = daily["上價"] - daily["下價"]
+    return daily
 
 # -------------------------------
 # 主處理函式
 # -------------------------------
-def process_market_file(file_path):
+def preprocess_market(df, products=()):
+    """單一產期原始行情 → 每日平均行情"""
+    df.columns = [str(c).strip() for c in df.columns]
+    date_col, product_col, value_cols = resolve_columns(df.columns)
+
+    df = clean_market_rows(filter_products(df, product_col, products), date_col, value_cols)
+
+    # 每日平均 (避免同日有多個市場資料)
+    daily = df.groupby(date_col).mean()
+    return finalize_daily(daily, date_col, value_cols)
+
+def stream_preprocess_market(path, products=(), chunksize=CHUNK_SIZE, encoding="utf-8-sig"):
+    """分塊讀取大型行情 CSV，逐塊累加每日加總與筆數，最後再除出每日平均"""
+    raw_header = pd.read_csv(path, nrows=0, encoding=encoding).columns
+    header = [str(c).strip() for c in raw_header]
+    date_col, product_col, value_cols = resolve_columns(header)
+    use_cols = [date_col, *value_cols.values()] + ([product_col] if product_col and products else [])
+
+    # usecols / dtype 以檔案中的原始欄名指定（AMIS 匯出的欄名前後可能帶空白），民國日期才會以字串讀入
+    raw_date_col = raw_header[header.index(date_col)]
+    sums = counts = None
+    reader = pd.read_csv(path, encoding=encoding, chunksize=chunksize,
+                         usecols=lambda c: str(c).strip() in use_cols, dtype={raw_date_col: str})
+    for chunk in reader:
+        chunk.columns = [str(c).strip() for c in chunk.columns]
+        chunk = clean_market_rows(filter_products(chunk, product_col, products), date_col, value_cols)
+
+        # NaN 不計入加總與筆數，結果與整檔 groupby().mean() 相同
+        grouped = chunk.groupby(date_col)
+        chunk_sums, chunk_counts = grouped.sum(), grouped.count()
+        if sums is None:
+            sums, counts = chunk_sums, chunk_counts
+        else:
+            sums = sums.add(chunk_sums, fill_value=0)
+            counts = counts.add(chunk_counts, fill_value=0)
+
+    if sums is None:
+        sums = counts = pd.DataFrame(columns=list(value_cols.values()), index=pd.Index([], name=date_col))
+
+    daily = (sums / counts.where(counts > 0)).sort_index()
+    return finalize_daily(daily, date_col, value_cols)
+
+def process_market_file(crop, file_path, cache):
+    # 輸出檔案 (檔名前綴加上 daily_)
+    output_file = table_path(crop.preprocess_market_dir / f"daily_{file_path.name}")
+
+    task = f"preprocessing_market:{file_path}"
+    cache_inputs = [file_path, __file__]
+    if cache.is_fresh(task, cache_inputs, cache_params(crop)):
+        print(f"  ⏭️ 未變更，跳過：{output_file.name}")
+        return
+
     # 改為讀取 CSV (因為前一步已經處理過 utf-8-sig)
     df = pd.read_csv(file_path, encoding="utf-8-sig")
-    df.columns = [str(c).strip() for c in df.columns]
 
     try:
-        # 1. 找必要欄位 (使用模糊匹配)
-        date_col = next(c for c in df.columns if '日' in c and '期' in c)
-        avg_col = next(c for c in df.columns if '平均價' in c)
-        high_col = next((c for c in df.columns if '上價' in c), None)
-        mid_col  = next((c for c in df.columns if '中價' in c), None)
-        low_col  = next((c for c in df.columns if '下價' in c), None)
-        vol_col  = next((c for c in df.columns if '交易量' in c), None)
-
-        use_cols = [date_col, avg_col, high_col, mid_col, low_col, vol_col]
-        use_cols = [c for c in use_cols if c is not None]
-
-        df = df[use_cols].copy()
-
-        # 2. 轉數值 (處理可能出現的 '-' 或 非數字字元)
-        for c in use_cols:
-            if c != date_col:
-                df[c] = pd.to_numeric(df[c], errors="coerce")
-
-        # 3. 清理無效資料
-        df = df.dropna(subset=[date_col, avg_col])
-
-        # 4. 每日平均 (避免同日有多個市場資料)
-        daily = df.groupby(date_col).mean().reset_index()
-
-        # 5. 統一欄位名稱
-        rename_map = {
-            date_col: "日期",
-            avg_col: "價格(元/公斤)",
-            high_col: "上價",
-            mid_col: "中價",
-            low_col: "下價",
-            vol_col: "交易量(公斤)"
-        }
-        daily = daily.rename(columns=rename_map)
-
-        # 6. 移除非日期列 (只保留包含斜線的日期格式)
-        daily = daily[daily["日期"].astype(str).str.contains("/")].copy()
-
-        # 7. 額外欄位計算：價格區間
-        if "上價" in daily.columns and "下價" in daily.columns:
-            daily["價格區間"] = daily["上價"] - daily["下價"]
-
-        # 輸出檔案 (檔名前綴加上 preprocessed_)
-        output_file = OUTPUT_DIR / f"daily_{file_path.name}"
-        daily.to_csv(output_file, index=False, encoding="utf-8-sig")
+        daily = preprocess_market(df, crop.market_products)
+
+        write_table(daily, output_file)
+        cache.record(task, cache_inputs, cache_params(crop), [output_file])
         print(f"  ✅ 預處理完成：{output_file.name}")
 
     except Exception as e:
@@ -70,20 +141,62 @@ def process_market_file(file_path):
 # -------------------------------
 # 執行
 # -------------------------------
-def main():
+def main(crop=DEFAULT_CROP):
     # 自動抓取資料夾下所有 .csv
-    csv_files = list(INPUT_DIR.glob("market_Kai-lan_*.csv"))
+    csv_files = list(crop.split_market_dir.glob(f"market_{crop.key}_*.csv"))
 
     if not csv_files:
-        print(f"⚠ 在 {INPUT_DIR} 找不到任何 CSV 檔案")
+        print(f"⚠ 在 {crop.split_market_dir} 找不到任何 CSV 檔案")
         return
 
     print(f"📂 找到 {len(csv_files)} 個檔案，開始進行預處理...")
+    cache = BuildCache(crop.manifest_file)
     for fp in csv_files:
         print(f"➡ 處理：{fp.name}")
-        process_market_file(fp)
+        process_market_file(crop, fp, cache)
 
     print("\n🎉 所有年度預處理完成！")
 
+def main_export(crop, export_path, chunksize=CHUNK_SIZE):
+    """全國行情匯出 CSV → 篩選作物產品、串流彙總每日平均，再依產期寫出與 main() 相同的檔案"""
+    export_path = Path(export_path)
+    if not export_path.exists():
+        print(f"❌ 找不到行情匯出檔：{export_path}")
+        return
+
+    crop.preprocess_market_dir.mkdir(parents=True, exist_ok=True)
+    cache = BuildCache(crop.manifest_file)
+    task = f"preprocessing_market:export:{export_path}"
+    cache_inputs = [export_path, Path(__file__)]
+    params = {**cache_params(crop), "market_start": crop.market_start, "season_end": crop.season_end,
+              "season_years": crop.season_years}
+    if cache.is_fresh(task, cache_inputs, params):
+        print(f"⏭️ {export_path.name} 與設定未變更，跳過")
+        return
+
+    products = ", ".join(crop.market_products) or "全部"
+    print(f"➡ 串流讀取：{export_path.name}（產品：{products}，每塊 {chunksize} 列）")
+    daily = stream_preprocess_market(export_path, crop.market_products, chunksize)
+
+    # 每日平均只有天數那麼多列，直接依產期切開
+    season = crop.season_keys(parse_tw_dates(daily["日期"]), crop.market_start)
+    written = []
+    for year, df_season in daily[season >= 0].groupby(season[season >= 0]):
+        output_file = table_path(crop.preprocess_market_dir / f"daily_{season_file_name(crop, year)}")
+        write_table(df_season.reset_index(drop=True), output_file)
+        written.append(output_file)
+        print(f"  ✅ 預處理完成：{output_file.name} (共 {len(df_season)} 天)")
+
+    cache.record(task, cache_inputs, params, written)
+    print(f"\n🎉 {len(written)} 個年度預處理完成！")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = add_crop_argument(argparse.ArgumentParser(description="市場行情預處理"))
+    parser.add_argument("--export", help="全國行情匯出 CSV（所有市場 / 產品），改用分塊串流彙總")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE, help=f"串流模式每塊列數，預設 {CHUNK_SIZE}")
+    args = parser.parse_args()
+
+    if args.export:
+        main_export(get_crop(args.crop), args.export, args.chunksize)
+    else:
+        main(get_crop(args.crop))
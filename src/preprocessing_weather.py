@@ -1,14 +1,19 @@
+import os
 import pandas as pd
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import re
 
+from build_cache import BuildCache
+from crops import DEFAULT_CROP, crop_from_args
+from storage import STORAGE_FORMAT, table_path, write_table
+from tw_date import format_tw_dates
+
 # ===============================
 # 設定
 # ===============================
-# 指向你存放多個氣象站 .csv 的資料夾
-INPUT_DIR = Path("dataset/raw_data/split_weather/Kai-lan")
-OUTPUT_DIR = Path("dataset/processed_data/preprocessing/weather/Kai-lan")
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+# 輸入 crop.split_weather_dir（多個氣象站 .csv）→ 輸出 crop.preprocess_weather_dir（見 crops.py）
 
 COLUMNS_TO_KEEP = [
     "氣溫(℃)", "最高氣溫(℃)", "最低氣溫(℃)",
@@ -20,21 +25,93 @@ NON_NEGATIVE_COLS = ["降水量(mm)", "降水時數(hour)", "日照時數(hour)"
 TEMP_COLS = ["氣溫(℃)", "最高氣溫(℃)", "最低氣溫(℃)"]
 TEMP_MIN = -5
 
+# 每欄下限：非負欄位 < 0、氣溫 < TEMP_MIN 視為異常
+LOWER_BOUNDS = np.array([
+    0 if col in NON_NEGATIVE_COLS else TEMP_MIN if col in TEMP_COLS else -np.inf
+    for col in COLUMNS_TO_KEEP
+])
+
+TIME_KEYWORDS = ["觀測時間", "日期", "Date", "Time"]
+# 氣象署資料的缺測 / 儀器故障 / 微量等標記，讀檔時直接視為缺值
+NA_MARKERS = ["X", "T", "V", "/", "--", "...", "&"]
+
+# 同時讀取的測站檔數
+MAX_WORKERS = min(8, os.cpu_count() or 1)
+
 # ===============================
 # 工具函式
 # ===============================
 def find_time_column(columns):
     for col in columns:
-        if any(keyword in col for keyword in ["觀測時間", "日期", "Date", "Time"]):
+        if any(keyword in col for keyword in TIME_KEYWORDS):
             return col
     return None
 
+def _is_needed_column(col):
+    return col in COLUMNS_TO_KEEP or any(keyword in col for keyword in TIME_KEYWORDS)
+
+def read_station_file(csv_path):
+    """只讀時間欄位與 COLUMNS_TO_KEEP，數值欄位直接以 float64 解析"""
+    kwargs = dict(encoding="utf-8-sig", usecols=_is_needed_column, na_values=NA_MARKERS)
+    try:
+        return pd.read_csv(csv_path, dtype={col: "float64" for col in COLUMNS_TO_KEEP}, **kwargs)
+    except ValueError:
+        # 出現未知的非數值標記 → 交給 clean_station_frame 逐欄 to_numeric
+        return pd.read_csv(csv_path, **kwargs)
+
+def clean_station_frame(df):
+    """單一測站：日期標準化 + 數值清洗，回傳 [日期] + COLUMNS_TO_KEEP；找不到時間欄位回傳 None"""
+    time_col = find_time_column(df.columns)
+    if not time_col:
+        return None
+
+    # 數值清洗與轉型：缺少的欄位補 NaN，整塊 (列數 × 欄位數) 陣列依各欄下限一次遮罩異常值
+    block = df.reindex(columns=COLUMNS_TO_KEEP)
+    if not all(pd.api.types.is_numeric_dtype(dtype) for dtype in block.dtypes):
+        block = block.apply(pd.to_numeric, errors="coerce")
+    values = block.to_numpy(dtype="float64", na_value=np.nan, copy=True)
+    values[values < LOWER_BOUNDS] = np.nan
+
+    cleaned = pd.DataFrame(values, columns=COLUMNS_TO_KEEP, index=df.index)
+    # 日期標準化
+    cleaned.insert(0, "日期", pd.to_datetime(df[time_col], errors="coerce"))
+    return cleaned
+
+def load_station_file(csv_path):
+    return clean_station_frame(read_station_file(csv_path))
+
+def aggregate_stations(dfs):
+    """合併所有站點並計算每日平均，日期格式化為民國年 (0XXX/MM/DD)"""
+    merged_df = pd.concat(dfs, ignore_index=True)
+    merged_df["日期"] = merged_df["日期"].dt.normalize()
+
+    # Groupby 平均 (會自動忽略 NaN，即某站某日缺值不影響其他站)
+    daily_avg = merged_df.groupby("日期").mean(numeric_only=True).reset_index()
+    daily_avg["日期"] = format_tw_dates(daily_avg["日期"])
+    return daily_avg
+
+def cache_params(crop):
+    return {
+        "weather_prefix": crop.weather_prefix,
+        "weather_start": crop.weather_start,
+        "COLUMNS_TO_KEEP": COLUMNS_TO_KEEP,
+        "NON_NEGATIVE_COLS": NON_NEGATIVE_COLS,
+        "TEMP_COLS": TEMP_COLS,
+        "TEMP_MIN": TEMP_MIN,
+        "STORAGE_FORMAT": STORAGE_FORMAT,
+    }
+
+def season_file_name(crop, start_year):
+    return f"{crop.weather_prefix}_avg_{crop.roc_period(start_year, crop.weather_start)}.csv"
+
 # ===============================
 # 主流程
 # ===============================
-def main():
+def main(crop=DEFAULT_CROP):
+    crop.preprocess_weather_dir.mkdir(parents=True, exist_ok=True)
+
     # 1. 取得資料夾內所有 CSV 檔案
-    all_files = list(INPUT_DIR.glob("*.csv"))
+    all_files = list(crop.split_weather_dir.glob("*.csv"))
 
     # 2. 建立年度群組 (Key: "2018-09-01_2019-01-31", Value: [file1, file2...])
     year_groups = {}
@@ -53,62 +130,51 @@ def main():
         print("❌ 找不到符合日期區間檔名的檔案。")
         return
 
-    # 3. 逐一年度群組處理
+    # 3. 找出需要重算的年度群組
+    cache = BuildCache(crop.manifest_file)
+    pending = []
     for period, files in sorted(year_groups.items()):
-        print(f"\n➡ 處理區間：{period} (共有 {len(files)} 個氣象站資料)")
-
-        dfs = []
         start_year_str = period.split('-')[0] # 抓取開頭年份 (西元)
         start_year = int(start_year_str)
+        output_file = table_path(crop.preprocess_weather_dir / season_file_name(crop, start_year))
 
-        for csv_path in files:
-            df = pd.read_csv(csv_path, encoding="utf-8-sig")
-            time_col = find_time_column(df.columns)
+        # 該區間所有測站檔與清洗設定都沒變 → 跳過
+        task = f"preprocessing_weather:{crop.split_weather_dir}:{period}"
+        cache_inputs = sorted(files) + [Path(__file__)]
+        if cache.is_fresh(task, cache_inputs, cache_params(crop)):
+            print(f"  ⏭️ 未變更，跳過：{output_file.name}")
+            continue
 
-            if not time_col:
-                print(f"  ⚠️ {csv_path.name} 找不到時間欄位，跳過")
-                continue
+        pending.append((period, files, output_file, task, cache_inputs))
 
-            # 日期標準化
-            df[time_col] = pd.to_datetime(df[time_col], errors="coerce")
+    # 所有待處理區間的測站檔一起平行讀取與清洗
+    station_files = [csv_path for _, files, *_ in pending for csv_path in files]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        cleaned = dict(zip(station_files, pool.map(load_station_file, station_files)))
 
-            # 數值清洗與轉型
-            for col in COLUMNS_TO_KEEP:
-                if col not in df.columns:
-                    df[col] = pd.NA
-                df[col] = pd.to_numeric(df[col], errors="coerce")
+    for period, files, output_file, task, cache_inputs in pending:
+        print(f"\n➡ 處理區間：{period} (共有 {len(files)} 個氣象站資料)")
 
-                # 負值/異常值處理
-                if col in NON_NEGATIVE_COLS:
-                    df.loc[df[col] < 0, col] = pd.NA
-                if col in TEMP_COLS:
-                    df.loc[df[col] < TEMP_MIN, col] = pd.NA
+        dfs = []
+        for csv_path in files:
+            df = cleaned[csv_path]
+
+            if df is None:
+                print(f"  ⚠️ {csv_path.name} 找不到時間欄位，跳過")
+                continue
 
-            # 只取需要的欄位
-            df = df[[time_col] + COLUMNS_TO_KEEP]
             dfs.append(df)
 
         if not dfs:
             continue
 
         # 4. 合併所有站點並計算每日平均
-        merged_df = pd.concat(dfs, ignore_index=True)
-        merged_df["日期"] = merged_df[time_col].dt.date
-
-        # Groupby 平均 (會自動忽略 NaN，即某站某日缺值不影響其他站)
-        daily_avg = merged_df.groupby("日期").mean(numeric_only=True).reset_index()
-
-        # 5. 格式化日期為民國年 (0XXX/MM/DD) 並存檔
-        # 民國年計算
-        def to_tw_date(d):
-            return f"{d.year-1911:03d}/{d.month:02d}/{d.day:02d}"
-
-        tw_period_name = f"{start_year-1911:03d}0901-{start_year+1-1911:03d}0131"
-        daily_avg["日期"] = daily_avg["日期"].apply(to_tw_date)
+        daily_avg = aggregate_stations(dfs)
 
-        output_file = OUTPUT_DIR / f"雲林芥藍_avg_{tw_period_name}.csv"
-        daily_avg.to_csv(output_file, index=False, encoding="utf-8-sig")
+        # 5. 存檔
+        write_table(daily_avg, output_file)
+        cache.record(task, cache_inputs, cache_params(crop), [output_file])
         print(f"  ✅ 完成！輸出檔名：{output_file.name}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(crop_from_args("各測站氣象資料預處理與平均"))
@@ -0,0 +1,149 @@
+import argparse
+import json
+import time
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from crops import CROPS, get_crop
+from dataset_cache import DATASET_PARAMS, build_pair
+from storage import write_table
+from train_model import EARLY_STOPPING_ROUNDS, NUM_BOOST_ROUND, TARGET_COL, get_feature_cols, load_splits, params
+from tune_model import season_frames, walk_forward_folds
+
+# ===============================
+# 特徵篩選
+# 用產期 walk-forward 各折（同 tune_model.py）訓練，依 gain 或 SHAP 平均貢獻排序特徵：
+#   1. 各折平均重要度占比低於 MIN_SHARE 的特徵刪除
+#   2. 依重要度由高到低，與已保留特徵的 |相關係數| 超過 MAX_CORR 的刪除
+#      （例如 氣溫 rollmean 3/7/15/30 天彼此幾乎相同，只留最有用的一個）
+# 結果寫到 crop.selected_features_file，train_model / tune_model / global_model / pipeline 都只用這些欄位；
+# 推論端依模型記錄的特徵名稱取欄，不需另外設定
+# 同時改寫合併資料夾的 <split>_<作物>_selected_features.csv（日期、目標與保留的特徵），與清單保持一致
+# ===============================
+SPLITS = ("train", "valid", "test")
+MIN_SHARE = 0.002
+MAX_CORR = 0.95
+MIN_FEATURES = 10
+IMPORTANCE_TYPES = ("gain", "shap")
+
+def fold_models(folds, feature_cols):
+    """各折以目前參數訓練一次，回傳 [(booster, 驗證 df), ...]"""
+    models = []
+    for train_df, valid_df, _ in folds:
+        lgb_train, lgb_valid = build_pair(train_df, valid_df, feature_cols, TARGET_COL)
+        gbm = lgb.train(
+            {**params, **DATASET_PARAMS},
+            lgb_train,
+            num_boost_round=NUM_BOOST_ROUND,
+            valid_sets=[lgb_valid],
+            valid_names=["valid"],
+            callbacks=[lgb.early_stopping(stopping_rounds=EARLY_STOPPING_ROUNDS, verbose=False)]
+        )
+        models.append((gbm, valid_df))
+    return models
+
+def fold_importance(models, feature_cols, importance_type="gain"):
+    """各折重要度正規化成占比後取平均，回傳依重要度排序的 Series"""
+    shares = []
+    for gbm, valid_df in models:
+        if importance_type == "shap":
+            contrib = gbm.predict(valid_df[feature_cols], num_iteration=gbm.best_iteration, pred_contrib=True)
+            values = np.abs(contrib[:, :-1]).mean(axis=0)  # 最後一欄為 bias
+        else:
+            values = gbm.feature_importance("gain", iteration=gbm.best_iteration)
+        total = values.sum()
+        shares.append(values / total if total > 0 else values)
+    return pd.Series(np.mean(shares, axis=0), index=feature_cols).sort_values(ascending=False)
+
+def cv_rmse(models):
+    return float(np.mean([gbm.best_score["valid"]["rmse"] for gbm, _ in models]))
+
+def prune(importance, frame, min_share=MIN_SHARE, max_corr=MAX_CORR, min_features=MIN_FEATURES):
+    """回傳 (保留的特徵, {刪除的特徵: 原因})"""
+    corr = frame[list(importance.index)].corr().abs()
+    kept, dropped = [], {}
+    for name, share in importance.items():
+        if share < min_share and len(kept) >= min_features:
+            dropped[name] = f"重要度 {share:.4f} < {min_share}"
+            continue
+        similar = corr.loc[name, kept][corr.loc[name, kept] > max_corr] if kept else pd.Series(dtype=float)
+        if not similar.empty and len(kept) >= min_features:
+            dropped[name] = f"與 {similar.idxmax()} 相關 {similar.max():.3f}"
+            continue
+        kept.append(name)
+    return kept, dropped
+
+def select_crop(crop, importance_type="gain", min_share=MIN_SHARE, max_corr=MAX_CORR):
+    seasons = season_frames(crop)
+    folds = walk_forward_folds(seasons)
+    if not folds:
+        raise ValueError(f"❌ {crop.key} 產期數不足，無法交叉驗證")
+
+    feature_cols = get_feature_cols(seasons[0][1].columns)
+    models = fold_models(folds, feature_cols)
+    importance = fold_importance(models, feature_cols, importance_type)
+
+    frame = pd.concat([df for _, df in seasons], ignore_index=True)
+    kept, dropped = prune(importance, frame, min_share, max_corr)
+
+    # 原欄位順序，比較篩選前後的 CV RMSE
+    kept = [c for c in feature_cols if c in set(kept)]
+    return {
+        "features": kept,
+        "dropped": dropped,
+        "importance": {name: round(float(v), 6) for name, v in importance.items()},
+        "importance_type": importance_type,
+        "min_share": min_share,
+        "max_corr": max_corr,
+        "cv_rmse_all": cv_rmse(models),
+        "cv_rmse_selected": cv_rmse(fold_models(folds, kept)),
+    }
+
+def write_selected_splits(crop, features):
+    """篩選後的 train / valid / test 寫成 <split>_<作物>_selected_features，回傳檔案清單"""
+    written = []
+    for split, df in zip(SPLITS, load_splits(crop, ["日期", TARGET_COL, *features])):
+        written.append(write_table(df, crop.selected_split_file(split)))
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="依各折特徵重要度與相關性篩選特徵")
+    parser.add_argument("--crop", nargs="*", default=["all"],
+                        help=f"要篩選的作物，all 代表所有有合併資料的作物（{', '.join(CROPS)}）")
+    parser.add_argument("--importance", choices=IMPORTANCE_TYPES, default="gain", help="重要度來源，預設 gain")
+    parser.add_argument("--min-share", type=float, default=MIN_SHARE,
+                        help=f"平均重要度占比低於此值即刪除，預設 {MIN_SHARE}")
+    parser.add_argument("--max-corr", type=float, default=MAX_CORR,
+                        help=f"與較重要特徵的 |相關係數| 高於此值即刪除，預設 {MAX_CORR}")
+    parser.add_argument("--dry-run", action="store_true", help="只顯示結果，不寫出特徵清單")
+    args = parser.parse_args()
+
+    crops = ([c for c in CROPS.values() if c.merge_dir.exists()]
+             if "all" in args.crop else [get_crop(key) for key in args.crop])
+
+    for crop in crops:
+        start = time.perf_counter()
+        try:
+            result = select_crop(crop, args.importance, args.min_share, args.max_corr)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"⚠️ {crop.key} 略過 → {e}")
+            continue
+
+        n_all = len(result["features"]) + len(result["dropped"])
+        print(f"✅ {crop.key} 特徵 {n_all} → {len(result['features'])}，"
+              f"CV RMSE {result['cv_rmse_all']:.4f} → {result['cv_rmse_selected']:.4f} "
+              f"({time.perf_counter() - start:.1f}s)")
+        if args.dry_run:
+            continue
+        crop.selected_features_file.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"   → {crop.selected_features_file}")
+        for path in write_selected_splits(crop, result["features"]):
+            print(f"   → {path}")
+
+    if not args.dry_run:
+        print("\n🎉 重新執行 train_model.py（或 pipeline.py）即以篩選後的特徵訓練")
+
+if __name__ == "__main__":
+    main()
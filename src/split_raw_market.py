@@ -1,90 +1,106 @@
-import pandas as pd
 from pathlib import Path
 
+from build_cache import BuildCache
+from crops import DEFAULT_CROP, crop_from_args
+from market_ingest import HEADER_ROW, read_workbooks
+from tw_date import parse_tw_dates
+
 # =========================
 # 使用者設定
 # =========================
-INPUT_FILE = r"dataset/raw_data/market/Kai-lan/蔬菜產品日交易行情-芥藍.xls"
-OUTPUT_DIR = Path("dataset/raw_data/split_market/Kai-lan")
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-# 你需要的 7 個年度 (以產期開始年為準)
+# 輸入 / 輸出路徑與產期年度（以產期開始年為準）皆由作物設定 crops.py 提供
 # 例如 107 產期 = 2018/11/01 ~ 2019/01/31
-SEASON_YEARS = [2018, 2019, 2020, 2021, 2022, 2023, 2024]
 
 # =========================
 # 核心處理函式
 # =========================
-def parse_tw_date(date_val):
-    """處理怪異日期：將 '107/11/01' 或 1071101 轉為西元 Timestamp"""
-    try:
-        date_str = str(date_val).strip()
-        if '/' in date_str:
-            parts = date_str.split('/')
-            y = int(parts[0]) + 1911
-            m = int(parts[1])
-            d = int(parts[2])
-            return pd.Timestamp(y, m, d)
-        elif len(date_str) >= 6: # 處理 1071101 這種格式
-            y = int(date_str[:-4]) + 1911
-            m = int(date_str[-4:-2])
-            d = int(date_str[-2:])
-            return pd.Timestamp(y, m, d)
-    except:
-        return pd.NaT
-    return pd.NaT
-
-def main():
-    input_path = Path(INPUT_FILE)
-    output_path = Path(OUTPUT_DIR)
-    output_path.mkdir(parents=True, exist_ok=True)
-
-    if not input_path.exists():
-        print(f"❌ 找不到原始檔案：{INPUT_FILE}")
-        return
+def read_market_workbooks(crop):
+    """讀取作物所有原始行情活頁簿並合併（解碼結果由 market_ingest 快取）"""
+    return read_workbooks(crop.raw_market_files)
 
-    print(f"➡ 正在讀取並解析：{input_path.name}")
-
-    # 1. 讀取 Excel (header=4 避開上方標題列)
-    df = pd.read_excel(input_path, header=4, engine="xlrd")
-    df.columns = [str(c).strip() for c in df.columns]
-
-    # 2. 找到日期欄位（解決日期欄位名稱不固定的問題）
+def split_market_seasons(df, crop=DEFAULT_CROP):
+    """依產期切割原始行情，回傳 {產期開始年: DataFrame}"""
+    # 1. 找到日期欄位（解決日期欄位名稱不固定的問題）
     try:
         date_col = next(c for c in df.columns if '日' in c and '期' in c)
     except StopIteration:
-        print("❌ 找不到包含 '日期' 的欄位，請檢查 Excel header 層級")
-        return
+        raise KeyError("❌ 找不到包含 '日期' 的欄位，請檢查 Excel header 層級")
 
-    # 3. 建立標準化西元時間欄位以便切割
-    df['temp_date'] = df[date_col].apply(parse_tw_date)
+    # 2. 建立標準化西元時間欄位以便切割
+    # 處理怪異日期：'107/11/01' 或 1071101 整欄一次轉為西元
+    df = df.copy()
+    df['temp_date'] = parse_tw_dates(df[date_col])
     df = df.dropna(subset=['temp_date']).sort_values('temp_date')
 
-    # 4. 開始切割 7 個年度
-    for year in SEASON_YEARS:
-        # 設定產期區間 (11/01 ~ 隔年 01/31)
-        start_dt = pd.Timestamp(f"{year}-11-01")
-        end_dt = pd.Timestamp(f"{year + 1}-01-31")
+    # 3. 每列算一次所屬產期 (例如 11/01 ~ 隔年 01/31)，一次 groupby 切出所有產期
+    season = crop.season_keys(df['temp_date'], crop.market_start)
+    in_season = season >= 0
+    grouped = dict(list(df[in_season].drop(columns=['temp_date']).groupby(season[in_season])))
 
-        # 篩選資料
-        df_season = df[(df['temp_date'] >= start_dt) & (df['temp_date'] <= end_dt)].copy()
-
-        if df_season.empty:
+    seasons = {}
+    for year in crop.season_years:
+        if year not in grouped:
             print(f"⚠️ {year} 年產期 (民國 {year-1911}年) 無資料，跳過")
             continue
+        seasons[year] = grouped[year]
+
+    return seasons
 
-        # 5. 格式化輸出檔名 (民國年格式)
-        tw_s = f"{year - 1911}1101"
-        tw_e = f"{year + 1 - 1911}0131"
-        file_name = f"market_Kai-lan_{tw_s}-{tw_e}.csv"
+def season_file_name(crop, year):
+    """格式化輸出檔名 (民國年格式)"""
+    return f"market_{crop.key}_{crop.roc_period(year, crop.market_start)}.csv"
 
-        # 移除暫存欄位並存檔
-        output_file = output_path / file_name
-        df_season.drop(columns=['temp_date']).to_csv(output_file, index=False, encoding="utf-8-sig")
+def write_market_seasons(crop, seasons):
+    output_path = crop.split_market_dir
+    output_path.mkdir(parents=True, exist_ok=True)
 
+    written = []
+    for year, df_season in seasons.items():
+        file_name = season_file_name(crop, year)
+        df_season.to_csv(output_path / file_name, index=False, encoding="utf-8-sig")
+        written.append(output_path / file_name)
         print(f"✅ 已成功切割：{file_name} (共 {len(df_season)} 筆)")
+    return written
+
+def cache_params(crop):
+    return {
+        "market_workbooks": crop.market_workbooks,
+        "HEADER_ROW": HEADER_ROW,
+        "season_years": crop.season_years,
+        "market_start": crop.market_start,
+        "season_end": crop.season_end,
+    }
+
+# =========================
+# 主程式
+# =========================
+def main(crop=DEFAULT_CROP):
+    input_paths = crop.raw_market_files
+
+    if not input_paths:
+        print(f"❌ 找不到 {crop.key} 的原始行情檔：{crop.raw_market_dir / (crop.market_workbooks or '*.xls')}")
+        return
+
+    # 原始檔與切割設定都沒變 → 沿用上次切割結果
+    cache = BuildCache(crop.manifest_file)
+    task = f"split_raw_market:{crop.raw_market_dir}"
+    cache_inputs = input_paths + [Path(__file__)]
+    if cache.is_fresh(task, cache_inputs, cache_params(crop)):
+        print(f"⏭️ {crop.key} 原始行情與設定未變更，跳過切割")
+        return
+
+    print(f"➡ 正在讀取並解析：{', '.join(p.name for p in input_paths)}")
+    df = read_market_workbooks(crop)
+
+    try:
+        seasons = split_market_seasons(df, crop)
+    except KeyError as e:
+        print(e.args[0])
+        return
 
-    print("\n🎉 7 個年度切割完成！")
+    written = write_market_seasons(crop, seasons)
+    cache.record(task, cache_inputs, cache_params(crop), written)
+    print(f"\n🎉 {len(seasons)} 個年度切割完成！")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(crop_from_args("依產期切割原始行情"))
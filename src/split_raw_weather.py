@@ -1,15 +1,13 @@
 import pandas as pd
 from pathlib import Path
 
+from build_cache import BuildCache
+from crops import DEFAULT_CROP, crop_from_args
+
 # =========================
 # 使用者設定
 # =========================
-# 設定輸入資料夾的路徑
-INPUT_DIR = r"dataset\raw_data\weather\Kai-lan"
-OUTPUT_DIR = r"dataset\raw_data\split_weather\Kai-lan"
-
-START_SEASON_YEAR = 2018
-END_SEASON_YEAR = 2024
+# 輸入 / 輸出資料夾、測站清單與產期年度皆由作物設定 crops.py 提供
 
 # =========================
 # 從檔名取氣象站編號
@@ -34,12 +32,59 @@ def find_time_column(columns):
             return col
     raise KeyError("❌ 找不到包含「觀測時間」標籤的欄位")
 
+# =========================
+# 產期切割
+# =========================
+def season_bounds(crop, year):
+    return crop.season_bounds(year, crop.weather_start)
+
+def station_files(crop):
+    """作物的原始測站檔；有指定測站清單時只取清單內的測站"""
+    files = sorted(crop.raw_weather_dir.glob("*.csv"))
+    if crop.stations:
+        files = [f for f in files if get_station_id_from_filename(f.name) in crop.stations]
+    return files
+
+def split_weather_seasons(df, crop=DEFAULT_CROP):
+    """依產期切割單一測站資料，回傳 {產期開始年: DataFrame}；時間欄位無法轉換時回傳 None"""
+    time_col = find_time_column(df.columns)
+    df = df.copy()
+    df[time_col] = pd.to_datetime(df[time_col], errors="coerce")
+
+    if df[time_col].isna().any():
+        return None
+
+    df = df.sort_values(time_col)
+
+    # 每列算一次所屬產期，一次 groupby 切出所有產期
+    season = crop.season_keys(df[time_col], crop.weather_start)
+    in_season = season >= 0
+    return dict(list(df[in_season].groupby(season[in_season])))
+
+def season_file_name(crop, station_id, year):
+    start_date, end_date = season_bounds(crop, year)
+    return f"daily_{station_id}_{start_date.date()}_{end_date.date()}.csv"
+
+def cache_params(crop):
+    return {
+        "season_years": crop.season_years,
+        "weather_start": crop.weather_start,
+        "season_end": crop.season_end,
+        "stations": crop.stations,
+    }
+
 # =========================
 # 單一檔案處理邏輯
 # =========================
-def process_single_file(file_path: Path, output_root: Path):
+def process_single_file(file_path: Path, crop, cache: BuildCache):
     print(f"\n➡ 正在處理檔案：{file_path.name}")
 
+    task = f"split_raw_weather:{file_path}"
+    cache_inputs = [file_path, __file__]
+    if cache.is_fresh(task, cache_inputs, cache_params(crop)):
+        print("  ⏭️ 測站檔與設定未變更，跳過")
+        return
+
     try:
         # 取得氣象站編號
         station_id = get_station_id_from_filename(file_path.name)
@@ -47,52 +92,40 @@ def process_single_file(file_path: Path, output_root: Path):
         # 讀取 CSV
         df = pd.read_csv(file_path, encoding="utf-8-sig")
 
-        # 自動偵測時間欄位
-        time_col = find_time_column(df.columns)
-        df[time_col] = pd.to_datetime(df[time_col], errors="coerce")
+        # 自動偵測時間欄位並依產期切割
+        seasons = split_weather_seasons(df, crop)
 
-        if df[time_col].isna().any():
+        if seasons is None:
             print(f"  ❌ {file_path.name} 時間轉換有誤，跳過該檔")
             return
 
-        df = df.sort_values(time_col)
-
-        # 依產期切割
-        for year in range(START_SEASON_YEAR, END_SEASON_YEAR + 1):
-            start_date = pd.Timestamp(f"{year}-09-01")
-            end_date = pd.Timestamp(f"{year + 1}-01-31")
-
-            df_season = df[
-                (df[time_col] >= start_date) &
-                (df[time_col] <= end_date)
-            ]
+        written = []
+        for year, df_season in seasons.items():
+            output_name = season_file_name(crop, station_id, year)
 
-            if df_season.empty:
-                continue
-
-            output_name = f"daily_{station_id}_{start_date.date()}_{end_date.date()}.csv"
-
-            # 若想區分不同測站到不同子資料夾，可改為 output_root / station_id
-            save_path = output_root / output_name
+            # 若想區分不同測站到不同子資料夾，可改為 crop.split_weather_dir / station_id
+            save_path = crop.split_weather_dir / output_name
             df_season.to_csv(save_path, index=False, encoding="utf-8-sig")
+            written.append(save_path)
             print(f"  ✅ 已生成：{output_name}")
 
+        cache.record(task, cache_inputs, cache_params(crop), written)
+
     except Exception as e:
         print(f"  💥 處理 {file_path.name} 時發生錯誤: {e}")
 
 # =========================
 # 主程式
 # =========================
-def main():
-    input_dir = Path(INPUT_DIR)
-    output_dir = Path(OUTPUT_DIR)
-    output_dir.mkdir(parents=True, exist_ok=True)
+def main(crop=DEFAULT_CROP):
+    input_dir = crop.raw_weather_dir
+    crop.split_weather_dir.mkdir(parents=True, exist_ok=True)
 
     if not input_dir.exists():
-        raise FileNotFoundError(f"❌ 找不到輸入資料夾：{INPUT_DIR}")
+        raise FileNotFoundError(f"❌ 找不到輸入資料夾：{input_dir}")
 
-    # 取得資料夾下所有 .csv 檔案
-    csv_files = list(input_dir.glob("*.csv"))
+    # 取得資料夾下所有 .csv 檔案（依作物設定篩選測站）
+    csv_files = station_files(crop)
 
     if not csv_files:
         print("Empty! 找不到任何 CSV 檔案。")
@@ -100,10 +133,11 @@ def main():
 
     print(f"📂 找到 {len(csv_files)} 個檔案，準備開始切割...")
 
+    cache = BuildCache(crop.manifest_file)
     for file_path in csv_files:
-        process_single_file(file_path, output_dir)
+        process_single_file(file_path, crop, cache)
 
     print("\n🎉 所有檔案處理完成！")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(crop_from_args("依產期切割各測站氣象資料"))
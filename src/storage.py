@@ -0,0 +1,80 @@
+import os
+from pathlib import Path
+
+import pandas as pd
+
+# ===============================
+# processed_data 中間產物的儲存格式
+# csv（預設，與既有檔案相容）/ parquet / feather
+# 以環境變數 STORAGE_FORMAT 切換；parquet、feather 需要 pyarrow
+# ===============================
+STORAGE_FORMAT = os.environ.get("STORAGE_FORMAT", "csv").lower()
+COMPRESSION = "zstd"
+
+SUFFIXES = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+FORMATS = {suffix: fmt for fmt, suffix in SUFFIXES.items()}
+
+def _check_format(fmt):
+    if fmt not in SUFFIXES:
+        raise ValueError(f"❌ 不支援的儲存格式：{fmt}（可用：{', '.join(SUFFIXES)}）")
+    if fmt != "csv":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError(f"❌ {fmt} 格式需要 pyarrow，請先 pip install pyarrow") from None
+    return fmt
+
+def _format_of(path):
+    fmt = FORMATS.get(Path(path).suffix.lower())
+    if fmt is None:
+        raise ValueError(f"❌ 無法從副檔名判斷格式：{path}")
+    return _check_format(fmt)
+
+def table_path(path, fmt=None):
+    """把檔名（通常寫成 .csv）換成目前儲存格式的副檔名"""
+    return Path(path).with_suffix(SUFFIXES[_check_format(fmt or STORAGE_FORMAT)])
+
+def table_glob(directory, pattern, fmt=None):
+    """pattern 不含副檔名，例如 "daily_market_Kai-lan_*" """
+    suffix = SUFFIXES[_check_format(fmt or STORAGE_FORMAT)]
+    return sorted(Path(directory).glob(f"{pattern}{suffix}"))
+
+# ===============================
+# 讀寫
+# ===============================
+def write_table(df, path, fmt=None):
+    """依儲存格式寫出，回傳實際寫出的路徑"""
+    path = table_path(path, fmt)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    fmt = FORMATS[path.suffix]
+    if fmt == "parquet":
+        df.to_parquet(path, index=False, compression=COMPRESSION)
+    elif fmt == "feather":
+        df.reset_index(drop=True).to_feather(path, compression=COMPRESSION)
+    else:
+        df.to_csv(path, index=False, encoding="utf-8-sig")
+    return path
+
+def read_table(path, columns=None):
+    """格式由副檔名決定；columns 只讀取指定欄位（parquet / feather 不會解碼其他欄位）"""
+    fmt = _format_of(path)
+    if fmt == "parquet":
+        return pd.read_parquet(path, columns=columns)
+    if fmt == "feather":
+        return pd.read_feather(path, columns=columns)
+
+    df = pd.read_csv(path, encoding="utf-8-sig", usecols=columns)
+    return df if columns is None else df[columns]
+
+def read_columns(path):
+    """只讀欄位名稱，不載入資料"""
+    fmt = _format_of(path)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    if fmt == "feather":
+        import pyarrow.ipc as ipc
+        with ipc.open_file(path) as reader:
+            return reader.schema.names
+    return pd.read_csv(path, encoding="utf-8-sig", nrows=0).columns.tolist()
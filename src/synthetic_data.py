@@ -0,0 +1,178 @@
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from crops import DATA_DIR, CropConfig
+from tw_date import format_tw_dates
+
+# ===============================
+# 合成資料（效能測試用）
+# 產生與真實資料同格式、可調規模的原始檔：
+#   market_export.csv          農產品交易行情站（AMIS）全國匯出格式：日期 × 市場 × 產品，民國日期
+#   weather/daily_<測站>_*.csv  氣象署（CWA）測站日資料格式，含 X / T 等缺值標記
+# 每個合成作物一個產品代號，使用全部測站；以 seed 固定亂數，同樣的規模產生同樣的資料
+# ===============================
+BENCH_DIR = DATA_DIR / ".cache" / "benchmark"
+CONFIG_FILE = "scale.json"
+LAST_SEASON = 2024      # 最後一個產期開始年
+MISSING_RATE = 0.005    # 氣象數值改成缺值標記的比例
+CLOSED_RATE = 0.12      # 市場休市（當天沒有行情）的比例
+
+# AMIS 匯出的欄名（日期 / 市場 / 產品中間是全形空白，增減% 出現兩次）
+MARKET_HEADER = ["日　　期", "市　　場", "產　　品", "上價", "中價", "下價",
+                 "平均價(元/公斤)", "增減%", "交易量(公斤)", "增減%"]
+WEATHER_COLUMNS = ["測站氣壓(hPa)", "氣溫(℃)", "最高氣溫(℃)", "最低氣溫(℃)", "相對溼度(%)",
+                   "風速(m/s)", "最大陣風(m/s)", "降水量(mm)", "降水時數(hour)", "日照時數(hour)"]
+
+def season_years(years):
+    return tuple(range(LAST_SEASON - years + 1, LAST_SEASON + 1))
+
+def station_ids(stations):
+    return [f"B0X{i:03d}" for i in range(stations)]
+
+def synthetic_crops(crops, stations, years):
+    """合成作物設定：產品代號 X01、X02 ...，每個作物都使用全部測站"""
+    return [
+        CropConfig(f"bench{i}", f"合成{i}", f"合成{i}", market_products=(f"X{i:02d}",),
+                   stations=tuple(station_ids(stations)), season_years=season_years(years))
+        for i in range(1, crops + 1)
+    ]
+
+def date_range(years):
+    """第一個產期的氣象起日（8/1，涵蓋各作物提早抓的生長期）到最後一個產期迄日"""
+    first = season_years(years)[0]
+    return pd.date_range(f"{first}-08-01", f"{LAST_SEASON + 1}-01-31", freq="D")
+
+# ===============================
+# 行情
+# ===============================
+def market_export(crops, markets, years, rng):
+    """全國行情匯出表：每個 (交易日, 市場, 產品) 一列"""
+    days = date_range(years)
+    n_days = len(days)
+    day_of_year = days.dayofyear.to_numpy()
+    frames = []
+    for crop in crops:
+        base = rng.uniform(15, 60)
+        seasonal = 1 + 0.3 * np.sin(2 * np.pi * (day_of_year - 300) / 365)
+        # 各市場一條 AR(1) 價格走勢
+        shocks = rng.normal(0, 0.08, (n_days, markets))
+        walk = np.zeros_like(shocks)
+        for t in range(1, n_days):
+            walk[t] = 0.9 * walk[t - 1] + shocks[t]
+        mid = base * seasonal[:, None] * np.exp(walk)
+        spread = rng.uniform(0.2, 0.5, (n_days, markets))
+
+        open_days = rng.random((n_days, markets)) >= CLOSED_RATE
+        day_idx, market_idx = np.nonzero(open_days)
+        mid = mid[day_idx, market_idx]
+        spread = spread[day_idx, market_idx]
+        high, low = mid * (1 + spread), mid * (1 - spread)
+        volume = rng.gamma(2.0, 800.0, len(mid))
+        product = crop.market_products[0]
+
+        frames.append(pd.DataFrame([
+            format_tw_dates(days[day_idx]),
+            [f"{100 + m} 市場{m}" for m in market_idx],
+            np.full(len(mid), f"{product} {crop.name}"),
+            high.round(1), mid.round(1), low.round(1),
+            ((high + 2 * mid + low) / 4).round(1),
+            rng.integers(-20, 21, len(mid)).astype(str),
+            volume.round(0),
+            rng.integers(-20, 21, len(mid)).astype(str),
+        ], index=MARKET_HEADER).T)
+    return pd.concat(frames, ignore_index=True).sort_values(MARKET_HEADER[0], kind="stable")
+
+# ===============================
+# 氣象
+# ===============================
+def station_frame(days, rng):
+    """單一測站日資料，少數數值改成 X（儀器故障）/ T（微量降水）"""
+    n = len(days)
+    season = np.sin(2 * np.pi * (days.dayofyear.to_numpy() - 100) / 365)
+    temp = 23 + 6 * season + rng.normal(0, 1.5, n)
+    rain = np.where(rng.random(n) < 0.3, rng.gamma(0.8, 12.0, n), 0.0)
+    df = pd.DataFrame({
+        "觀測時間(hour)": days.strftime("%Y-%m-%d"),
+        "測站氣壓(hPa)": 1010 - 5 * season + rng.normal(0, 2, n),
+        "氣溫(℃)": temp,
+        "最高氣溫(℃)": temp + rng.uniform(2, 7, n),
+        "最低氣溫(℃)": temp - rng.uniform(2, 7, n),
+        "相對溼度(%)": np.clip(rng.normal(78, 10, n), 20, 100),
+        "風速(m/s)": rng.gamma(2.0, 1.0, n),
+        "最大陣風(m/s)": rng.gamma(3.0, 2.5, n),
+        "降水量(mm)": rain,
+        "降水時數(hour)": np.where(rain > 0, rng.uniform(0.5, 12, n), 0.0),
+        "日照時數(hour)": np.clip(rng.normal(5, 3, n), 0, 12),
+    }).round(1)
+
+    values = df[WEATHER_COLUMNS].astype(object)
+    values[rng.random(values.shape) < MISSING_RATE] = "X"
+    trace = (rain == 0) & (rng.random(n) < 0.05)
+    values.loc[trace, "降水量(mm)"] = "T"
+    df[WEATHER_COLUMNS] = values
+    return df
+
+# ===============================
+# 寫檔
+# ===============================
+def generate(output_dir, crops=3, markets=5, stations=4, years=7, seed=0):
+    """寫出合成資料，回傳檔案與筆數摘要；同樣規模的資料已存在時直接沿用"""
+    output_dir = Path(output_dir)
+    scale = {"crops": crops, "markets": markets, "stations": stations, "years": years, "seed": seed}
+    config_file = output_dir / CONFIG_FILE
+    if config_file.exists():
+        summary = json.loads(config_file.read_text(encoding="utf-8"))
+        if summary.get("scale") == scale:
+            return summary
+
+    rng = np.random.default_rng(seed)
+    weather_dir = output_dir / "weather"
+    weather_dir.mkdir(parents=True, exist_ok=True)
+    for old in weather_dir.glob("daily_*.csv"):
+        old.unlink()
+
+    market = market_export(synthetic_crops(crops, stations, years), markets, years, rng)
+    market_file = output_dir / "market_export.csv"
+    market.to_csv(market_file, index=False, encoding="utf-8-sig")
+
+    days = date_range(years)
+    weather_files = []
+    for station_id in station_ids(stations):
+        path = weather_dir / f"daily_{station_id}_{days[0].date()}_{days[-1].date()}.csv"
+        station_frame(days, rng).to_csv(path, index=False, encoding="utf-8-sig")
+        weather_files.append(path)
+
+    summary = {
+        "scale": scale,
+        "market_file": str(market_file),
+        "market_rows": len(market),
+        "weather_files": [str(f) for f in weather_files],
+        "weather_rows": len(days) * stations,
+        "bytes": market_file.stat().st_size + sum(f.stat().st_size for f in weather_files),
+    }
+    config_file.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+    return summary
+
+def add_scale_arguments(parser):
+    parser.add_argument("--crops", type=int, default=3, help="合成作物數，預設 3")
+    parser.add_argument("--markets", type=int, default=5, help="每個作物的市場數，預設 5")
+    parser.add_argument("--stations", type=int, default=4, help="測站數，預設 4")
+    parser.add_argument("--years", type=int, default=7, help="產期數（至少 3），預設 7")
+    parser.add_argument("--seed", type=int, default=0, help="亂數種子，預設 0")
+    parser.add_argument("--output-dir", default=str(BENCH_DIR), help=f"輸出資料夾，預設 {BENCH_DIR}")
+
+def main():
+    parser = argparse.ArgumentParser(description="產生 AMIS 行情匯出與 CWA 測站格式的合成資料")
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+
+    summary = generate(args.output_dir, args.crops, args.markets, args.stations, args.years, args.seed)
+    print(f"✅ 行情 {summary['market_rows']:,} 列、氣象 {summary['weather_rows']:,} 列"
+          f"（{summary['bytes'] / 1e6:.1f} MB）→ {args.output_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,25 @@
-import pandas as pd
+import argparse
 import lightgbm as lgb
 from pathlib import Path
-from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
+import json
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
+
+from build_cache import BuildCache
+from crops import DEFAULT_CROP, add_crop_argument, get_crop
+from dataset_cache import build_pair, cached_pairs, dataset_key
+from engineering_market import MARKET_STRUCT_COLS
+from merge_weather_and_market import split_file_name
+from storage import read_columns, read_table, table_path
 
 # ===============================
 # 1️⃣ 設定檔案路徑
 # ===============================
-DATA_DIR = Path("dataset/processed_data/merge_market_and_weather_after_engineering/Kai-lan")
-TRAIN_FILE = DATA_DIR / "train_Kai-lan_after_engineering.csv"
-VALID_FILE = DATA_DIR / "valid_Kai-lan_after_engineering.csv"
-TEST_FILE = DATA_DIR / "test_Kai-lan_after_engineering.csv"
-output_dir = Path("dataset/model/Kai-lan")
-output_dir.mkdir(parents=True, exist_ok=True)
+# 輸入 crop.merge_dir 的 train / valid / test → 輸出 crop.model_file（見 crops.py）
+def split_files(crop):
+    return [table_path(crop.merge_dir / split_file_name(crop, split)) for split in ("train", "valid", "test")]
 
 TARGET_COL = "價格(元/公斤)"
 
-# ===============================
-# 2️⃣ 讀取資料
-# ===============================
-train_df = pd.read_csv(TRAIN_FILE)
-valid_df = pd.read_csv(VALID_FILE)
-test_df = pd.read_csv(TEST_FILE)
-
-# ===============================
-# 3️⃣ 分特徵與目標
-# ===============================
-feature_cols = [c for c in train_df.columns if c != "日期" and c != TARGET_COL]
-
-X_train, y_train = train_df[feature_cols], train_df[TARGET_COL]
-X_valid, y_valid = valid_df[feature_cols], valid_df[TARGET_COL]
-X_test, y_test = test_df[feature_cols], test_df[TARGET_COL]
-
-# ===============================
-# 4️⃣ 建立 LightGBM Dataset
-# ===============================
-lgb_train = lgb.Dataset(X_train, y_train)
-lgb_valid = lgb.Dataset(X_valid, y_valid, reference=lgb_train)
-
 # ===============================
 # 5️⃣ 設定參數
 # ===============================
@@ -52,55 +32,206 @@ params = {
     "max_depth": -1,
     "verbose": -1
 }
+NUM_BOOST_ROUND = 1000
+EARLY_STOPPING_ROUNDS = 50
+
+def model_params(crop):
+    """預設參數，若有 tune_model.py 找到的最佳參數則覆蓋"""
+    tuned_file = crop.tuned_params_file
+    if not tuned_file.exists():
+        return dict(params)
+    return {**params, **json.loads(tuned_file.read_text(encoding="utf-8"))}
+
+def cache_params(crop):
+    return {"params": model_params(crop), "TARGET_COL": TARGET_COL, "features": selected_features(crop)}
 
 # ===============================
-# 6️⃣ 訓練模型
+# 2️⃣ 讀取資料
 # ===============================
-gbm = lgb.train(
-    params,
-    lgb_train,
-    num_boost_round=1000,
-    valid_sets=[lgb_train, lgb_valid],
-    valid_names=["train", "valid"],
-    callbacks=[lgb.early_stopping(stopping_rounds=50)]
-)
+def load_splits(crop, columns=None):
+    """columns 指定時只載入這些欄位（parquet / feather 不會解碼其他欄位）"""
+    return tuple(read_table(f, columns) for f in split_files(crop))
+
+# ===============================
+# 3️⃣ 分特徵與目標
+# ===============================
+def get_feature_cols(columns):
+    """日期、目標與當天的市場結果（上/中/下價等，預測時還不知道）以外的欄位"""
+    excluded = {"日期", TARGET_COL, *MARKET_STRUCT_COLS}
+    return [c for c in columns if c not in excluded]
+
+def selected_features(crop):
+    """select_features.py 產生的特徵清單，沒有時為 None（使用全部特徵）"""
+    if not crop.selected_features_file.exists():
+        return None
+    return json.loads(crop.selected_features_file.read_text(encoding="utf-8"))["features"]
+
+def crop_feature_cols(crop, columns):
+    """作物實際訓練用的特徵：有篩選清單時只保留清單內的欄位"""
+    feature_cols = get_feature_cols(columns)
+    selected = selected_features(crop)
+    if selected is None:
+        return feature_cols
+    return [c for c in feature_cols if c in set(selected)]
+
+# ===============================
+# 4️⃣ 建立 LightGBM Dataset + 6️⃣ 訓練模型
+# ===============================
+def train_model(train_df, valid_df, feature_cols, model_params=None):
+    lgb_train, lgb_valid = build_pair(train_df, valid_df, feature_cols, TARGET_COL)
+    return train_booster(lgb_train, lgb_valid, model_params)
+
+def load_datasets(crop, feature_cols):
+    """train / valid 的 Dataset；合併資料與特徵都沒變時直接載入上次分箱的二進位檔"""
+    train_file, valid_file, _ = split_files(crop)
+    key = dataset_key([train_file, valid_file], feature_cols, TARGET_COL)
+    load_frames = lambda: [("split", *load_splits(crop, feature_cols + [TARGET_COL])[:2])]
+    _, lgb_train, lgb_valid = cached_pairs(key, load_frames, feature_cols, TARGET_COL)[0]
+    return lgb_train, lgb_valid
+
+def train_booster(lgb_train, lgb_valid, model_params=None):
+    return lgb.train(
+        params if model_params is None else model_params,
+        lgb_train,
+        num_boost_round=NUM_BOOST_ROUND,
+        valid_sets=[lgb_train, lgb_valid],
+        valid_names=["train", "valid"],
+        callbacks=[lgb.early_stopping(stopping_rounds=EARLY_STOPPING_ROUNDS)]
+    )
 
 # ===============================
 # 7️⃣ 測試與多指標評估
 # ===============================
-y_pred = gbm.predict(X_test, num_iteration=gbm.best_iteration)
+def evaluate(gbm, test_df, feature_cols):
+    X_test, y_test = test_df[feature_cols], test_df[TARGET_COL]
+    y_pred = gbm.predict(X_test, num_iteration=gbm.best_iteration)
 
-# 計算指標
-mse = mean_squared_error(y_test, y_pred)
-rmse = np.sqrt(mse)
-mae = mean_absolute_error(y_test, y_pred)
-r2 = r2_score(y_test, y_pred)
+    # 計算指標（直接用 NumPy，不必為了四個公式載入 scikit-learn）
+    y_true = np.asarray(y_test, dtype="float64")
+    residual = y_true - y_pred
+    mse = float(np.mean(residual ** 2))
+    metrics = {
+        "mse": mse,
+        "rmse": float(np.sqrt(mse)),
+        "mae": float(np.mean(np.abs(residual))),
+        "r2": float(1 - np.sum(residual ** 2) / np.sum((y_true - y_true.mean()) ** 2))
+    }
+    return metrics, y_pred
 
-print("\n" + "="*30)
-print("📊 模型評估報表 (Test Set)")
-print("="*30)
-print(f"MSE  (均方誤差): {mse:.4f}")
-print(f"RMSE (均方根誤差): {rmse:.4f}")
-print(f"MAE  (平均絕對誤差): {mae:.4f}")
-print(f"R²   (判定係數): {r2:.4f}")
-print("="*30)
+def print_report(metrics):
+    print("\n" + "="*30)
+    print("📊 模型評估報表 (Test Set)")
+    print("="*30)
+    print(f"MSE  (均方誤差): {metrics['mse']:.4f}")
+    print(f"RMSE (均方根誤差): {metrics['rmse']:.4f}")
+    print(f"MAE  (平均絕對誤差): {metrics['mae']:.4f}")
+    print(f"R²   (判定係數): {metrics['r2']:.4f}")
+    print("="*30)
 
 # ===============================
 # 8️⃣ 視覺化比較圖
 # ===============================
-plt.figure(figsize=(12, 6))
-plt.plot(y_test.values, label="Actual Price", color="blue", alpha=0.7)
-plt.plot(y_pred, label="Predicted Price", color="red", linestyle="--", alpha=0.8)
-plt.title(f"Kai-lan Price Prediction (R²: {r2:.3f})")
-plt.xlabel("Sample Index (Time Sequence)")
-plt.ylabel("Price (NTD/kg)")
-plt.legend()
-plt.grid(True)
-plt.show()
+def write_report(report_file, crop, gbm, metrics, n_test):
+    """評估結果寫成 JSON，方便批次訓練後彙整"""
+    report = {
+        "crop": crop.key,
+        "model_file": str(crop.model_file),
+        # 從檔案載入的模型沒有 best_iteration（-1），存檔時已只保留到最佳迭代
+        "best_iteration": gbm.best_iteration if gbm.best_iteration > 0 else gbm.current_iteration(),
+        "num_features": gbm.num_feature(),
+        "n_test": n_test,
+        "params": model_params(crop),
+        "metrics": metrics,
+    }
+    report_file = Path(report_file)
+    report_file.parent.mkdir(parents=True, exist_ok=True)
+    report_file.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"📝 評估報表已寫入 {report_file}")
+
+def plot_prediction(y_test, y_pred, r2, crop=DEFAULT_CROP, plot_file=None):
+    """plot_file 指定時存成圖檔（不需要顯示器），否則開視窗顯示"""
+    # 只有要畫圖時才載入 matplotlib
+    import matplotlib
+    if plot_file is not None:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(12, 6))
+    plt.plot(np.asarray(y_test), label="Actual Price", color="blue", alpha=0.7)
+    plt.plot(y_pred, label="Predicted Price", color="red", linestyle="--", alpha=0.8)
+    plt.title(f"{crop.key} Price Prediction (R²: {r2:.3f})")
+    plt.xlabel("Sample Index (Time Sequence)")
+    plt.ylabel("Price (NTD/kg)")
+    plt.legend()
+    plt.grid(True)
+
+    if plot_file is None:
+        plt.show()
+        return
+    Path(plot_file).parent.mkdir(parents=True, exist_ok=True)
+    plt.savefig(plot_file, dpi=120, bbox_inches="tight")
+    plt.close()
+    print(f"🖼️ 預測比較圖已存至 {plot_file}")
 
 # ===============================
 # 9️⃣ 儲存模型
 # ===============================
-MODEL_FILE = output_dir / "lgb_model_Kai-lan.txt"
-gbm.save_model(str(MODEL_FILE))
-print(f"\n✅ 模型已儲存至 {MODEL_FILE}")
\ No newline at end of file
+def save_model(gbm, model_file=DEFAULT_CROP.model_file):
+    Path(model_file).parent.mkdir(parents=True, exist_ok=True)
+    gbm.save_model(str(model_file))
+    print(f"\n✅ 模型已儲存至 {model_file}")
+    return model_file
+
+def main(crop=DEFAULT_CROP, plot_file=None, report_file=None, show=False):
+    """plot_file / report_file 指定時才輸出圖檔 / JSON 報表；show 為 True 時開視窗顯示比較圖"""
+    # 訓練資料與參數都沒變 → 沿用已儲存的模型
+    cache = BuildCache(crop.manifest_file)
+    task = f"train_model:{crop.model_file}"
+    cache_inputs = split_files(crop) + [__file__]
+    wants_output = report_file is not None or plot_file is not None or show
+    if cache.is_fresh(task, cache_inputs, cache_params(crop)):
+        print(f"⏭️ 訓練資料與參數未變更，沿用 {crop.model_file}")
+        if not wants_output:
+            return
+        # 只跳過訓練：載入已儲存的模型，報表 / 比較圖照常輸出
+        gbm = lgb.Booster(model_file=str(crop.model_file))
+        feature_cols = gbm.feature_name()
+        test_df = read_table(cache_inputs[2], feature_cols + [TARGET_COL])
+        metrics, y_pred = evaluate(gbm, test_df, feature_cols)
+        print_report(metrics)
+    else:
+        # 先看欄位，只讀取特徵與目標；train / valid 有分箱快取時不必讀
+        feature_cols = crop_feature_cols(crop, read_columns(cache_inputs[0]))
+        lgb_train, lgb_valid = load_datasets(crop, feature_cols)
+        test_df = read_table(cache_inputs[2], feature_cols + [TARGET_COL])
+
+        gbm = train_booster(lgb_train, lgb_valid, model_params(crop))
+        metrics, y_pred = evaluate(gbm, test_df, feature_cols)
+        print_report(metrics)
+
+        # 先存模型，畫圖不會擋住後續流程
+        save_model(gbm, crop.model_file)
+        cache.record(task, cache_inputs, cache_params(crop), [crop.model_file])
+
+    if report_file is not None:
+        write_report(report_file, crop, gbm, metrics, len(test_df))
+    if plot_file is not None or show:
+        plot_prediction(test_df[TARGET_COL], y_pred, metrics["r2"], crop, plot_file)
+
+def default_output(crop, kind, suffix):
+    """dataset/model/<作物>/<kind>_<作物><suffix>"""
+    return crop.model_file.parent / f"{kind}_{crop.key}{suffix}"
+
+if __name__ == "__main__":
+    parser = add_crop_argument(argparse.ArgumentParser(description="訓練 LightGBM 價格模型"))
+    parser.add_argument("--plot", nargs="?", const="", default=None, metavar="FILE",
+                        help="預測比較圖存成檔案，未給檔名時為 dataset/model/<作物>/prediction_<作物>.png")
+    parser.add_argument("--report", nargs="?", const="", default=None, metavar="FILE",
+                        help="評估指標寫成 JSON，未給檔名時為 dataset/model/<作物>/report_<作物>.json")
+    parser.add_argument("--show", action="store_true", help="開視窗顯示預測比較圖（需要顯示器）")
+    args = parser.parse_args()
+
+    crop = get_crop(args.crop)
+    plot_file = args.plot or (default_output(crop, "prediction", ".png") if args.plot == "" else None)
+    report_file = args.report or (default_output(crop, "report", ".json") if args.report == "" else None)
+    main(crop, plot_file, report_file, args.show)
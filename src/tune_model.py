@@ -0,0 +1,205 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from crops import CROPS, get_crop
+from dataset_cache import DATASET_PARAMS, cached_pairs, dataset_key
+from storage import read_columns
+from train_model import (EARLY_STOPPING_ROUNDS, NUM_BOOST_ROUND, TARGET_COL, crop_feature_cols,
+                         load_splits, params, split_files)
+from tw_date import parse_tw_dates
+
+# ===============================
+# 超參數搜尋 + 產期 walk-forward 交叉驗證
+# test（最新產期）完全不參與；train + valid 依產期切成多折：
+#   前 3 個產期 → 驗證第 4 個、前 4 個 → 驗證第 5 個 ...
+# 每組參數在所有折上訓練，以平均 valid RMSE 排序，最佳參數寫到 crop.tuned_params_file
+# 所有作物的所有試驗丟進同一個行程池；每折的 lgb.Dataset（分箱）只建一次，之後的試驗與下次調參直接重用
+# ===============================
+N_TRIALS = 40
+MIN_TRAIN_SEASONS = 3
+SEED = 42
+
+# 參數名稱 → (分布, 下限, 上限)
+SEARCH_SPACE = {
+    "learning_rate": ("log", 0.01, 0.2),
+    "num_leaves": ("int", 7, 127),
+    "min_data_in_leaf": ("int", 5, 60),
+    "feature_fraction": ("float", 0.5, 1.0),
+    "bagging_fraction": ("float", 0.5, 1.0),
+    "lambda_l2": ("log", 1e-3, 10.0),
+}
+
+def sample_params(rng):
+    trial = {}
+    for name, (kind, low, high) in SEARCH_SPACE.items():
+        if kind == "log":
+            trial[name] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+        elif kind == "int":
+            trial[name] = int(rng.integers(low, high + 1))
+        else:
+            trial[name] = float(rng.uniform(low, high))
+    trial["bagging_freq"] = 1
+    return trial
+
+# ===============================
+# 產期切折
+# ===============================
+def season_frames(crop):
+    """train + valid 依日期去重後，按產期開始年分組，回傳 [(年度, DataFrame), ...]"""
+    train_df, valid_df, _ = load_splits(crop)
+    df = pd.concat([train_df, valid_df], ignore_index=True)
+    df = pd.concat([df, pd.Series(parse_tw_dates(df["日期"]), index=df.index, name="_dt")], axis=1)
+    df = df.dropna(subset=["_dt"]).drop_duplicates("_dt", keep="last").sort_values("_dt")
+
+    seasons = crop.season_keys(df["_dt"], crop.market_start)
+    df = df.drop(columns="_dt")
+    return [(year, df[seasons == year]) for year in sorted(set(seasons) - {-1})]
+
+def walk_forward_folds(seasons, min_train=MIN_TRAIN_SEASONS):
+    """[(年度, df), ...] → [(訓練 df, 驗證 df, 驗證年度), ...]"""
+    return [
+        (pd.concat([df for _, df in seasons[:i]], ignore_index=True), seasons[i][1], seasons[i][0])
+        for i in range(min_train, len(seasons))
+    ]
+
+# ===============================
+# 每個作物的各折 Dataset：行程內只載入一次，分箱結果存在 dataset_cache，下次調參直接載入
+# ===============================
+_FOLD_DATASETS = {}
+
+def fold_datasets(crop_key):
+    if crop_key not in _FOLD_DATASETS:
+        crop = get_crop(crop_key)
+        sources = split_files(crop)[:2]
+        feature_cols = crop_feature_cols(crop, read_columns(sources[0]))
+
+        def make_folds():
+            folds = walk_forward_folds(season_frames(crop))
+            if not folds:
+                raise ValueError(f"❌ {crop_key} 產期數不足 {MIN_TRAIN_SEASONS + 1} 個，無法交叉驗證")
+            return [(str(year), train_df, valid_df) for train_df, valid_df, year in folds]
+
+        key = dataset_key(sources, feature_cols, TARGET_COL, folds="walk_forward",
+                          min_train=MIN_TRAIN_SEASONS, market_start=crop.market_start)
+        _FOLD_DATASETS[crop_key] = cached_pairs(key, make_folds, feature_cols, TARGET_COL)
+    return _FOLD_DATASETS[crop_key]
+
+def run_trial(crop_key, trial_id, trial_params, num_threads=0):
+    """單一試驗：所有折各訓練一次，回傳平均 valid RMSE 與各折結果"""
+    start = time.perf_counter()
+    trial_full = {**params, **DATASET_PARAMS, **trial_params, "num_threads": num_threads}
+
+    fold_rmse, fold_rounds = [], []
+    for _, lgb_train, lgb_valid in fold_datasets(crop_key):
+        gbm = lgb.train(
+            trial_full,
+            lgb_train,
+            num_boost_round=NUM_BOOST_ROUND,
+            valid_sets=[lgb_valid],
+            valid_names=["valid"],
+            callbacks=[lgb.early_stopping(stopping_rounds=EARLY_STOPPING_ROUNDS, verbose=False)]
+        )
+        fold_rmse.append(gbm.best_score["valid"]["rmse"])
+        fold_rounds.append(gbm.best_iteration)
+
+    return {
+        "crop": crop_key,
+        "trial": trial_id,
+        "cv_rmse": float(np.mean(fold_rmse)),
+        "fold_rmse": [round(float(r), 4) for r in fold_rmse],
+        "best_rounds": fold_rounds,
+        "seconds": time.perf_counter() - start,
+        **trial_params,
+    }
+
+# ===============================
+# 多作物 × 多試驗：同一個行程池
+# ===============================
+def tune_crops(crop_keys, n_trials=N_TRIALS, workers=None, seed=SEED):
+    """回傳 {作物: 依 cv_rmse 排序的試驗結果 DataFrame}"""
+    rng = np.random.default_rng(seed)
+    # 第 0 個試驗固定為目前 train_model.py 的參數，作為比較基準
+    baseline = {name: params[name] for name in SEARCH_SPACE if name in params}
+    trials = [baseline] + [sample_params(rng) for _ in range(n_trials - 1)]
+    tasks = [(key, i, trial) for key in crop_keys for i, trial in enumerate(trials)]
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    # 多行程時每個試驗單執行緒，由行程數吃滿 CPU
+    num_threads = 1 if workers > 1 else 0
+    results, failed = {key: [] for key in crop_keys}, set()
+
+    def collect(key, result):
+        try:
+            results[key].append(result())
+        except Exception as e:
+            if key not in failed:
+                print(f"❌ {key} 試驗失敗：{e}")
+            failed.add(key)
+
+    if workers == 1:
+        for key, i, trial in tasks:
+            if key not in failed:
+                collect(key, lambda: run_trial(key, i, trial, num_threads))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(run_trial, key, i, trial, num_threads): key for key, i, trial in tasks}
+            for future in as_completed(futures):
+                collect(futures[future], future.result)
+
+    return {
+        key: pd.DataFrame(rows).sort_values("cv_rmse", ignore_index=True)
+        for key, rows in results.items() if rows and key not in failed
+    }
+
+def save_results(crop, trials_df):
+    """全部試驗寫成 CSV，最佳參數寫成 JSON（train_model.py 會套用）"""
+    output_dir = crop.tuned_params_file.parent
+    output_dir.mkdir(parents=True, exist_ok=True)
+    trials_df.to_csv(output_dir / f"tuning_{crop.key}.csv", index=False, encoding="utf-8-sig")
+
+    # 基準試驗只有部分參數，沒給的欄位為 NaN，不寫入
+    best = trials_df.iloc[0]
+    best_params = {}
+    for name in list(SEARCH_SPACE) + ["bagging_freq"]:
+        if name in best and pd.notna(best[name]):
+            is_int = name == "bagging_freq" or SEARCH_SPACE[name][0] == "int"
+            best_params[name] = int(best[name]) if is_int else float(best[name])
+    crop.tuned_params_file.write_text(json.dumps(best_params, ensure_ascii=False, indent=2), encoding="utf-8")
+    return best_params
+
+def main():
+    parser = argparse.ArgumentParser(description="LightGBM 超參數搜尋（產期 walk-forward 交叉驗證）")
+    parser.add_argument("--crop", nargs="*", default=["all"],
+                        help=f"要調參的作物，all 代表所有有合併資料的作物（{', '.join(CROPS)}）")
+    parser.add_argument("--trials", type=int, default=N_TRIALS, help=f"每個作物的試驗數，預設 {N_TRIALS}")
+    parser.add_argument("--workers", type=int, default=None, help="行程數，預設為 CPU 核心數")
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args()
+
+    crops = ([c for c in CROPS.values() if c.merge_dir.exists()]
+             if "all" in args.crop else [get_crop(key) for key in args.crop])
+
+    start = time.perf_counter()
+    tuned = tune_crops([c.key for c in crops], args.trials, args.workers, args.seed)
+
+    for crop in crops:
+        if crop.key not in tuned:
+            continue
+        trials_df = tuned[crop.key]
+        best_params = save_results(crop, trials_df)
+        baseline_rmse = trials_df.loc[trials_df["trial"] == 0, "cv_rmse"].iloc[0]
+        print(f"✅ {crop.key} CV RMSE {baseline_rmse:.4f} → {trials_df['cv_rmse'].iloc[0]:.4f}"
+              f"（{len(trials_df)} 組）→ {crop.tuned_params_file}")
+        print(f"   {best_params}")
+
+    print(f"\n🎉 調參完成 ({time.perf_counter() - start:.1f}s)，重新執行 train_model.py 即套用最佳參數")
+
+if __name__ == "__main__":
+    main()
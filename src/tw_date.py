@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+# ===============================
+# 民國 ↔ 西元（整欄向量化版本）
+# ===============================
+ROC_OFFSET = 1911
+
+# 少見格式（'107/1/1'、'99/12/31'、Excel 的 1071101.0）才走 regex
+_SLASH_PATTERN = r"^\s*(\d{2,3})/(\d{1,2})/(\d{1,2})\s*$"
+_COMPACT_PATTERN = r"^\s*(\d{2,3})(\d{2})(\d{2})(?:\.0+)?\s*$"
+
+_ZERO = ord("0")
+_SLASH = ord("/")
+
+
+def _digits_to_int(codes, start, stop):
+    """把字元碼矩陣中 [start, stop) 的數字欄位轉成整數"""
+    value = np.zeros(len(codes), dtype="int64")
+    for i in range(start, stop):
+        value = value * 10 + (codes[:, i].astype("int64") - _ZERO)
+    return value
+
+
+def _fixed_width_parts(text):
+    """'107/11/01' 與 1071101 這兩種固定寬度格式直接用字元碼運算拆年月日"""
+    n = len(text)
+    ymd = np.full((n, 3), np.nan)
+    width = text.dtype.itemsize // 4
+    if n == 0 or width < 7:
+        return ymd
+
+    codes = text.view(np.uint32).reshape(n, width)
+    length = (codes != 0).sum(axis=1)
+    is_digit = (codes >= _ZERO) & (codes <= _ZERO + 9)
+
+    # '107/11/01'
+    if width >= 9:
+        slash = (
+            (length == 9) & (codes[:, 3] == _SLASH) & (codes[:, 6] == _SLASH)
+            & is_digit[:, [0, 1, 2, 4, 5, 7, 8]].all(axis=1)
+        )
+        if slash.any():
+            c = codes[slash]
+            ymd[slash] = np.column_stack([
+                _digits_to_int(c, 0, 3), _digits_to_int(c, 4, 6), _digits_to_int(c, 7, 9)
+            ])
+
+    # 1071101
+    compact = (length == 7) & is_digit[:, :7].all(axis=1)
+    if compact.any():
+        c = codes[compact]
+        ymd[compact] = np.column_stack([
+            _digits_to_int(c, 0, 3), _digits_to_int(c, 3, 5), _digits_to_int(c, 5, 7)
+        ])
+
+    return ymd
+
+
+def parse_tw_dates(values):
+    """將整欄民國日期（'107/11/01' 或 1071101）轉為 datetime64[ns] 陣列，無法解析者為 NaT"""
+    s = pd.Series(values, copy=False)
+    text = np.asarray(s.astype(str), dtype=str)
+
+    # 1. 固定寬度格式走字元碼運算，其餘非空值再以 regex 補解析
+    ymd = _fixed_width_parts(text)
+    rest = np.isnan(ymd).any(axis=1) & s.notna().to_numpy()
+    if rest.any():
+        leftover = pd.Series(text[rest])
+        parts = leftover.str.extract(_SLASH_PATTERN)
+        parts = parts.fillna(leftover.str.extract(_COMPACT_PATTERN))
+        ymd[rest] = parts.astype(float).to_numpy()
+
+    out = np.full(len(s), np.datetime64("NaT"), dtype="datetime64[ns]")
+
+    y = ymd[:, 0] + ROC_OFFSET
+    m = ymd[:, 1]
+    d = ymd[:, 2]
+    valid = ~np.isnan(ymd).any(axis=1) & (m >= 1) & (m <= 12) & (d >= 1) & (d <= 31)
+    if not valid.any():
+        return out
+
+    # 2. 以 NumPy 月份 / 日期運算組出日期（不逐列建 Timestamp）
+    months = ((y[valid] - 1970) * 12 + (m[valid] - 1)).astype("int64").astype("datetime64[M]")
+    days = months.astype("datetime64[D]") + (d[valid].astype("int64") - 1)
+
+    # 3. 排除 2/30、11/31 這類溢位到下個月的日期
+    in_month = days.astype("datetime64[M]") == months
+    out[np.flatnonzero(valid)[in_month]] = days[in_month]
+    return out
+
+
+def format_tw_dates(values):
+    """將整欄西元日期轉回民國字串 '107/11/01'，NaT 轉為 NaN"""
+    dt = pd.DatetimeIndex(values)
+    missing = np.asarray(dt.isna())
+
+    y = np.where(missing, ROC_OFFSET, dt.year) - ROC_OFFSET
+    m = np.where(missing, 1, dt.month)
+    d = np.where(missing, 1, dt.day)
+
+    # 1071101 → 固定 7 字元 → 逐字元插入斜線（整欄一次完成）
+    codes = (y * 10000 + m * 100 + d).astype("int64")
+    digits = np.char.zfill(codes.astype("U7"), 7).view("U1").reshape(-1, 7)
+    slash = np.full((len(codes), 1), "/", dtype="U1")
+    chars = np.hstack([digits[:, :3], slash, digits[:, 3:5], slash, digits[:, 5:]])
+
+    out = np.ascontiguousarray(chars).view("U9").ravel().astype(object)
+    out[missing] = np.nan
+    return out
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 與執行腳本時相同：src/ 下的模組以平面方式互相 import
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
@@ -0,0 +1,62 @@
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+import pytest
+
+from export_model import CompiledModel, export_model, load_model
+
+# ===============================
+# CompiledModel 與 lgb.Booster 的預測必須一致（含 NaN 與類別欄）
+# ===============================
+def _frame(n, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "x1": rng.normal(size=n),
+        "x2": rng.uniform(0, 10, size=n),
+        "x3": rng.choice([0.0, 1.0, 2.0], size=n),
+        "cat": pd.Categorical(rng.choice(["a", "b", "c", "d"], size=n), categories=["a", "b", "c", "d"]),
+    })
+    y = df["x1"] * 3 + df["x2"] + df["cat"].cat.codes * 2.0 + rng.normal(scale=0.1, size=n)
+    # 訓練資料本身就帶缺值，樹裡才會出現 NaN 缺值方向的分裂
+    df.loc[df.sample(frac=0.1, random_state=seed).index, "x1"] = np.nan
+    df.loc[df.sample(frac=0.1, random_state=seed + 1).index, "x3"] = np.nan
+    return df, y
+
+@pytest.fixture(scope="module")
+def model_file(tmp_path_factory):
+    df, y = _frame(500, 0)
+    params = {"objective": "regression", "num_leaves": 15, "min_data_in_leaf": 5,
+              "min_data_per_group": 5, "cat_smooth": 1, "verbose": -1}
+    gbm = lgb.train(params, lgb.Dataset(df, y, categorical_feature=["cat"]), num_boost_round=30)
+    path = tmp_path_factory.mktemp("model") / "model.txt"
+    gbm.save_model(str(path))
+    return path
+
+@pytest.fixture(scope="module")
+def models(model_file):
+    return lgb.Booster(model_file=str(model_file)), CompiledModel(export_model(model_file))
+
+def test_matches_booster(models):
+    booster, compiled = models
+    df, _ = _frame(200, 1)
+    np.testing.assert_allclose(compiled.predict(df), booster.predict(df), rtol=1e-9, atol=1e-9)
+
+def test_nan_rows(models):
+    booster, compiled = models
+    df, _ = _frame(50, 2)
+    df[["x1", "x2", "x3"]] = np.nan
+    df.loc[df.index[::2], "cat"] = np.nan
+    np.testing.assert_allclose(compiled.predict(df), booster.predict(df), rtol=1e-9, atol=1e-9)
+
+def test_category_codes(models):
+    """類別依訓練時的類別表轉代碼；欄位類別順序不同或出現沒看過的類別時也要一致"""
+    booster, compiled = models
+    df, _ = _frame(100, 3)
+    df["cat"] = df["cat"].cat.set_categories(["d", "c", "b", "a", "e"])
+    df.loc[df.index[:10], "cat"] = "e"
+    np.testing.assert_allclose(compiled.predict(df), booster.predict(df), rtol=1e-9, atol=1e-9)
+
+def test_load_model_falls_back_when_stale(model_file, models):
+    assert isinstance(load_model(model_file), CompiledModel)
+    model_file.write_text(model_file.read_text() + "\n")
+    assert isinstance(load_model(model_file), lgb.Booster)
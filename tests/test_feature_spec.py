@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_spec import FeatureSpec, build_features, lag_spec, rolling_spec
+
+# ===============================
+# build_features 必須與 pandas 的 shift(lag).rolling(window) 逐欄相同
+# ===============================
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"a": rng.normal(size=40), "b": rng.uniform(size=40)},
+                      index=pd.RangeIndex(100, 140))
+    df.loc[[105, 120, 121], "a"] = np.nan
+    return df
+
+def _reference(df, spec):
+    shifted = df[spec.column].shift(spec.lag)
+    if spec.op == "lag":
+        return shifted
+    return getattr(shifted.rolling(spec.window), spec.op)()
+
+SPECS = [
+    lag_spec("a_lag1", "a", 1),
+    lag_spec("a_lag7", "a", 7),
+    lag_spec("b_lag0", "b", 0),
+    rolling_spec("a_mean3", "a", "mean", 3),
+    rolling_spec("a_max3", "a", "max", 3),
+    rolling_spec("b_min3", "b", "min", 3),
+    rolling_spec("b_sum7", "b", "sum", 7),
+    rolling_spec("a_mean5_lag2", "a", "mean", 5, lag=2),
+    rolling_spec("b_mean3_lag0", "b", "mean", 3, lag=0),
+]
+
+def test_matches_pandas(frame):
+    out = build_features(frame, SPECS)
+    assert list(out.columns) == [s.name for s in SPECS]
+    assert out.index.equals(frame.index)
+    for spec in SPECS:
+        pd.testing.assert_series_equal(out[spec.name], _reference(frame, spec), check_names=False)
+
+def test_short_frame(frame):
+    """列數少於視窗 / 位移時整欄為 NaN，不報錯"""
+    short = frame.head(3)
+    out = build_features(short, SPECS)
+    for spec in SPECS:
+        pd.testing.assert_series_equal(out[spec.name], _reference(short, spec), check_names=False)
+
+def test_invalid_specs():
+    with pytest.raises(ValueError):
+        FeatureSpec("x", "a", op="median")
+    with pytest.raises(ValueError):
+        FeatureSpec("x", "a", op="lag", window=3)
+    with pytest.raises(ValueError):
+        build_features(pd.DataFrame({"a": [1.0]}), [lag_spec("x", "a", 1), lag_spec("x", "a", 2)])
@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+from preprocessing_market import preprocess_market, stream_preprocess_market
+
+# ===============================
+# 分塊串流彙總必須與一次讀入整檔的 groupby().mean() 相同
+# ===============================
+HEADER = " 交易日期 ,市場, 產品 ,上價,中價,下價,平均價(元/公斤),交易量(公斤)"
+ROWS = [
+    "107/11/01,台北一,LK2 芥藍菜,30,25,20,25.5,1200",
+    "107/11/01,台北二,LK2 芥藍菜,28,22,18,23.0,800",
+    "107/11/01,台中市,FB1 青花菜,50,40,30,41.0,300",
+    "107/11/02,台北一,LK2 芥藍菜,-,24,19,24.1,1000",
+    "107/11/02,三重區,LK2 芥藍菜,31,26,21,-,500",
+    "107/11/03,台北一,LK2 芥藍菜,29,23,17,22.8,",
+    "107/11/02,台中市,LK2 芥藍菜,33,27,22,26.4,700",
+    "107/11/04,台中市,FB1 青花菜,55,45,35,44.0,200",
+    "107/11/03,台北二,LK2 芥藍菜,27,21,16,21.9,650",
+    "小計,,,,,,,",
+]
+
+@pytest.fixture
+def export_csv(tmp_path):
+    path = tmp_path / "export.csv"
+    path.write_text("\n".join([HEADER, *ROWS]) + "\n", encoding="utf-8-sig")
+    return path
+
+def _one_shot(path, products):
+    return preprocess_market(pd.read_csv(path, encoding="utf-8-sig"), products)
+
+@pytest.mark.parametrize("products", [(), ("LK2 芥藍菜",), ("FB1",)])
+@pytest.mark.parametrize("chunksize", [1, 3, 100])
+def test_stream_matches_one_shot(export_csv, products, chunksize):
+    expected = _one_shot(export_csv, products)
+    streamed = stream_preprocess_market(export_csv, products, chunksize=chunksize)
+    pd.testing.assert_frame_equal(streamed.reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_dtype=False)
+
+def test_stream_no_matching_rows(export_csv):
+    streamed = stream_preprocess_market(export_csv, ("XX9 不存在",), chunksize=2)
+    assert streamed.empty
+    assert "日期" in streamed.columns
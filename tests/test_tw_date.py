@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from tw_date import format_tw_dates, parse_tw_dates
+
+# ===============================
+# 民國日期解析：固定寬度快速路徑、regex 補解析與無效值
+# ===============================
+def _parsed(values):
+    return pd.DatetimeIndex(parse_tw_dates(values))
+
+def test_fixed_width_formats():
+    out = _parsed(["107/11/01", "1071101", 1071101, "1071101.0", "099/12/31"])
+    expected = pd.to_datetime(["2018-11-01"] * 4 + ["2010-12-31"])
+    assert out.equals(expected)
+
+def test_irregular_formats():
+    out = _parsed(["107/1/1", "99/12/31", " 107/11/01 ", "991231", "  1120305  "])
+    expected = pd.to_datetime(["2018-01-01", "2010-12-31", "2018-11-01", "2010-12-31", "2023-03-05"])
+    assert out.equals(expected)
+
+def test_invalid_values_are_nat():
+    values = ["107/02/30", "107/11/31", "107/13/01", "107/00/10", "107/01/00",
+              "", "abc", "2018-11-01", None, np.nan, "107/11"]
+    assert _parsed(values).isna().all()
+
+def test_leap_day():
+    out = _parsed(["109/02/29", "108/02/29"])
+    assert out[0] == pd.Timestamp("2020-02-29")
+    assert pd.isna(out[1])
+
+def test_mixed_column_keeps_order():
+    values = pd.Series(["107/11/01", None, "107/1/2", 1071103, "bad"], index=[10, 3, 7, 1, 5])
+    out = _parsed(values)
+    expected = pd.DatetimeIndex(["2018-11-01", "NaT", "2018-01-02", "2018-11-03", "NaT"])
+    assert out.equals(expected)
+
+def test_empty():
+    assert len(parse_tw_dates([])) == 0
+
+def test_round_trip():
+    dates = pd.date_range("1999-12-25", "2025-03-05", freq="37D")
+    text = format_tw_dates(dates)
+    assert text[0] == "088/12/25"
+    assert pd.DatetimeIndex(parse_tw_dates(text)).equals(pd.DatetimeIndex(dates.values))
+
+def test_format_nat():
+    out = format_tw_dates(pd.to_datetime(["2018-11-01", None]))
+    assert out[0] == "107/11/01"
+    assert pd.isna(out[1])